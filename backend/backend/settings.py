@@ -193,4 +193,93 @@ MEDIA_URL = f"https://{AWS_S3_CUSTOM_DOMAIN}/"
 
 INTERNAL_API_KEY = os.environ.get('INTERNAL_API_SECRET_KEY', 'raheemah-is-the-best')
 
+# Rows per insert batch (COPY or bulk_create) for metric ingestion.
+METRIC_INGEST_BATCH_SIZE = int(os.getenv('METRIC_INGEST_BATCH_SIZE', 5000))
+
+# Raw-data lake read by the sales series refresh (services.sales_series).
+# DATA_LAKE_STORE=local serves DATA_LAKE_LOCAL_ROOT instead of S3.
+DATA_LAKE_STORE = os.getenv('DATA_LAKE_STORE', 's3')
+DATA_LAKE_BUCKET = os.getenv('DATA_LAKE_BUCKET', 'bizpulse-data-lake')
+DATA_LAKE_PREFIX = os.getenv('DATA_LAKE_PREFIX', 'raw-data/')
+DATA_LAKE_LOCAL_ROOT = os.getenv('DATA_LAKE_LOCAL_ROOT', str(BASE_DIR / 'data-lake'))
+
+# Background task queue (core.queue, run with `manage.py run_task_worker`)
+TASK_WORKER_CONCURRENCY = int(os.getenv('TASK_WORKER_CONCURRENCY', 4))
+TASK_POLL_INTERVAL_SECONDS = float(os.getenv('TASK_POLL_INTERVAL_SECONDS', 2))
+# Must exceed the longest handler step between core.queue.heartbeat() calls.
+TASK_LEASE_SECONDS = int(os.getenv('TASK_LEASE_SECONDS', 300))
+TASK_MAX_ATTEMPTS = int(os.getenv('TASK_MAX_ATTEMPTS', 5))
+TASK_RETRY_BACKOFF_SECONDS = int(os.getenv('TASK_RETRY_BACKOFF_SECONDS', 10))
+TASK_RETRY_BACKOFF_MAX_SECONDS = int(os.getenv('TASK_RETRY_BACKOFF_MAX_SECONDS', 600))
+GLUE_POLL_INTERVAL_SECONDS = int(os.getenv('GLUE_POLL_INTERVAL_SECONDS', 5))
+
+# Bounds on the metric digest sent to Bedrock by start_bedrock_analysis
+# (services.digest): metrics described, dimensions listed per metric, prompt size.
+ANALYSIS_DIGEST_MAX_METRICS = int(os.getenv('ANALYSIS_DIGEST_MAX_METRICS', 25))
+ANALYSIS_DIGEST_MAX_DIMENSIONS = int(os.getenv('ANALYSIS_DIGEST_MAX_DIMENSIONS', 3))
+ANALYSIS_PROMPT_MAX_CHARS = int(os.getenv('ANALYSIS_PROMPT_MAX_CHARS', 6000))
+
+# Batch Bedrock analysis (services.batch_analysis): worker threads, the
+# account's Bedrock quotas, and retries of throttled calls (backoff doubles).
+BATCH_ANALYSIS_WORKERS = int(os.getenv('BATCH_ANALYSIS_WORKERS', 8))
+BEDROCK_REQUESTS_PER_MINUTE = int(os.getenv('BEDROCK_REQUESTS_PER_MINUTE', 100))
+BEDROCK_TOKENS_PER_MINUTE = int(os.getenv('BEDROCK_TOKENS_PER_MINUTE', 200000))
+BEDROCK_THROTTLE_RETRIES = int(os.getenv('BEDROCK_THROTTLE_RETRIES', 5))
+BEDROCK_THROTTLE_BACKOFF_SECONDS = float(os.getenv('BEDROCK_THROTTLE_BACKOFF_SECONDS', 1))
+
+# Precomputed Amazon Q dashboard answers (services.precompute): older than
+# PRECOMPUTE_FRESH_SECONDS they are served as stale while a refresh runs.
+PRECOMPUTE_FRESH_SECONDS = int(os.getenv('PRECOMPUTE_FRESH_SECONDS', 6 * 3600))
+PRECOMPUTE_REFRESH_LOCK_SECONDS = int(os.getenv('PRECOMPUTE_REFRESH_LOCK_SECONDS', 300))
+# Delay before refreshing them after an upload starts an Amazon Q data-source sync.
+AMAZON_Q_SYNC_SETTLE_SECONDS = int(os.getenv('AMAZON_Q_SYNC_SETTLE_SECONDS', 600))
+
+# Question cache for NaturalLanguageQueryView (services.question_cache): answers
+# are reused for questions at least QUESTION_CACHE_SIMILARITY similar (MinHash
+# Jaccard estimate), for up to QUESTION_CACHE_TTL_SECONDS or until new data lands.
+QUESTION_CACHE_SIMILARITY = float(os.getenv('QUESTION_CACHE_SIMILARITY', 0.8))
+QUESTION_CACHE_TTL_SECONDS = int(os.getenv('QUESTION_CACHE_TTL_SECONDS', 24 * 3600))
+QUESTION_CACHE_MAX_ENTRIES = int(os.getenv('QUESTION_CACHE_MAX_ENTRIES', 500))
+
+# LLM response cache (core.llm_cache): repeated Bedrock requests are answered
+# from the database for LLM_CACHE_TTL_SECONDS; least recently used entries
+# beyond LLM_CACHE_MAX_ENTRIES are evicted.
+LLM_CACHE_ENABLED = os.getenv('LLM_CACHE_ENABLED', 'true').lower() == 'true'
+LLM_CACHE_TTL_SECONDS = int(os.getenv('LLM_CACHE_TTL_SECONDS', 7 * 24 * 3600))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv('LLM_CACHE_MAX_ENTRIES', 10000))
+
+# Shared boto3 clients (core.aws_clients): connection pool size per client,
+# socket timeouts and retry attempts (standard retry mode).
+AWS_MAX_POOL_CONNECTIONS = int(os.getenv('AWS_MAX_POOL_CONNECTIONS', 25))
+AWS_CONNECT_TIMEOUT_SECONDS = float(os.getenv('AWS_CONNECT_TIMEOUT_SECONDS', 5))
+AWS_READ_TIMEOUT_SECONDS = float(os.getenv('AWS_READ_TIMEOUT_SECONDS', 60))
+AWS_MAX_ATTEMPTS = int(os.getenv('AWS_MAX_ATTEMPTS', 3))
+
+# Cache for cross-request counters such as alert rate limits. Point
+# CACHE_BACKEND/CACHE_LOCATION at a shared cache when running several processes.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'bizpulse'),
+    }
+}
+
+# Alert delivery (services.alert_dispatch). ALERT_TRANSPORT=file appends to
+# ALERT_FILE_PATH instead of publishing through SNS.
+ALERT_TRANSPORT = os.getenv('ALERT_TRANSPORT', 'file')
+ALERT_FILE_PATH = os.getenv('ALERT_FILE_PATH', str(BASE_DIR / 'alerts.log'))
+ALERT_SNS_TOPIC_ARN = os.getenv('ALERT_SNS_TOPIC_ARN')
+ALERT_DISPATCH_BATCH_SIZE = int(os.getenv('ALERT_DISPATCH_BATCH_SIZE', 500))
+ALERT_LEASE_SECONDS = int(os.getenv('ALERT_LEASE_SECONDS', 300))
+ALERT_MAX_ATTEMPTS = int(os.getenv('ALERT_MAX_ATTEMPTS', 5))
+ALERT_RETRY_BACKOFF_SECONDS = int(os.getenv('ALERT_RETRY_BACKOFF_SECONDS', 30))
+ALERT_RETRY_BACKOFF_MAX_SECONDS = int(os.getenv('ALERT_RETRY_BACKOFF_MAX_SECONDS', 3600))
+ALERT_DEFAULT_RECIPIENT = os.getenv('ALERT_DEFAULT_RECIPIENT', 'admin@bizpulse.co')
+# Repeats of an open alert (same data source, metric and severity band) seen
+# within this many seconds of its last occurrence are folded into it.
+ALERT_COALESCE_WINDOW_SECONDS = int(os.getenv('ALERT_COALESCE_WINDOW_SECONDS', 3600))
+# At most ALERT_RATE_LIMIT messages per recipient and channel per window.
+ALERT_RATE_LIMIT = int(os.getenv('ALERT_RATE_LIMIT', 10))
+ALERT_RATE_LIMIT_WINDOW_SECONDS = int(os.getenv('ALERT_RATE_LIMIT_WINDOW_SECONDS', 3600))
+
 CORS_ALLOW_ALL_ORIGINS = True
\ No newline at end of file
@@ -0,0 +1,144 @@
+import os
+import sys
+import time
+import argparse
+import django
+from datetime import datetime, timedelta, timezone
+
+# Setup Django
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+django.setup()
+
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from core.models import DataSource
+from services.models import Metric
+from services.serializers import MetricCreateSerializer
+from services.ingest import write_metrics
+from services.validation import validate_metric_records
+
+
+def get_data_source():
+    # Same placeholder source load_data.py uses
+    User = get_user_model()
+    user, _ = User.objects.get_or_create(username='admin', defaults={'email': 'admin@example.com'})
+    data_source, _ = DataSource.objects.get_or_create(
+        id=1,
+        defaults={'name': 'Business Data Source', 'owner': user, 'source_type': 'CUSTOM'}
+    )
+    return data_source
+
+
+def make_payload(rows, data_source_id):
+    """Build a bulk-create style metrics payload of `rows` items."""
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    products = ['Product Alpha', 'Product Bravo', 'Product Charlie', 'Product Delta']
+    return [
+        {
+            'data_source_id': data_source_id,
+            'name': 'Daily_Sales' if i % 3 else 'Conversion_Rate',
+            'value': str(1000 + (i % 997) * 1.25),
+            'timestamp': (start + timedelta(minutes=i)).isoformat(),
+            'product': products[i % len(products)],
+        }
+        for i in range(rows)
+    ]
+
+
+def report(label, rows, seconds):
+    print(f"  {label:<12} {rows:>9,} rows  {seconds:8.2f}s  {rows / seconds:>12,.0f} rows/sec")
+    sys.stdout.flush()
+
+
+def bench_validation(args):
+    """Columnar validator vs MetricCreateSerializer(many=True)."""
+    data_source = get_data_source()
+    print("Metric validation: services.validation vs MetricCreateSerializer")
+    for rows in args.sizes:
+        payload = make_payload(rows, data_source.id)
+
+        started = time.perf_counter()
+        batch = validate_metric_records(payload)
+        report('columnar', rows, time.perf_counter() - started)
+        assert batch.is_valid, batch.errors
+
+        if rows > args.serializer_limit:
+            print(f"  {'serializer':<12} {rows:>9,} rows  skipped (above --serializer-limit)")
+            continue
+        started = time.perf_counter()
+        serializer = MetricCreateSerializer(data=payload, many=True)
+        assert serializer.is_valid(), serializer.errors
+        report('serializer', rows, time.perf_counter() - started)
+
+
+def bench_write(args):
+    """COPY vs batched bulk_create for Metric inserts. Every run is rolled back."""
+    data_source = get_data_source()
+    methods = ['bulk_create'] + (['copy'] if connection.vendor == 'postgresql' else [])
+    print(f"Metric inserts on {connection.vendor}: {', '.join(methods)}")
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    for rows in args.sizes:
+        for method in methods:
+            metrics = (
+                Metric(
+                    data_source_id=data_source.id,
+                    name='Daily_Sales',
+                    value=1000 + (i % 997) * 1.25,
+                    timestamp=start + timedelta(minutes=i),
+                    metadata={'product': f'Product {i % 4}'},
+                )
+                for i in range(rows)
+            )
+            with transaction.atomic():
+                started = time.perf_counter()
+                write_metrics(metrics, method=method)
+                report(method, rows, time.perf_counter() - started)
+                transaction.set_rollback(True)
+
+
+def bench_aws_clients(args):
+    """Per-request client cost: boto3.client() each time vs the shared core.aws_clients registry."""
+    import boto3
+    from core.aws_clients import get_client, reset_clients
+
+    print("AWS client per request: boto3.client() vs core.aws_clients.get_client()")
+    for service in ('s3', 'bedrock-runtime', 'qbusiness'):
+        started = time.perf_counter()
+        for _ in range(args.iterations):
+            boto3.client(service, region_name='us-east-1')
+        report_ms(service, 'boto3.client', args.iterations, time.perf_counter() - started)
+
+        reset_clients()
+        started = time.perf_counter()
+        get_client(service, 'us-east-1')   # built once per process
+        report_ms(service, 'registry 1st', 1, time.perf_counter() - started)
+        started = time.perf_counter()
+        for _ in range(args.iterations):
+            get_client(service, 'us-east-1')
+        report_ms(service, 'registry', args.iterations, time.perf_counter() - started)
+
+
+def report_ms(service, label, requests, seconds):
+    print(f"  {service:<16} {label:<13} {requests:>6,} requests  {seconds / requests * 1000:9.4f} ms/request")
+    sys.stdout.flush()
+
+
+BENCHMARKS = {
+    'validation': bench_validation,
+    'write': bench_write,
+    'aws-clients': bench_aws_clients,
+}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="BizPulse benchmarks")
+    parser.add_argument('benchmark', choices=sorted(BENCHMARKS))
+    parser.add_argument('--sizes', default='10000,100000,1000000',
+                        type=lambda value: [int(size) for size in value.split(',')],
+                        help="Comma separated row counts")
+    parser.add_argument('--serializer-limit', type=int, default=1000000,
+                        help="Skip the DRF serializer path above this many rows")
+    parser.add_argument('--iterations', type=int, default=200,
+                        help="Simulated requests per AWS client benchmark")
+    args = parser.parse_args()
+    BENCHMARKS[args.benchmark](args)
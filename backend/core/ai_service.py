@@ -1,6 +1,92 @@
+import json
+import os
 import random
 import datetime
 
+from . import llm_cache
+from .aws_clients import get_client, overridden
+from .bedrock_stream import STREAM_SERVICE, AsyncBedrockStream
+
+REGION = os.environ.get('AWS_REGION_NAME', 'us-east-1')
+CLAUDE_MODEL_ID = 'anthropic.claude-3-haiku-20240307-v1:0'
+
+
+def get_bedrock_client():
+    return get_client('bedrock-runtime', REGION)
+
+
+def get_stream_client():
+    """Async Bedrock streaming client (core.bedrock_stream), or its override_client() stand-in."""
+    return overridden(STREAM_SERVICE) or AsyncBedrockStream(REGION)
+
+
+# --- Bedrock (Claude Messages API) ---
+
+def parse_json_response(text):
+    """Parse a model reply that should be a JSON object, tolerating a ```json fence."""
+    text = text.strip()
+    if text.startswith("```"):
+        text = text.replace("```json", "").replace("```", "").strip()
+    return json.loads(text)
+
+
+def claude_body(prompt, temperature, max_tokens):
+    return json.dumps({
+        "anthropic_version": "bedrock-2023-05-31",
+        "messages": [{"role": "user", "content": [{"type": "text", "text": prompt}]}],
+        "max_tokens": max_tokens,
+        "temperature": temperature,
+    })
+
+
+def call_claude(client, prompt, model_id=CLAUDE_MODEL_ID, temperature=0.5, max_tokens=1024):
+    """One uncached invoke_model round trip; returns the reply text. No database access."""
+    body = claude_body(prompt, temperature, max_tokens)
+    response = client.invoke_model(modelId=model_id, contentType='application/json', accept='application/json', body=body)
+    response_json = json.loads(response.get('body').read().decode('utf-8'))
+    # The first text block of the Messages API content array
+    return response_json.get('content', [{}])[0].get('text', '').strip()
+
+
+def invoke_claude(prompt, model_id=CLAUDE_MODEL_ID, temperature=0.5, max_tokens=1024, client=None, parse=None):
+    """
+    Send `prompt` to Claude on Bedrock and return the reply text, or
+    parse(text) when `parse` is given. Replies are served from core.llm_cache
+    when the same request was answered before; a reply is only cached once
+    `parse` accepts it, and a cached reply `parse` rejects is dropped.
+    """
+    cached = llm_cache.get(model_id, prompt, temperature, max_tokens)
+    if cached is not None:
+        try:
+            return parse(cached) if parse else cached
+        except ValueError:
+            llm_cache.forget(model_id, prompt, temperature, max_tokens)
+
+    text = call_claude(client or get_bedrock_client(), prompt, model_id, temperature, max_tokens)
+    result = parse(text) if parse else text
+    llm_cache.put(model_id, prompt, temperature, max_tokens, text)
+    return result
+
+
+async def stream_claude(prompt, model_id=CLAUDE_MODEL_ID, temperature=0.5, max_tokens=1024, client=None):
+    """
+    Async generator of Claude's reply text, piece by piece as Bedrock
+    generates it (invoke_model_with_response_stream). Uncached; runs on the
+    event loop with no database access.
+    """
+    client = client or get_stream_client()
+    response = await client.invoke_model_with_response_stream(
+        modelId=model_id, contentType='application/json', accept='application/json',
+        body=claude_body(prompt, temperature, max_tokens),
+    )
+    async for event in response['body']:
+        if 'chunk' not in event:
+            continue
+        chunk = json.loads(event['chunk']['bytes'])
+        if chunk.get('type') == 'content_block_delta' and chunk['delta'].get('type') == 'text_delta':
+            yield chunk['delta']['text']
+
+
 # --- LLM PLACEHOLDER FUNCTION ---
 def generate_narrative_insight(metric_data_list):
     """
@@ -28,20 +114,3 @@ def generate_narrative_insight(metric_data_list):
         }
         
     return text, recommendations
-
-
-# --- ALERTING FUNCTION (SNS PLACEHOLDER) ---
-def trigger_sns_alert(alert_instance):
-    """
-    Simulates sending an alert via AWS SNS or a notification service.
-    
-    In production, this would use boto3.client('sns').publish(...)
-    """
-    if alert_instance.type == 'EMAIL':
-        print(f"--- FAKE SNS: Sending EMAIL Alert to {alert_instance.recipient} ---")
-        print(f"ALERT: {alert_instance.insight.title} (Severity: {alert_instance.insight.recommendations.get('severity')})")
-        # Set sent to True in the production flow after a successful API call
-        alert_instance.sent = True
-        alert_instance.save()
-        return True
-    return False
\ No newline at end of file
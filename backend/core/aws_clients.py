@@ -0,0 +1,125 @@
+# core/aws_clients.py
+"""
+Process-wide registry of boto3 clients.
+
+boto3.client() loads service models and builds a fresh connection pool on
+every call, tens of milliseconds each, so constructing one per request threw
+away both the time and the pooled connections. get_client() builds each
+(service, region) client once, lazily, and hands the same instance to every
+caller afterwards. boto3 clients are thread-safe; creating them is not, so
+construction happens under a lock on a registry-owned Session.
+
+Every client shares one botocore Config: AWS_MAX_POOL_CONNECTIONS pooled
+connections, AWS_CONNECT_TIMEOUT_SECONDS / AWS_READ_TIMEOUT_SECONDS and
+AWS_MAX_ATTEMPTS retries in standard mode.
+
+Sockets must not be shared across a fork, so a child process (pre-fork
+gunicorn workers, the task worker) starts with an empty registry and a
+fresh lock.
+
+get_session() exposes the registry's Session, for callers that sign their
+own requests (core.bedrock_stream).
+
+Tests swap in stand-ins with override_client():
+
+    with override_client('bedrock-runtime', StubBedrock()):
+        start_bedrock_analysis(job.id)
+"""
+import os
+import threading
+from contextlib import contextmanager
+
+import boto3
+from botocore.config import Config
+from django.conf import settings
+
+_lock = threading.Lock()
+_clients = {}
+_overrides = {}
+_session = None
+_pid = os.getpid()
+
+
+def _reset():
+    global _session, _pid
+    _clients.clear()
+    _session = None
+    _pid = os.getpid()
+
+
+def _after_fork():
+    # Another thread may have held the lock at fork time; the child would never see it released.
+    global _lock
+    _lock = threading.Lock()
+    _reset()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
+
+
+def client_config():
+    return Config(
+        max_pool_connections=settings.AWS_MAX_POOL_CONNECTIONS,
+        connect_timeout=settings.AWS_CONNECT_TIMEOUT_SECONDS,
+        read_timeout=settings.AWS_READ_TIMEOUT_SECONDS,
+        retries={'max_attempts': settings.AWS_MAX_ATTEMPTS, 'mode': 'standard'},
+    )
+
+
+def _locked_session():
+    global _session
+    if _pid != os.getpid():   # forked without register_at_fork
+        _reset()
+    if _session is None:
+        _session = boto3.session.Session()
+    return _session
+
+
+def get_session():
+    """The registry's boto3 Session (shared credential resolution)."""
+    with _lock:
+        return _locked_session()
+
+
+def get_client(service, region=None):
+    """The shared boto3 client for `service` in `region` (the default region when None)."""
+    key = (service, region)
+    override = _overrides.get(service)
+    if override is not None:
+        return override
+    client = _clients.get(key)
+    if client is not None and _pid == os.getpid():
+        return client
+    with _lock:
+        session = _locked_session()
+        client = _clients.get(key)
+        if client is None:
+            client = session.client(service, region_name=region, config=client_config())
+            _clients[key] = client
+        return client
+
+
+def overridden(service):
+    """The override_client() stand-in for `service`, or None."""
+    return _overrides.get(service)
+
+
+def reset_clients():
+    """Drop every cached client, e.g. after changing credentials or settings."""
+    with _lock:
+        _reset()
+
+
+@contextmanager
+def override_client(service, client):
+    """Serve `client` for `service` (any region) inside the block."""
+    previous = _overrides.get(service)
+    _overrides[service] = client
+    try:
+        yield client
+    finally:
+        if previous is None:
+            _overrides.pop(service, None)
+        else:
+            _overrides[service] = previous
@@ -0,0 +1,125 @@
+# core/aws_fakes.py
+"""
+Local stand-ins for AWS clients, for tests, benchmarks and offline runs.
+
+FakeBedrock answers bedrock-runtime invoke_model with a canned Claude
+Messages reply after `latency` seconds. It throttles like the real service:
+past `max_in_flight` concurrent calls, or more than `requests_per_minute`
+calls in a rolling minute, it raises the same ThrottlingException ClientError
+boto3 would. It records peak concurrency and call counts for assertions.
+
+    with override_client('bedrock-runtime', FakeBedrock(latency=0.05)):
+        run_batch_analysis(job_ids)
+
+FakeBedrockStream is the async streaming counterpart (core.bedrock_stream):
+it streams the reply as Claude content_block_delta events, the first after
+`first_token_latency` seconds and each later one `chunk_latency` after the
+previous, waiting with asyncio.sleep so many streams share one event loop.
+"""
+import asyncio
+import io
+import json
+import threading
+import time
+from collections import deque
+
+from botocore.exceptions import ClientError
+
+DEFAULT_REPLY = json.dumps({
+    "title": "Stable performance",
+    "summary": "Metrics held within their usual range. No anomalies stand out.",
+    "recommendation": "Keep monitoring the leading metrics.",
+})
+
+
+def throttling_error(operation='InvokeModel'):
+    return ClientError({'Error': {'Code': 'ThrottlingException', 'Message': 'Too many requests, please wait.'}}, operation)
+
+
+class FakeBedrock:
+    def __init__(self, reply=DEFAULT_REPLY, latency=0.0, max_in_flight=None, requests_per_minute=None,
+                 clock=time.monotonic, sleep=time.sleep):
+        self.reply = reply   # text, or callable(prompt) -> text
+        self.latency = latency
+        self.max_in_flight = max_in_flight
+        self.requests_per_minute = requests_per_minute
+        self.clock = clock
+        self.sleep = sleep
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.calls = 0
+        self.throttled = 0
+        self.recent = deque()
+
+    def _admit(self):
+        with self.lock:
+            now = self.clock()
+            while self.recent and self.recent[0] <= now - 60:
+                self.recent.popleft()
+            if (self.max_in_flight is not None and self.in_flight >= self.max_in_flight) or (
+                    self.requests_per_minute is not None and len(self.recent) >= self.requests_per_minute):
+                self.throttled += 1
+                raise throttling_error()
+            self.recent.append(now)
+            self.in_flight += 1
+            self.calls += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def invoke_model(self, modelId, body, contentType='application/json', accept='application/json'):
+        self._admit()
+        try:
+            if self.latency:
+                self.sleep(self.latency)
+            prompt = json.loads(body)['messages'][0]['content'][0]['text']
+            text = self.reply(prompt) if callable(self.reply) else self.reply
+            payload = {
+                'content': [{'type': 'text', 'text': text}],
+                'usage': {'input_tokens': len(prompt) // 4, 'output_tokens': len(text) // 4},
+            }
+            return {'body': io.BytesIO(json.dumps(payload).encode()), 'contentType': 'application/json'}
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+
+class FakeBedrockStream:
+    def __init__(self, reply=DEFAULT_REPLY, first_token_latency=0.0, chunk_latency=0.0, chunk_chars=16, error=None):
+        self.reply = reply   # text, or callable(prompt) -> text
+        self.first_token_latency = first_token_latency
+        self.chunk_latency = chunk_latency
+        self.chunk_chars = chunk_chars
+        self.error = error   # raised mid-stream, after the first chunk
+        self.calls = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.prompts = []
+
+    @staticmethod
+    def _event(payload):
+        return {'chunk': {'bytes': json.dumps(payload).encode()}}
+
+    async def _events(self, text):
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            yield self._event({'type': 'message_start', 'message': {'role': 'assistant', 'content': []}})
+            for i, start in enumerate(range(0, len(text), self.chunk_chars)):
+                await asyncio.sleep(self.first_token_latency if i == 0 else self.chunk_latency)
+                if i == 1 and self.error is not None:
+                    raise self.error
+                yield self._event({
+                    'type': 'content_block_delta', 'index': 0,
+                    'delta': {'type': 'text_delta', 'text': text[start:start + self.chunk_chars]},
+                })
+            yield self._event({'type': 'message_stop'})
+        finally:
+            self.in_flight -= 1
+
+    async def invoke_model_with_response_stream(self, modelId, body, contentType='application/json',
+                                                accept='application/json'):
+        prompt = json.loads(body)['messages'][0]['content'][0]['text']
+        self.calls += 1
+        self.prompts.append(prompt)
+        text = self.reply(prompt) if callable(self.reply) else self.reply
+        return {'body': self._events(text), 'contentType': 'application/vnd.amazon.eventstream'}
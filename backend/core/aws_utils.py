@@ -1,20 +1,29 @@
 # core/aws_utils.py
-import boto3
-import time
+from .aws_clients import get_client
+from .queue import enqueue
+
+TERMINAL_GLUE_STATES = ['SUCCEEDED', 'FAILED', 'STOPPED', 'TIMEOUT', 'ERROR']
+
 
 def trigger_glue_job(job_name, payload=None):
-    glue = boto3.client('glue')
+    """
+    Start a Glue job run and return its run id.
+
+    Status polling happens off the request path: a core.poll_glue_job task
+    checks the run every GLUE_POLL_INTERVAL_SECONDS until it reaches a
+    terminal state and stores that state as the task result.
+    """
+    glue = get_client('glue')
     response = glue.start_job_run(
         JobName=job_name,
         Arguments=payload or {}
     )
     job_run_id = response['JobRunId']
+    enqueue('core.poll_glue_job', job_name=job_name, run_id=job_run_id)
+    return job_run_id
+
 
-    # Poll until completion
-    while True:
-        job = glue.get_job_run(JobName=job_name, RunId=job_run_id)
-        status = job['JobRun']['JobRunState']
-        print("Glue job status:", status)
-        if status in ['SUCCEEDED', 'FAILED', 'STOPPED']:
-            return status
-        time.sleep(5)
+def get_glue_job_status(job_name, run_id):
+    glue = get_client('glue')
+    job = glue.get_job_run(JobName=job_name, RunId=run_id)
+    return job['JobRun']['JobRunState']
@@ -0,0 +1,150 @@
+# core/bedrock_stream.py
+"""
+Bedrock invoke_model_with_response_stream on asyncio.
+
+boto3 reads response streams with blocking sockets, so an async view that
+iterated one would pin a thread for the whole generation. AsyncBedrockStream
+makes the same call without one:
+
+* the request is signed with botocore's SigV4 signer and the registry
+  session's credentials (core.aws_clients.get_session);
+* it is sent over an asyncio (TLS) connection, one per stream;
+* the chunked application/vnd.amazon.eventstream body is decoded with
+  botocore's EventStreamBuffer as bytes arrive.
+
+It returns boto3's response shape, {'body': async iterator of
+{'chunk': {'bytes': ...}} events}, and raises the same ClientError codes,
+so core.aws_fakes.FakeBedrockStream stands in for it in tests:
+
+    with override_client(STREAM_SERVICE, FakeBedrockStream(first_token_latency=0.2)):
+        ...
+"""
+import asyncio
+import base64
+import json
+import ssl
+from urllib.parse import quote, urlsplit
+
+from botocore.auth import SigV4Auth
+from botocore.awsrequest import AWSRequest
+from botocore.eventstream import EventStreamBuffer
+from botocore.exceptions import ClientError, NoCredentialsError
+from django.conf import settings
+
+from .aws_clients import get_session
+
+STREAM_SERVICE = 'bedrock-runtime-stream'   # override_client() key
+OPERATION = 'InvokeModelWithResponseStream'
+READ_SIZE = 64 * 1024
+
+
+def _client_error(code, message, status=None):
+    return ClientError(
+        {'Error': {'Code': code, 'Message': message}, 'ResponseMetadata': {'HTTPStatusCode': status}}, OPERATION,
+    )
+
+
+def _event(message):
+    """One decoded event-stream message as a boto3 event dict; exceptions are raised."""
+    headers = message.headers
+    kind = headers.get(':message-type')
+    if kind == 'event':
+        payload = json.loads(message.payload or b'{}')
+        if headers.get(':event-type') == 'chunk':
+            return {'chunk': {'bytes': base64.b64decode(payload.get('bytes', ''))}}
+        return {headers.get(':event-type'): payload}
+    if kind == 'exception':
+        payload = json.loads(message.payload or b'{}')
+        raise _client_error(headers.get(':exception-type'), payload.get('message', ''))
+    raise _client_error(headers.get(':error-code'), headers.get(':error-message', ''))
+
+
+class AsyncBedrockStream:
+    def __init__(self, region, endpoint_url=None, credentials=None):
+        self.region = region
+        self.endpoint = urlsplit(endpoint_url or f"https://bedrock-runtime.{region}.amazonaws.com")
+        self.credentials = credentials
+
+    def _signed_headers(self, path, body, content_type, accept):
+        credentials = self.credentials or get_session().get_credentials()
+        if credentials is None:
+            raise NoCredentialsError()
+        request = AWSRequest(
+            method='POST', url=f"{self.endpoint.scheme}://{self.endpoint.netloc}{path}", data=body,
+            headers={'Content-Type': content_type, 'X-Amzn-Bedrock-Accept': accept},
+        )
+        SigV4Auth(credentials.get_frozen_credentials(), 'bedrock', self.region).add_auth(request)
+        return dict(request.headers.items())
+
+    async def _read(self, awaitable):
+        return await asyncio.wait_for(awaitable, settings.AWS_READ_TIMEOUT_SECONDS)
+
+    async def _body(self, reader, headers):
+        """Raw body bytes as they arrive: chunked, sized, or until the server closes."""
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            while True:
+                size = int((await self._read(reader.readline())).split(b';')[0].strip() or b'0', 16)
+                if size == 0:
+                    return
+                yield (await self._read(reader.readexactly(size + 2)))[:-2]
+        elif 'content-length' in headers:
+            remaining = int(headers['content-length'])
+            while remaining > 0:
+                data = await self._read(reader.read(min(READ_SIZE, remaining)))
+                if not data:
+                    raise _client_error('IncompleteRead', 'Connection closed mid-response')
+                remaining -= len(data)
+                yield data
+        else:
+            while data := await self._read(reader.read(READ_SIZE)):
+                yield data
+
+    async def _events(self, reader, writer, headers):
+        buffer = EventStreamBuffer()
+        try:
+            async for data in self._body(reader, headers):
+                buffer.add_data(data)
+                for message in buffer:
+                    yield _event(message)
+        finally:
+            writer.close()
+
+    async def invoke_model_with_response_stream(self, modelId, body, contentType='application/json',
+                                                accept='application/json'):
+        body = body.encode() if isinstance(body, str) else body
+        path = f"/model/{quote(modelId, safe='')}/invoke-with-response-stream"
+        signed = self._signed_headers(path, body, contentType, accept)
+
+        secure = self.endpoint.scheme == 'https'
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(
+                self.endpoint.hostname, self.endpoint.port or (443 if secure else 80),
+                ssl=ssl.create_default_context() if secure else None,
+            ),
+            settings.AWS_CONNECT_TIMEOUT_SECONDS,
+        )
+        try:
+            head = [f"POST {path} HTTP/1.1", f"Host: {self.endpoint.netloc}", f"Content-Length: {len(body)}",
+                    "Connection: close"] + [f"{name}: {value}" for name, value in signed.items()]
+            writer.write(("\r\n".join(head) + "\r\n\r\n").encode() + body)
+            await writer.drain()
+
+            lines = (await self._read(reader.readuntil(b"\r\n\r\n"))).decode('latin-1').split("\r\n")
+            status = int(lines[0].split()[1])
+            headers = {}
+            for line in lines[1:]:
+                if ':' in line:
+                    name, value = line.split(':', 1)
+                    headers[name.strip().lower()] = value.strip()
+            if status != 200:
+                payload = b''.join([data async for data in self._body(reader, headers)])
+                try:
+                    message = json.loads(payload).get('message', '')
+                except ValueError:
+                    message = payload.decode('utf-8', 'replace')
+                code = headers.get('x-amzn-errortype', f'HTTP{status}').split(':')[0]
+                raise _client_error(code, message, status)
+        except BaseException:
+            writer.close()
+            raise
+        return {'body': self._events(reader, writer, headers), 'contentType': headers.get('content-type')}
@@ -0,0 +1,124 @@
+# core/llm_cache.py
+"""
+Persistent response cache for LLM calls.
+
+Re-analysing an identical digest (a retried job, the same file uploaded
+again) used to pay a full Bedrock round trip and its tokens. Responses are
+now stored in LLMResponse under a hash of
+
+    (model id, prompt with whitespace collapsed, temperature, max tokens)
+
+so only the content of a request decides whether it is a repeat:
+
+    cached = llm_cache.get(model_id, prompt, temperature, max_tokens)
+    if cached is None:
+        text = call_the_model(...)
+        llm_cache.put(model_id, prompt, temperature, max_tokens, text)
+
+Entries live LLM_CACHE_TTL_SECONDS. A put() that takes the store past
+LLM_CACHE_MAX_ENTRIES evicts expired rows, then the least recently used
+ones. Hit and miss counters are kept in the Django cache; stats() reports
+them with the store's size.
+"""
+import hashlib
+import json
+import re
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, F, Q, Sum
+from django.utils import timezone
+
+from .models import LLMResponse
+
+COUNTERS = ('hits', 'misses')
+
+
+def normalize_prompt(prompt):
+    # Indentation and line wrapping of a prompt template should not split the cache.
+    return re.sub(r'\s+', ' ', prompt).strip()
+
+
+def cache_key(model_id, prompt, temperature, max_tokens):
+    material = json.dumps([model_id, normalize_prompt(prompt), float(temperature), int(max_tokens)])
+    return hashlib.sha256(material.encode()).hexdigest()
+
+
+def _count(counter):
+    key = f"llm-cache:{counter}"
+    if not cache.add(key, 1, timeout=None):
+        try:
+            cache.incr(key)
+        except ValueError:   # evicted between add() and incr()
+            cache.set(key, 1, timeout=None)
+
+
+def get(model_id, prompt, temperature, max_tokens, now=None):
+    """The cached response text, or None on a miss (or when the cache is disabled)."""
+    if not settings.LLM_CACHE_ENABLED:
+        return None
+    now = now or timezone.now()
+    key = cache_key(model_id, prompt, temperature, max_tokens)
+    response = LLMResponse.objects.filter(key=key, expires_at__gt=now).values_list('response', flat=True).first()
+    if response is None:
+        _count('misses')
+        return None
+    LLMResponse.objects.filter(key=key).update(hits=F('hits') + 1, last_used_at=now)
+    _count('hits')
+    return response
+
+
+def put(model_id, prompt, temperature, max_tokens, response, now=None):
+    """Store `response` for this request; evict once a new entry takes the store past its cap."""
+    if not settings.LLM_CACHE_ENABLED:
+        return
+    now = now or timezone.now()
+    _, created = LLMResponse.objects.update_or_create(
+        key=cache_key(model_id, prompt, temperature, max_tokens),
+        defaults={
+            'model_id': model_id,
+            'response': response,
+            'size': len(response.encode()),
+            'created_at': now,
+            'last_used_at': now,
+            'expires_at': now + timedelta(seconds=settings.LLM_CACHE_TTL_SECONDS),
+        },
+    )
+    # Replacing an entry cannot grow the store; expired rows are never served, so they can wait for the cap.
+    if created and LLMResponse.objects.count() > settings.LLM_CACHE_MAX_ENTRIES:
+        evict(now)
+
+
+def forget(model_id, prompt, temperature, max_tokens):
+    """Drop one entry, e.g. a response the caller could not parse."""
+    LLMResponse.objects.filter(key=cache_key(model_id, prompt, temperature, max_tokens)).delete()
+
+
+def evict(now=None, max_entries=None):
+    """Delete expired entries, then the least recently used beyond `max_entries`. Returns rows deleted."""
+    now = now or timezone.now()
+    max_entries = settings.LLM_CACHE_MAX_ENTRIES if max_entries is None else max_entries
+    deleted, _ = LLMResponse.objects.filter(expires_at__lte=now).delete()
+    # The newest max_entries rows survive; everything used before the oldest of them goes.
+    boundary = list(
+        LLMResponse.objects.order_by('-last_used_at', '-id').values_list('last_used_at', 'id')[max_entries:max_entries + 1]
+    )
+    if boundary:
+        used_at, pk = boundary[0]
+        deleted += LLMResponse.objects.filter(Q(last_used_at__lt=used_at) | Q(last_used_at=used_at, id__lte=pk)).delete()[0]
+    return deleted
+
+
+def stats():
+    """Hit/miss counters since the Django cache was last cleared, plus the store's entry count and size."""
+    counters = cache.get_many([f"llm-cache:{counter}" for counter in COUNTERS])
+    hits, misses = (counters.get(f"llm-cache:{counter}", 0) for counter in COUNTERS)
+    store = LLMResponse.objects.aggregate(entries=Count('id'), bytes=Sum('size'))
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': round(hits / (hits + misses), 4) if hits + misses else None,
+        'entries': store['entries'],
+        'bytes': store['bytes'] or 0,
+    }
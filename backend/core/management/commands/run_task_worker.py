@@ -0,0 +1,61 @@
+import sys
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+
+from core.queue import autodiscover_tasks, claim_tasks, default_worker_id, run_task
+
+
+class Command(BaseCommand):
+    help = "Run background task workers (Bedrock analysis, alert delivery, Glue polling)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=settings.TASK_WORKER_CONCURRENCY,
+                            help="Number of worker threads.")
+        parser.add_argument('--poll-interval', type=float, default=settings.TASK_POLL_INTERVAL_SECONDS,
+                            help="Seconds to wait when the queue is empty.")
+        parser.add_argument('--once', action='store_true',
+                            help="Exit once no due tasks are left instead of polling forever.")
+
+    def handle(self, *args, **options):
+        autodiscover_tasks()
+        stop = threading.Event()
+        once = options['once']
+        poll_interval = options['poll_interval']
+
+        def work():
+            worker_id = default_worker_id()
+            try:
+                while not stop.is_set():
+                    close_old_connections()
+                    tasks = claim_tasks(worker_id, limit=1)
+                    if not tasks:
+                        if once:
+                            return
+                        stop.wait(poll_interval)
+                        continue
+                    for task in tasks:
+                        status = run_task(task)
+                        self.stdout.write(f"WORKER LOG: {worker_id} {task.name} #{task.id} -> {status}")
+                        sys.stdout.flush()
+            finally:
+                connection.close()
+
+        threads = [
+            threading.Thread(target=work, name=f"task-worker-{i}", daemon=True)
+            for i in range(max(1, options['concurrency']))
+        ]
+        self.stdout.write(f"Starting {len(threads)} task worker thread(s).")
+        for thread in threads:
+            thread.start()
+        try:
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(timeout=1)
+        except KeyboardInterrupt:
+            self.stdout.write("Stopping task workers after their current task...")
+            stop.set()
+            for thread in threads:
+                thread.join()
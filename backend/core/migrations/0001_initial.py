@@ -0,0 +1,48 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:01
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DataSource',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('description', models.TextField(blank=True, null=True)),
+                ('source_type', models.CharField(choices=[('POS', 'Point of Sale'), ('REVIEWS', 'Customer Reviews'), ('SOCIAL', 'Social Media'), ('CUSTOM', 'Custom Upload')], max_length=50)),
+                ('s3_bucket', models.CharField(blank=True, max_length=255, null=True)),
+                ('s3_prefix', models.CharField(blank=True, max_length=255, null=True)),
+                ('appflow_connector', models.CharField(blank=True, max_length=255, null=True)),
+                ('api_gateway_url', models.URLField(blank=True, null=True)),
+                ('schema', models.JSONField(blank=True, null=True)),
+                ('config', models.JSONField(blank=True, null=True)),
+                ('is_active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='data_sources', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='IngestionJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('RUNNING', 'Running'), ('SUCCESS', 'Success'), ('FAILED', 'Failed')], default='PENDING', max_length=20)),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('records_processed', models.IntegerField(default=0)),
+                ('error_message', models.TextField(blank=True, null=True)),
+                ('data_source', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ingestion_jobs', to='core.datasource')),
+            ],
+        ),
+    ]
@@ -1,5 +1,6 @@
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
 
 # Create your models here.
 class DataSource(models.Model):
@@ -56,3 +57,63 @@ class IngestionJob(models.Model):
 
     def __str__(self):
         return f"{self.data_source.name} ingestion at {self.started_at} ({self.status})"
+
+
+class Task(models.Model):
+    """
+    A unit of background work (Bedrock analysis, alert delivery, Glue polling).
+
+    Rows are claimed by `manage.py run_task_worker` under a lease; a task whose
+    lease expires without finishing is picked up again by another worker.
+    """
+    status_choices = [
+        ("PENDING", "Pending"),
+        ("RUNNING", "Running"),
+        ("SUCCEEDED", "Succeeded"),
+        ("FAILED", "Failed"),
+    ]
+    name = models.CharField(max_length=255)  # registered handler, e.g. "services.start_bedrock_analysis"
+    payload = models.JSONField(default=dict, blank=True)  # keyword arguments for the handler
+    status = models.CharField(max_length=20, choices=status_choices, default="PENDING")
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=255, blank=True, null=True)
+    lease_expires_at = models.DateTimeField(blank=True, null=True)
+    result = models.JSONField(blank=True, null=True)
+    last_error = models.TextField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "run_after"], name="core_task_claim_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.id} ({self.status})"
+
+
+class LLMResponse(models.Model):
+    """
+    A cached model completion (see core.llm_cache), keyed by a hash of
+    (model id, normalized prompt, temperature, max tokens).
+    """
+    key = models.CharField(max_length=64, unique=True)
+    model_id = models.CharField(max_length=255)
+    response = models.TextField()
+    size = models.PositiveIntegerField(default=0)  # bytes of response, for cache stats
+    hits = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(default=timezone.now)
+    last_used_at = models.DateTimeField(default=timezone.now)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            # Eviction: expired rows first, then least recently used.
+            models.Index(fields=["expires_at"], name="core_llmresponse_expiry_idx"),
+            models.Index(fields=["last_used_at"], name="core_llmresponse_lru_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.model_id} response {self.key[:12]}"
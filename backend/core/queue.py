@@ -0,0 +1,197 @@
+# core/queue.py
+"""
+Durable, database-backed task queue.
+
+Work is stored as core.models.Task rows and executed by
+`python manage.py run_task_worker`. Handlers are plain functions registered
+by name in each app's tasks.py module:
+
+    @register_task("services.start_bedrock_analysis")
+    def run_bedrock_analysis(job_id):
+        ...
+
+    enqueue("services.start_bedrock_analysis", job_id=42)
+
+Workers claim rows with SELECT ... FOR UPDATE SKIP LOCKED where the database
+supports it (PostgreSQL). On SQLite each candidate is claimed with a
+conditional UPDATE instead, which is atomic under SQLite's write lock. Every
+claim carries a lease: if a worker dies mid-task the lease expires and the
+row becomes claimable again. Failed handlers are retried with exponential
+backoff until max_attempts is reached.
+
+A lease lasts TASK_LEASE_SECONDS, so that setting must be longer than the
+longest stretch a handler runs without calling heartbeat(), which renews
+the lease of the task being run (e.g. before a Bedrock call, bounded by
+AWS_READ_TIMEOUT_SECONDS x AWS_MAX_ATTEMPTS). Otherwise another worker may
+reclaim a task that is still running.
+"""
+import os
+import socket
+import sys
+import threading
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import autodiscover_modules
+
+from .models import Task
+
+_registry = {}
+_local = threading.local()   # the task each worker thread is running
+
+
+class Retry(Exception):
+    """
+    Raised by a handler to run again later without counting as a failure,
+    e.g. while polling an external job that has not finished yet.
+    """
+
+    def __init__(self, delay=None, message="Task rescheduled"):
+        super().__init__(message)
+        self.delay = delay
+
+
+def register_task(name):
+    def decorator(func):
+        _registry[name] = func
+        return func
+    return decorator
+
+
+def autodiscover_tasks():
+    """Import every installed app's tasks.py so its handlers register."""
+    autodiscover_modules('tasks')
+
+
+def get_handler(name):
+    return _registry.get(name)
+
+
+def current_task():
+    """The Task the calling worker thread is running, or None outside run_task()."""
+    return getattr(_local, 'task', None)
+
+
+def heartbeat(lease_seconds=None):
+    """
+    Renew the lease of the task the calling thread is running. Returns
+    False when the lease was already lost to another worker (and True
+    outside a task).
+    """
+    task = current_task()
+    if task is None:
+        return True
+    lease_expires_at = timezone.now() + timedelta(seconds=lease_seconds or settings.TASK_LEASE_SECONDS)
+    return bool(
+        Task.objects.filter(id=task.id, locked_by=task.locked_by, status="RUNNING")
+        .update(lease_expires_at=lease_expires_at)
+    )
+
+
+def enqueue(name, run_after=None, max_attempts=None, **payload):
+    """Store a task for the workers and return the Task row."""
+    return Task.objects.create(
+        name=name,
+        payload=payload,
+        run_after=run_after or timezone.now(),
+        max_attempts=max_attempts or settings.TASK_MAX_ATTEMPTS,
+    )
+
+
+def default_worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.current_thread().name}"
+
+
+def _claimable(now):
+    # Due pending tasks, plus running tasks whose worker lost its lease.
+    return (
+        Q(status="PENDING", run_after__lte=now)
+        | Q(status="RUNNING", lease_expires_at__lt=now)
+    )
+
+
+def claim_tasks(worker_id, limit=1, lease_seconds=None):
+    """Lease up to `limit` due tasks to `worker_id` and return them."""
+    now = timezone.now()
+    lease = {
+        'status': "RUNNING",
+        'locked_by': worker_id,
+        'lease_expires_at': now + timedelta(seconds=lease_seconds or settings.TASK_LEASE_SECONDS),
+        'attempts': F('attempts') + 1,
+    }
+    candidates = Task.objects.filter(_claimable(now)).order_by('run_after', 'id')
+
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            ids = list(
+                candidates.select_for_update(skip_locked=True).values_list('id', flat=True)[:limit]
+            )
+            Task.objects.filter(id__in=ids).update(**lease)
+    else:
+        # SQLite fallback: optimistic claim, the conditional UPDATE decides the winner.
+        ids = []
+        for task_id in candidates.values_list('id', flat=True)[:limit * 4]:
+            if Task.objects.filter(_claimable(now), id=task_id).update(**lease):
+                ids.append(task_id)
+                if len(ids) == limit:
+                    break
+
+    return list(Task.objects.filter(id__in=ids, locked_by=worker_id).order_by('run_after', 'id'))
+
+
+def run_task(task):
+    """Execute a claimed task and record the outcome. Returns the final status."""
+    handler = get_handler(task.name)
+    # Only the worker still holding the lease may record the outcome.
+    owned = Task.objects.filter(id=task.id, locked_by=task.locked_by, status="RUNNING")
+    now = timezone.now
+
+    if handler is None:
+        owned.update(status="FAILED", last_error=f"No handler registered for '{task.name}'.",
+                     finished_at=now(), lease_expires_at=None)
+        return "FAILED"
+
+    _local.task = task
+    try:
+        result = handler(**task.payload)
+    except Retry as e:
+        delay = e.delay if e.delay is not None else settings.TASK_RETRY_BACKOFF_SECONDS
+        owned.update(status="PENDING", run_after=now() + timedelta(seconds=delay),
+                     attempts=F('attempts') - 1, lease_expires_at=None, locked_by=None)
+        return "PENDING"
+    except Exception as e:
+        print(f"TASK LOG: {task} raised {e}")
+        sys.stdout.flush()
+        error = traceback.format_exc()
+        if task.attempts >= task.max_attempts:
+            owned.update(status="FAILED", last_error=error, finished_at=now(), lease_expires_at=None)
+            return "FAILED"
+        backoff = min(
+            settings.TASK_RETRY_BACKOFF_SECONDS * 2 ** (task.attempts - 1),
+            settings.TASK_RETRY_BACKOFF_MAX_SECONDS,
+        )
+        owned.update(status="PENDING", run_after=now() + timedelta(seconds=backoff),
+                     last_error=error, lease_expires_at=None, locked_by=None)
+        return "PENDING"
+    finally:
+        _local.task = None
+
+    owned.update(status="SUCCEEDED", result=result, finished_at=now(), lease_expires_at=None)
+    return "SUCCEEDED"
+
+
+def run_pending(worker_id=None, limit=None):
+    """Claim and run due tasks until none are left (or `limit` ran). Returns the count."""
+    worker_id = worker_id or default_worker_id()
+    ran = 0
+    while limit is None or ran < limit:
+        tasks = claim_tasks(worker_id, limit=1)
+        if not tasks:
+            break
+        run_task(tasks[0])
+        ran += 1
+    return ran
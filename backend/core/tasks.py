@@ -0,0 +1,25 @@
+# core/tasks.py
+"""Background task handlers owned by the core app (see core.queue)."""
+from django.conf import settings
+
+from .aws_utils import TERMINAL_GLUE_STATES, get_glue_job_status
+from .queue import Retry, register_task
+
+
+@register_task("core.poll_glue_job")
+def poll_glue_job(job_name, run_id):
+    status = get_glue_job_status(job_name, run_id)
+    print("Glue job status:", status)
+    if status not in TERMINAL_GLUE_STATES:
+        raise Retry(delay=settings.GLUE_POLL_INTERVAL_SECONDS)
+    return status
+
+
+@register_task("core.send_alert")
+def send_alert(alert_id):
+    # Superseded by the batched dispatcher; tasks queued before it drain through it.
+    from services.alert_dispatch import dispatch_alerts
+
+    counts = dispatch_alerts()
+    counts.pop('next_due')
+    return counts
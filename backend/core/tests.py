@@ -1,3 +1,502 @@
-from django.test import TestCase
+import asyncio
+import base64
+import io
+import json
+import os
+import signal
+import struct
+import threading
+import unittest
+import zlib
+from unittest import mock
+from datetime import datetime, timedelta, timezone
 
-# Create your tests here.
+from botocore.credentials import Credentials
+from botocore.exceptions import ClientError, ReadTimeoutError
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from services.analysis import start_bedrock_analysis
+from services.ingest import write_metrics
+from services.models import Insight, Metric
+
+from . import aws_clients, llm_cache
+from .aws_fakes import FakeBedrock
+from .ai_service import CLAUDE_MODEL_ID, invoke_claude, parse_json_response, stream_claude
+from .bedrock_stream import AsyncBedrockStream
+from .models import DataSource, IngestionJob, LLMResponse, Task
+from .queue import Retry, autodiscover_tasks, claim_tasks, enqueue, heartbeat, register_task, run_pending, run_task
+
+
+class StubBedrock:
+    """bedrock-runtime stand-in: answers invoke_model with canned replies (or raises them) and counts calls."""
+
+    def __init__(self, *replies):
+        self.replies = list(replies) or ['{"title": "T", "summary": "S", "recommendation": "R"}']
+        self.calls = []
+
+    def invoke_model(self, modelId, contentType, accept, body):
+        self.calls.append(json.loads(body))
+        text = self.replies[min(len(self.calls), len(self.replies)) - 1]
+        if isinstance(text, Exception):
+            raise text
+        payload = json.dumps({'content': [{'type': 'text', 'text': text}]}).encode()
+        return {'body': io.BytesIO(payload)}
+
+
+# --- LLM response cache ---
+
+class LLMCacheTests(TestCase):
+    """Repeated Bedrock requests are answered from LLMResponse, within TTL and size bounds."""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_repeat_prompt_is_served_from_cache(self):
+        client = StubBedrock()
+        first = invoke_claude("Analyze\n    these   metrics", client=client)
+        # Same request modulo whitespace: no second round trip.
+        self.assertEqual(invoke_claude("  Analyze these metrics ", client=client), first)
+        self.assertEqual(len(client.calls), 1)
+
+        # Model, temperature and max tokens are part of the key.
+        invoke_claude("Analyze these metrics", temperature=0.0, client=client)
+        invoke_claude("Analyze these metrics", max_tokens=10, client=client)
+        self.assertEqual(len(client.calls), 3)
+
+        stats = llm_cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['entries']), (1, 3, 3))
+        self.assertEqual(LLMResponse.objects.get(hits=1).response, first)
+
+    def test_expired_entries_are_refetched(self):
+        client = StubBedrock('old', 'new')
+        self.assertEqual(invoke_claude("prompt", client=client), 'old')
+        LLMResponse.objects.update(expires_at=datetime.now(timezone.utc) - timedelta(seconds=1))
+        self.assertEqual(invoke_claude("prompt", client=client), 'new')
+        self.assertEqual(LLMResponse.objects.get().response, 'new')
+
+    @override_settings(LLM_CACHE_MAX_ENTRIES=3)
+    def test_least_recently_used_entries_are_evicted(self):
+        client = StubBedrock()
+        start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+        for i in range(3):
+            llm_cache.put('model', f"prompt {i}", 0.5, 1024, 'reply', now=start + timedelta(minutes=i))
+        llm_cache.get('model', "prompt 0", 0.5, 1024, now=start + timedelta(minutes=5))   # touch the oldest
+        llm_cache.put('model', "prompt 3", 0.5, 1024, 'reply', now=start + timedelta(minutes=6))
+
+        self.assertEqual(LLMResponse.objects.count(), 3)
+        self.assertIsNone(llm_cache.get('model', "prompt 1", 0.5, 1024, now=start + timedelta(minutes=7)))
+        self.assertEqual(llm_cache.get('model', "prompt 0", 0.5, 1024, now=start + timedelta(minutes=7)), 'reply')
+        self.assertEqual(client.calls, [])
+
+    @override_settings(LLM_CACHE_MAX_ENTRIES=3)
+    def test_puts_under_the_cap_do_not_evict(self):
+        start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+        with mock.patch('core.llm_cache.evict', wraps=llm_cache.evict) as evict:
+            for i in range(3):
+                llm_cache.put('model', f"prompt {i}", 0.5, 1024, 'reply', now=start + timedelta(minutes=i))
+            llm_cache.put('model', "prompt 0", 0.5, 1024, 'new reply', now=start + timedelta(minutes=4))
+            self.assertEqual(evict.call_count, 0)
+            llm_cache.put('model', "prompt 3", 0.5, 1024, 'reply', now=start + timedelta(minutes=5))
+            self.assertEqual(evict.call_count, 1)
+        self.assertEqual(LLMResponse.objects.count(), 3)
+
+    def test_bedrock_calls_are_not_logged(self):
+        with mock.patch('sys.stdout', new_callable=io.StringIO) as stdout:
+            invoke_claude("Analyze these metrics", client=StubBedrock())
+        self.assertNotIn("call complete", stdout.getvalue())
+
+    def test_unparseable_replies_are_not_cached(self):
+        client = StubBedrock('not json', '{"title": "ok"}')
+        with self.assertRaises(ValueError):
+            invoke_claude("prompt", client=client, parse=parse_json_response)
+        self.assertFalse(LLMResponse.objects.exists())
+        self.assertEqual(invoke_claude("prompt", client=client, parse=parse_json_response), {'title': 'ok'})
+        self.assertEqual(invoke_claude("prompt", client=client, parse=parse_json_response), {'title': 'ok'})
+        self.assertEqual(len(client.calls), 2)
+
+    @override_settings(LLM_CACHE_ENABLED=False)
+    def test_disabled(self):
+        client = StubBedrock()
+        invoke_claude("prompt", client=client)
+        invoke_claude("prompt", client=client)
+        self.assertEqual(len(client.calls), 2)
+        self.assertFalse(LLMResponse.objects.exists())
+
+    def test_reanalysing_a_job_reuses_the_reply(self):
+        user = get_user_model().objects.create(username='analyst')
+        data_source = DataSource.objects.create(owner=user, name='Cache Source', source_type='CUSTOM')
+        start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+        job = IngestionJob.objects.create(data_source=data_source)
+        write_metrics(
+            Metric(data_source=data_source, ingestion_job=job, name='Daily_Sales', value=float(day),
+                   timestamp=start + timedelta(days=day))
+            for day in range(10)
+        )
+
+        client = StubBedrock('```json\n{"title": "Up", "summary": "Sales rose", "recommendation": "Restock"}\n```')
+        with aws_clients.override_client('bedrock-runtime', client):
+            start_bedrock_analysis(job.id)
+            start_bedrock_analysis(job.id)   # a retried job
+
+        self.assertEqual(len(client.calls), 1)
+        self.assertEqual(Insight.objects.filter(title='Up').count(), 2)
+        self.assertEqual(Metric.objects.filter(insight__isnull=True).count(), 0)
+
+
+# --- Task queue ---
+
+HANDLER_CALLS = []
+
+
+@register_task("core.tests.flaky")
+def flaky_task(fail=True):
+    HANDLER_CALLS.append('flaky')
+    if fail:
+        raise RuntimeError("flaky handler failed")
+    return {'ok': True}
+
+
+@register_task("core.tests.poll")
+def poll_task():
+    HANDLER_CALLS.append('poll')
+    if HANDLER_CALLS.count('poll') < 3:
+        raise Retry(delay=30)
+    return {'polls': 3}
+
+
+@register_task("core.tests.long")
+def long_task():
+    # A long step: the lease is about to run out when the handler checks in.
+    Task.objects.update(lease_expires_at=datetime.now(timezone.utc) + timedelta(seconds=1))
+    HANDLER_CALLS.append(heartbeat())
+    Task.objects.update(locked_by='someone-else')   # reclaimed by another worker meanwhile
+    HANDLER_CALLS.append(heartbeat())
+
+
+class TaskQueueTests(TestCase):
+    """Tasks are leased, retried with backoff and failed for good after max_attempts."""
+
+    def setUp(self):
+        autodiscover_tasks()
+        HANDLER_CALLS.clear()
+
+    def make_due(self):
+        Task.objects.filter(status="PENDING").update(run_after=datetime.now(timezone.utc) - timedelta(seconds=1))
+
+    def analysis_job(self, name):
+        user, _ = get_user_model().objects.get_or_create(username='queue')
+        data_source = DataSource.objects.create(owner=user, name=name, source_type='CUSTOM')
+        job = IngestionJob.objects.create(data_source=data_source)
+        write_metrics(
+            Metric(data_source=data_source, ingestion_job=job, name='Daily_Sales', value=float(day),
+                   timestamp=datetime(2025, 1, 1, tzinfo=timezone.utc) + timedelta(days=day))
+            for day in range(5)
+        )
+        return job
+
+    def assertDelay(self, moment, seconds):
+        delay = (moment - datetime.now(timezone.utc)).total_seconds()
+        self.assertAlmostEqual(delay, seconds, delta=2)
+
+    def test_claim_leases_due_tasks_in_order(self):
+        now = datetime.now(timezone.utc)
+        later = enqueue("core.tests.flaky", run_after=now - timedelta(seconds=10))
+        first = enqueue("core.tests.flaky", run_after=now - timedelta(seconds=20))
+        enqueue("core.tests.flaky", run_after=now + timedelta(hours=1))   # not due yet
+
+        claimed = claim_tasks('w1', limit=5)
+        self.assertEqual([task.id for task in claimed], [first.id, later.id])
+        for task in claimed:
+            self.assertEqual((task.status, task.locked_by, task.attempts), ("RUNNING", 'w1', 1))
+            self.assertDelay(task.lease_expires_at, 300)
+        self.assertEqual(claim_tasks('w2', limit=5), [])
+
+    @override_settings(TASK_LEASE_SECONDS=60)
+    def test_expired_lease_is_reclaimed(self):
+        enqueue("core.tests.flaky", fail=False)
+        [stale] = claim_tasks('w1')
+        self.assertDelay(stale.lease_expires_at, 60)
+        Task.objects.update(lease_expires_at=datetime.now(timezone.utc) - timedelta(seconds=1))   # w1 died
+
+        [task] = claim_tasks('w2')
+        self.assertEqual((task.locked_by, task.attempts), ('w2', 2))
+        # The worker that lost its lease cannot record an outcome any more.
+        run_task(stale)
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.locked_by), ("RUNNING", 'w2'))
+        self.assertEqual(run_task(task), "SUCCEEDED")
+
+    @override_settings(TASK_RETRY_BACKOFF_SECONDS=10, TASK_RETRY_BACKOFF_MAX_SECONDS=15)
+    def test_failures_back_off_until_max_attempts(self):
+        task = enqueue("core.tests.flaky", max_attempts=3)
+        for backoff in (10, 15):   # 10 * 2**0, then 10 * 2**1 capped at 15
+            self.assertEqual(run_pending(), 1)
+            task.refresh_from_db()
+            self.assertEqual((task.status, task.locked_by, task.lease_expires_at), ("PENDING", None, None))
+            self.assertDelay(task.run_after, backoff)
+            self.assertIn("flaky handler failed", task.last_error)
+            self.assertEqual(run_pending(), 0)   # not due yet
+            self.make_due()
+        run_pending()
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.attempts), ("FAILED", 3))
+        self.assertIsNotNone(task.finished_at)
+        self.assertEqual(HANDLER_CALLS, ['flaky'] * 3)
+
+    def test_retry_reschedules_without_using_an_attempt(self):
+        task = enqueue("core.tests.poll", max_attempts=1)
+        for _ in range(2):
+            run_pending()
+            task.refresh_from_db()
+            self.assertEqual((task.status, task.attempts), ("PENDING", 0))
+            self.assertDelay(task.run_after, 30)
+            self.make_due()
+        run_pending()
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.result), ("SUCCEEDED", {'polls': 3}))
+
+    def test_unknown_handler_fails(self):
+        task = enqueue("core.tests.missing")
+        run_pending()
+        task.refresh_from_db()
+        self.assertEqual(task.status, "FAILED")
+        self.assertIn("No handler registered", task.last_error)
+
+    def test_conditional_update_claim(self):
+        # The path SQLite takes; forced here so PostgreSQL runs it too.
+        with mock.patch.object(connection.features, 'has_select_for_update_skip_locked', False):
+            tasks = [enqueue("core.tests.flaky") for _ in range(5)]
+            claimed = claim_tasks('w1', limit=2) + claim_tasks('w2', limit=2) + claim_tasks('w3', limit=2)
+            self.assertEqual(sorted(task.id for task in claimed), [task.id for task in tasks])
+            self.assertEqual([task.locked_by for task in claimed], ['w1', 'w1', 'w2', 'w2', 'w3'])
+            self.assertEqual(claim_tasks('w4', limit=2), [])
+
+            # A candidate another worker claimed in between is skipped by the conditional UPDATE.
+            extra = enqueue("core.tests.flaky")
+            real_update = type(Task.objects.all()).update
+
+            def race(queryset, **values):
+                if values.get('locked_by') == 'w5':
+                    Task.objects.filter(id=extra.id).update(
+                        status="RUNNING", locked_by='w6',
+                        lease_expires_at=datetime.now(timezone.utc) + timedelta(minutes=5),
+                    )
+                return real_update(queryset, **values)
+
+            with mock.patch.object(type(Task.objects.all()), 'update', race):
+                self.assertEqual(claim_tasks('w5'), [])
+            self.assertEqual(Task.objects.get(id=extra.id).locked_by, 'w6')
+
+    def test_heartbeat_renews_the_lease(self):
+        enqueue("core.tests.long")
+        run_pending()
+        # Renewed while the lease was held; refused once another worker had it.
+        self.assertEqual(HANDLER_CALLS, [True, False])
+        self.assertTrue(heartbeat())   # outside a task: nothing to renew
+
+    def test_transient_bedrock_errors_are_retried(self):
+        throttled = FakeBedrock(requests_per_minute=0)   # throttles every call
+        job = self.analysis_job('Throttled Source')
+        task = enqueue('services.start_bedrock_analysis', job_id=job.id, max_attempts=2)
+        with aws_clients.override_client('bedrock-runtime', throttled):
+            run_pending()
+            task.refresh_from_db()
+            job.refresh_from_db()
+            self.assertEqual((task.status, task.attempts), ("PENDING", 1))
+            self.assertIn('ThrottlingException', task.last_error)
+            self.assertEqual(job.status, 'ANALYSIS_KICKED_OFF')
+
+            # The last attempt gives up and fails the job.
+            self.make_due()
+            run_pending()
+        task.refresh_from_db()
+        job.refresh_from_db()
+        self.assertEqual((task.status, job.status), ("FAILED", 'FAILED'))
+        self.assertEqual(throttled.throttled, 2)
+
+        # A retry after the throttling clears completes the job.
+        job = self.analysis_job('Recovering Source')
+        task = enqueue('services.start_bedrock_analysis', job_id=job.id)
+        with aws_clients.override_client('bedrock-runtime', throttled):
+            run_pending()
+        self.make_due()
+        with aws_clients.override_client('bedrock-runtime', StubBedrock()):
+            run_pending()
+        task.refresh_from_db()
+        job.refresh_from_db()
+        self.assertEqual((task.status, task.attempts, job.status), ("SUCCEEDED", 2, 'COMPLETED'))
+
+
+    def test_permanent_bedrock_errors_fail_at_once(self):
+        denied = ClientError({'Error': {'Code': 'AccessDeniedException', 'Message': 'No access'}}, 'InvokeModel')
+        job = self.analysis_job('Denied Source')
+        task = enqueue('services.start_bedrock_analysis', job_id=job.id, max_attempts=3)
+        with aws_clients.override_client('bedrock-runtime', StubBedrock(denied)):
+            run_pending()
+        task.refresh_from_db()
+        job.refresh_from_db()
+        self.assertEqual((task.status, task.attempts, job.status), ("SUCCEEDED", 1, 'FAILED'))
+        self.assertIn('AccessDeniedException', job.error_message)
+
+        # A read timeout is retried, and the job says so while it waits.
+        job = self.analysis_job('Timed Out Source')
+        task = enqueue('services.start_bedrock_analysis', job_id=job.id, max_attempts=3)
+        timeout = ReadTimeoutError(endpoint_url='https://bedrock-runtime.us-east-1.amazonaws.com')
+        with aws_clients.override_client('bedrock-runtime', StubBedrock(timeout)):
+            run_pending()
+        task.refresh_from_db()
+        job.refresh_from_db()
+        self.assertEqual((task.status, task.attempts), ("PENDING", 1))
+        self.assertIn('will retry', job.error_message)
+
+# --- AWS client registry ---
+
+class AWSClientRegistryTests(TestCase):
+    """One lazily built client per (service, region), shared across threads, rebuilt after fork."""
+
+    def setUp(self):
+        aws_clients.reset_clients()
+        self.addCleanup(aws_clients.reset_clients)
+
+    def test_clients_are_reused_per_service_and_region(self):
+        s3 = aws_clients.get_client('s3', 'us-east-1')
+        self.assertIs(aws_clients.get_client('s3', 'us-east-1'), s3)
+        self.assertIsNot(aws_clients.get_client('s3', 'eu-west-1'), s3)
+        self.assertEqual(s3.meta.config.max_pool_connections, 25)
+        self.assertEqual(s3.meta.config.retries['mode'], 'standard')
+
+    def test_concurrent_first_use_builds_one_client(self):
+        seen = []
+        barrier = threading.Barrier(8)
+
+        def use():
+            barrier.wait()
+            seen.append(aws_clients.get_client('sns', 'us-east-1'))
+
+        threads = [threading.Thread(target=use) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len({id(client) for client in seen}), 1)
+
+    @unittest.skipUnless(hasattr(os, 'fork'), "needs fork()")
+    def test_forked_child_starts_empty(self):
+        parent = aws_clients.get_client('s3', 'us-east-1')
+        pid = os.fork()
+        if pid == 0:   # child: must not reuse the parent's pooled sockets
+            os._exit(0 if aws_clients.get_client('s3', 'us-east-1') is not parent else 1)
+        _, status = os.waitpid(pid, 0)
+        self.assertEqual(os.waitstatus_to_exitcode(status), 0)
+        self.assertIs(aws_clients.get_client('s3', 'us-east-1'), parent)
+
+    @unittest.skipUnless(hasattr(os, 'fork'), "needs fork()")
+    def test_fork_while_the_lock_is_held(self):
+        with aws_clients._lock:   # as if another thread were building a client at fork time
+            pid = os.fork()
+            if pid == 0:
+                signal.alarm(5)   # a child stuck on the inherited lock is killed
+                aws_clients.get_client('s3', 'us-east-1')
+                os._exit(0)
+        _, status = os.waitpid(pid, 0)
+        self.assertEqual(os.waitstatus_to_exitcode(status), 0)
+
+    def test_override_client(self):
+        stub = StubBedrock()
+        with aws_clients.override_client('bedrock-runtime', stub):
+            self.assertIs(aws_clients.get_client('bedrock-runtime', 'us-west-2'), stub)
+        self.assertIsNot(aws_clients.get_client('bedrock-runtime', 'us-west-2'), stub)
+
+
+# --- Bedrock response streams ---
+
+def event_message(headers, payload):
+    """Encode one application/vnd.amazon.eventstream message (string headers only)."""
+    encoded = b''
+    for name, value in headers.items():
+        encoded += bytes([len(name)]) + name.encode() + b'\x07' + struct.pack('>H', len(value)) + value.encode()
+    prelude = struct.pack('>II', 16 + len(encoded) + len(payload), len(encoded))
+    message = prelude + struct.pack('>I', zlib.crc32(prelude)) + encoded + payload
+    return message + struct.pack('>I', zlib.crc32(message))
+
+
+def chunk_event(claude_event):
+    payload = json.dumps({'bytes': base64.b64encode(json.dumps(claude_event).encode()).decode()}).encode()
+    return event_message({':message-type': 'event', ':event-type': 'chunk', ':content-type': 'application/json'}, payload)
+
+
+def text_delta(text):
+    return chunk_event({'type': 'content_block_delta', 'index': 0, 'delta': {'type': 'text_delta', 'text': text}})
+
+
+class FakeBedrockEndpoint:
+    """Local HTTP server answering invoke-with-response-stream with the given messages, chunked."""
+
+    def __init__(self, messages, status=200, headers=None):
+        self.messages = messages
+        self.status = status
+        self.headers = headers or {}
+        self.requests = []
+
+    async def handle(self, reader, writer):
+        head = (await reader.readuntil(b"\r\n\r\n")).decode().split("\r\n")
+        headers = dict(line.split(': ', 1) for line in head[1:] if ': ' in line)
+        body = await reader.readexactly(int(headers['Content-Length']))
+        self.requests.append((head[0], headers, json.loads(body)))
+        extra = ''.join(f"{name}: {value}\r\n" for name, value in self.headers.items())
+        writer.write(f"HTTP/1.1 {self.status} X\r\n{extra}Transfer-Encoding: chunked\r\n\r\n".encode())
+        for message in self.messages:
+            # Split every message across two HTTP chunks, as a slow network would.
+            for part in (message[:7], message[7:]):
+                writer.write(b"%x\r\n%s\r\n" % (len(part), part))
+                await writer.drain()
+                await asyncio.sleep(0.001)
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+        writer.close()
+
+    async def stream(self, prompt="How are sales?"):
+        server = await asyncio.start_server(self.handle, '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        client = AsyncBedrockStream('us-east-1', endpoint_url=f'http://127.0.0.1:{port}',
+                                    credentials=Credentials('AKIDEXAMPLE', 'secret'))
+        try:
+            return [text async for text in stream_claude(prompt, client=client)]
+        finally:
+            server.close()
+
+
+class BedrockStreamTests(SimpleTestCase):
+    """AsyncBedrockStream signs the request and decodes the event stream as it arrives."""
+
+    async def test_streams_text_deltas(self):
+        endpoint = FakeBedrockEndpoint([
+            chunk_event({'type': 'message_start', 'message': {'role': 'assistant'}}),
+            text_delta("Sales are "), text_delta("up 4%."),
+            chunk_event({'type': 'message_stop'}),
+        ])
+        self.assertEqual(await endpoint.stream(), ["Sales are ", "up 4%."])
+        request_line, headers, body = endpoint.requests[0]
+        self.assertEqual(request_line, f"POST /model/{CLAUDE_MODEL_ID.replace(':', '%3A')}/invoke-with-response-stream HTTP/1.1")
+        self.assertTrue(headers['Authorization'].startswith('AWS4-HMAC-SHA256 Credential=AKIDEXAMPLE/'))
+        self.assertIn('/us-east-1/bedrock/aws4_request', headers['Authorization'])
+        self.assertEqual(body['messages'][0]['content'][0]['text'], "How are sales?")
+
+    async def test_errors_raise_client_errors(self):
+        endpoint = FakeBedrockEndpoint([
+            text_delta("Sales"),
+            event_message({':message-type': 'exception', ':exception-type': 'throttlingException'},
+                          b'{"message": "Too many tokens"}'),
+        ])
+        with self.assertRaises(ClientError) as raised:
+            await endpoint.stream()
+        self.assertEqual(raised.exception.response['Error']['Code'], 'throttlingException')
+
+        endpoint = FakeBedrockEndpoint([b'{"message": "Rate exceeded"}'], status=429,
+                                       headers={'x-amzn-ErrorType': 'ThrottlingException:http://internal.amazon.com/'})
+        with self.assertRaises(ClientError) as raised:
+            await endpoint.stream()
+        self.assertEqual(raised.exception.response['Error']['Code'], 'ThrottlingException')
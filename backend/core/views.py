@@ -8,11 +8,13 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from rest_framework import status
 # Import all necessary models, including Alert for the final step
-from .models import Metric, Insight, Alert 
+from services.models import Metric, Insight, Alert
+from services.alerts import raise_alert
+from services.ingest import write_metrics
 from core.models import DataSource, IngestionJob # Assuming IngestionJob is in core
 
 # Import your AI service functions
-from .ai_service import generate_narrative_insight, trigger_sns_alert 
+from .ai_service import generate_narrative_insight
 
 
 class UploadDataView(APIView):
@@ -73,7 +75,7 @@ class UploadDataView(APIView):
                     )
                     metrics_to_create.append(metric)
 
-                Metric.objects.bulk_create(metrics_to_create)
+                write_metrics(metrics_to_create)
 
                 # --- AI INTEGRATION: Insight & Alert Generation ---
                 
@@ -82,28 +84,30 @@ class UploadDataView(APIView):
                 # Pass all metrics from this job to the AI service for analysis
                 insights_text, recommendations_data = generate_narrative_insight(metrics_to_create)
                 
-                # Use the last metric for the ForeignKey link (or a more relevant one if logic dictated)
+                # Use the last metric to key the alert (or a more relevant one if logic dictated)
                 last_metric = metrics_to_create[-1]
-                
-                insight = Insight.objects.create(
-                    metric=last_metric, 
-                    text=insights_text,
-                    recommendations=recommendations_data
-                )
+                title = f"Upload analysis for {data_source.name} (job {job.id})"
 
-                # 5. Trigger Alert Logic (SNS Substitute)
+                # 5. Trigger Alert Logic: raise_alert creates the Insight and Alert, or folds
+                # a repeat into the open alert for this metric instead of adding rows.
                 alert_triggered = False
                 severity = recommendations_data.get('severity', 'LOW')
                 
                 if severity == 'CRITICAL':
-                    alert = Alert.objects.create(
-                        insight=insight,
-                        type="EMAIL",
-                        recipient="admin@bizpulse.co" 
+                    alert_id, alert_triggered = raise_alert(
+                        data_source, last_metric.name, 10,
+                        title=title,
+                        summary=insights_text,
+                        recommendations=recommendations_data,
                     )
-                    
-                    # Call the SNS placeholder function (this will print to console and set alert.sent=True)
-                    alert_triggered = trigger_sns_alert(alert)
+                    insight_id = Alert.objects.filter(id=alert_id).values_list('insight_id', flat=True).first()
+                else:
+                    insight_id = Insight.objects.create(
+                        data_source=data_source,
+                        title=title,
+                        summary=insights_text,
+                        recommendations=recommendations_data
+                    ).id
                     
             # 6. Finalize Job Status
             job.status = 'COMPLETED'; job.save()
@@ -111,7 +115,7 @@ class UploadDataView(APIView):
             return Response({
                 "message": "AI Processing complete. Metrics, Insights, and Alerts generated.",
                 "job_id": job.id,
-                "insight_id": insight.id,
+                "insight_id": insight_id,
                 "alert_triggered": alert_triggered
             }, status=status.HTTP_201_CREATED)
 
@@ -1,3 +1,202 @@
-from django.test import TestCase
+import json
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from core.models import DataSource, IngestionJob
+from services import ingest
+from services.models import Metric
+
+BULK_URL = '/api/v1/internal/metrics/bulk-create/'
+
+
+def metric_record(day, value=100.0, name='Daily_Sales', product='Product Alpha'):
+    return {
+        'name': name,
+        'value': value,
+        'timestamp': f'2025-03-{day:02d}T00:00:00Z',
+        'data_source_id': 1,
+        'product': product,
+    }
+
+
+def ndjson(*lines):
+    return '\n'.join(line if isinstance(line, str) else json.dumps(line) for line in lines) + '\n'
+
+
+class BulkIngestTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create(username='glue')
+        # The view writes every metric to the placeholder source id=1.
+        cls.data_source = DataSource.objects.create(id=1, owner=cls.user, name='Glue Source', source_type='CUSTOM')
+        cls.job = IngestionJob.objects.create(data_source=cls.data_source)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+
+# --- NDJSON streaming mode ---
+
+@override_settings(METRIC_INGEST_BATCH_SIZE=2)
+class NdjsonBulkCreateTests(BulkIngestTestCase):
+    def post_ndjson(self, body, **params):
+        query = '&'.join(f'{key}={value}' for key, value in dict(job_id=self.job.id, **params).items())
+        return self.client.post(f'{BULK_URL}?{query}', data=body, content_type='application/x-ndjson')
+
+    def test_commits_and_reports_each_batch(self):
+        response = self.post_ndjson(ndjson(*[metric_record(day) for day in range(1, 6)]))
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['inserted'], 5)
+        self.assertEqual(response.data['records_processed'], 5)
+        self.assertEqual(
+            response.data['batches'],
+            [{'inserted': 2, 'updated': 0, 'skipped': 0}] * 2 + [{'inserted': 1, 'updated': 0, 'skipped': 0}],
+        )
+        self.assertEqual(Metric.objects.filter(ingestion_job=self.job).count(), 5)
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.status, 'METRICS_CREATED')
+        self.assertEqual(self.job.records_processed, 5)
+
+    def test_records_processed_advances_per_batch(self):
+        seen = []
+        write_metrics = ingest.write_metrics
+
+        def spy(metrics, **kwargs):
+            # Progress as another reader sees it when each batch starts writing.
+            seen.append(IngestionJob.objects.get(pk=self.job.pk).records_processed)
+            return write_metrics(metrics, **kwargs)
+
+        with mock.patch('services.ingest.write_metrics', side_effect=spy):
+            response = self.post_ndjson(ndjson(*[metric_record(day) for day in range(1, 6)]))
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(seen, [0, 2, 4])
+
+    def test_validation_error_reports_line_number(self):
+        body = ndjson(
+            metric_record(1),
+            '',   # blank lines are skipped but still counted
+            metric_record(2),
+            dict(metric_record(3), timestamp='yesterday'),
+            metric_record(4),
+        )
+        response = self.post_ndjson(body)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['line'], 4)
+        self.assertIn('timestamp', response.data['errors'][4])
+        self.assertEqual(response.data['records_processed'], 2)
+        self.assertEqual(Metric.objects.count(), 2)
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.status, 'FAILED')
+        self.assertIn('line 4', self.job.error_message)
+
+    def test_malformed_line_keeps_earlier_batches(self):
+        body = ndjson(metric_record(1), metric_record(2), metric_record(3), '{"name": "Daily_Sales", ', metric_record(5))
+        response = self.post_ndjson(body)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['line'], 4)
+        self.assertIn('Invalid JSON on line 4', response.data['error'])
+        # The first batch (lines 1-2) was committed; the batch holding the bad line was not.
+        self.assertEqual(response.data['records_processed'], 2)
+        self.assertEqual(
+            sorted(Metric.objects.values_list('timestamp__day', flat=True)), [1, 2],
+        )
+
+    def test_non_object_line_is_rejected(self):
+        response = self.post_ndjson(ndjson(metric_record(1), '[1, 2]'))
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['line'], 2)
+        self.assertEqual(Metric.objects.count(), 0)
+
+    def test_rejects_missing_job_id_and_empty_stream(self):
+        response = self.client.post(BULK_URL, data=ndjson(metric_record(1)), content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 400)
+
+        response = self.post_ndjson('\n\n')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['error'], "NDJSON stream contained no metrics.")
+
+
+# --- JSON mode: idempotent writes ---
+
+class BulkCreateWriteTests(BulkIngestTestCase):
+    def post_json(self, metrics, **body):
+        return self.client.post(BULK_URL, {'job_id': self.job.id, 'metrics': metrics, **body}, format='json')
+
+    def counts(self, response):
+        return {key: response.data[key] for key in ('inserted', 'updated', 'skipped', 'records_processed')}
+
+    def stored(self):
+        return dict(Metric.objects.values_list('timestamp__day', 'value'))
+
+    def test_inserts_new_rows(self):
+        response = self.post_json([metric_record(1), metric_record(2), metric_record(2, product='Product Beta')])
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(self.counts(response), {'inserted': 3, 'updated': 0, 'skipped': 0, 'records_processed': 3})
+        self.assertIn('task_id', response.data)
+        self.assertEqual(Metric.objects.count(), 3)
+
+    def test_replaying_a_batch_is_idempotent(self):
+        batch = [metric_record(day) for day in range(1, 4)]
+        self.assertEqual(self.post_json(batch).status_code, 202)
+
+        for on_conflict in ('update', 'skip'):
+            response = self.post_json(batch, on_conflict=on_conflict)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(self.counts(response), {'inserted': 0, 'updated': 0, 'skipped': 3, 'records_processed': 3})
+            self.assertNotIn('task_id', response.data)
+        self.assertEqual(Metric.objects.count(), 3)
+
+    def test_update_replaces_changed_values(self):
+        self.post_json([metric_record(1, value=10), metric_record(2, value=20)])
+        response = self.post_json([metric_record(1, value=10), metric_record(2, value=25), metric_record(3, value=30)])
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(self.counts(response), {'inserted': 1, 'updated': 1, 'skipped': 1, 'records_processed': 3})
+        self.assertEqual(self.stored(), {1: 10, 2: 25, 3: 30})
+
+    def test_skip_keeps_existing_values(self):
+        self.post_json([metric_record(1, value=10), metric_record(2, value=20)])
+        response = self.post_json(
+            [metric_record(1, value=11), metric_record(2, value=20), metric_record(3, value=30)], on_conflict='skip',
+        )
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(self.counts(response), {'inserted': 1, 'updated': 0, 'skipped': 2, 'records_processed': 3})
+        self.assertEqual(self.stored(), {1: 10, 2: 20, 3: 30})
+
+    @override_settings(METRIC_INGEST_BATCH_SIZE=2)
+    def test_counts_are_reported_per_batch(self):
+        self.post_json([metric_record(1, value=10)])
+        response = self.post_json([metric_record(1, value=12), metric_record(2), metric_record(3)])
+
+        self.assertEqual(response.data['batches'], [
+            {'inserted': 1, 'updated': 1, 'skipped': 0},
+            {'inserted': 1, 'updated': 0, 'skipped': 0},
+        ])
+
+    def test_rejects_unknown_on_conflict(self):
+        response = self.post_json([metric_record(1)], on_conflict='replace')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Metric.objects.count(), 0)
+
+    def test_sparse_batch_reads_only_its_timestamps(self):
+        self.post_json([metric_record(day, value=day) for day in range(1, 29)])
+        build = lambda day, value: ingest.prepare_metric(ingest.build_metric(self.job, metric_record(day, value), 1))
+        keys = [ingest.natural_key(build(day, 0)) for day in (1, 28)]
+        self.assertEqual(sorted(ingest._stored_rows(keys, 'value')), [(1,), (28,)])
+
+        with mock.patch.object(ingest, 'LOOKUP_CHUNK', 1):
+            result = ingest.write_metrics([build(day, day + 1) for day in (1, 15, 28)], method='bulk_create')
+        self.assertEqual((result.inserted, result.updated, result.skipped), (0, 3, 0))
+        self.assertEqual({day: value for day, value in self.stored().items() if day in (1, 15, 28)}, {1: 2, 15: 16, 28: 29})
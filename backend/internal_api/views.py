@@ -6,69 +6,74 @@ import sys
 
 # Core Models: Required for the Hackathon Bypass and Job lookup
 from core.models import DataSource, IngestionJob 
+from core.queue import enqueue
 
 # Services App Dependencies
-from services.models import Metric, Insight, ForecastPrediction 
-from services.serializers import MetricCreateSerializer, AnomalyIngestSerializer, ForecastIngestSerializer 
-from services.analysis import start_bedrock_analysis 
+from services.models import Insight, ForecastPrediction 
+from services.alerts import raise_alert
+from services.serializers import AnomalyIngestSerializer, ForecastIngestSerializer 
+from services.ingest import ON_CONFLICT_CHOICES, IngestError, build_metric, ingest_ndjson, write_metrics
+from services.validation import validate_metric_records
 from .permissions import IsInternalService
 
 
 class BulkMetricCreateView(APIView):
+    """
+    Receives metrics from the Glue job.
+
+    Two body formats are accepted:
+    - application/json: {"job_id": ..., "metrics": [...]} validated and stored in one go.
+    - application/x-ndjson: one metric object per line, with job_id passed as a
+      query parameter. Lines are parsed, validated and committed in bounded
+      batches so worker memory stays flat regardless of job size.
+
+    Writes are idempotent on (data_source, name, timestamp, product), so Glue or
+    Lambda retries do not duplicate rows. `on_conflict` ("update", the default,
+    or "skip"; body field or query parameter) decides what happens to rows that
+    already exist. The response reports inserted/updated/skipped counts per
+    batch.
+
+    Bedrock analysis is queued on the task workers when anything changed, so
+    both modes answer 202 (or 200 for a pure retry).
+    """
     permission_classes = [IsInternalService]
+    NDJSON_CONTENT_TYPES = ('application/x-ndjson', 'application/jsonl')
 
     def post(self, request, *args, **kwargs):
+        if request.content_type.split(';')[0].strip() in self.NDJSON_CONTENT_TYPES:
+            return self.post_ndjson(request)
+
         data = request.data
         job_id = data.get('job_id')
         metrics_data = data.get('metrics', [])
+        on_conflict = data.get('on_conflict', 'update')
 
         print(f"DEBUG LOG: Received request for Job ID: {job_id}")
         sys.stdout.flush()
 
         if not job_id or not metrics_data:
             return Response({"error": "Missing job_id or metrics list."}, status=status.HTTP_400_BAD_REQUEST)
-        
-        try:
-            job = IngestionJob.objects.get(id=job_id)
-            print(f"DEBUG LOG: Found existing Ingestion Job: {job_id}. Status: {job.status}")
-        except IngestionJob.DoesNotExist:
-            print(f"DEBUG LOG: IngestionJob {job_id} not found. Creating new one...")
-            job = IngestionJob.objects.create(
-                id=job_id,
-                status='UPLOADED',
-                log_details='Auto-created by BulkMetricCreateView'
-            )
-            print(f"DEBUG LOG: Created new Ingestion Job: {job_id}")
+        if on_conflict not in ON_CONFLICT_CHOICES:
+            return Response({"error": f"on_conflict must be one of {list(ON_CONFLICT_CHOICES)}."}, status=status.HTTP_400_BAD_REQUEST)
 
-        # ------------------------------------------------------------------
-        # HACKATHON BYPASS: Ensure DataSource ID=1 exists
-        # ------------------------------------------------------------------
-        try:
-            ds, _ = DataSource.objects.get_or_create(
-                id=1, 
-                defaults={'name': 'Hackathon Placeholder Source'}
-            )
-            data_source_id = ds.id
-        except Exception as e:
-            print(f"WARNING LOG: DataSource get_or_create failed (non-critical): {e}")
-            sys.stdout.flush()
-            data_source_id = metrics_data[0].get('data_source_id') if metrics_data else None
+        job = self.get_or_create_job(job_id)
+        data_source_id = self.get_data_source_id(fallback=metrics_data[0].get('data_source_id'))
 
-        # 1. Validate data structure
-        serializer = MetricCreateSerializer(data=metrics_data, many=True)
-        if not serializer.is_valid():
-            job.status = 'FAILED'; job.log_details = f"Metrics data validation failed: {serializer.errors}"; job.save()
-            print("ERROR LOG: Metrics serializer failed validation.")
+        # 1. Validate data structure (column-wise, one DataSource query per batch)
+        validated = validate_metric_records(metrics_data)
+        if not validated.is_valid:
+            job.status = 'FAILED'; job.error_message = f"Metrics data validation failed: {validated.errors}"; job.save()
+            print(f"ERROR LOG: Metrics validation failed on {len(validated.errors)} rows.")
             sys.stdout.flush()
-            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
-        
+            return Response(
+                {"error": "Metrics data validation failed.", "errors": validated.errors},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
         # --- CRITICAL FIX: INJECT data_source_id BACK INTO VALIDATED DATA ---
         if not data_source_id:
             data_source_id = metrics_data[0].get('data_source_id', 1)
 
-        for metric_data in serializer.validated_data:
-            metric_data['data_source_id'] = data_source_id
-            
         print("DEBUG LOG: Metrics data validated and data_source_id injected.")
         sys.stdout.flush()
         # ---------------------------------------------------------------------
@@ -76,57 +81,134 @@ class BulkMetricCreateView(APIView):
         # 2. Bulk Create Metrics and Update Job Status
         try:
             with transaction.atomic():
-                metrics_to_create = []
-                for metric_data in serializer.validated_data:
-                    # Build metadata with product if it exists
-                    metadata = {}
-                    if metric_data.get('product'):
-                        metadata['product'] = metric_data['product']
-                    
-                    metric = Metric(
-                        ingestion_job=job,
-                        data_source_id=metric_data['data_source_id'],
-                        name=metric_data['name'],
-                        value=metric_data['value'],
-                        timestamp=metric_data['timestamp'],
-                        metadata=metadata if metadata else None  # Only set if not empty
-                    )
-                    metrics_to_create.append(metric)
-                
-                Metric.objects.bulk_create(metrics_to_create)
-                
+                metrics_to_create = [
+                    build_metric(job, metric_data, data_source_id)
+                    for metric_data in validated.rows()
+                ]
+                result = write_metrics(metrics_to_create, on_conflict=on_conflict)
+
                 # Transition status to the next phase
                 job.status = 'METRICS_CREATED'
+                job.records_processed = len(metrics_to_create)
                 job.save()
-            
-            print(f"DEBUG LOG: Successfully created {len(metrics_to_create)} metrics.")
+
+            print(f"DEBUG LOG: Metrics written: {result.inserted} inserted, {result.updated} updated, {result.skipped} skipped.")
             sys.stdout.flush()
 
         except Exception as e:
-            job.status = 'FAILED'; job.log_details = f"Database error during bulk_create: {e}"; job.save()
+            job.status = 'FAILED'; job.error_message = f"Database error during metric insert: {e}"; job.save()
             print(f"CRITICAL ERROR LOG: Database transaction failed! Error: {e}")
             sys.stdout.flush()
-            raise 
+            raise
 
-        # 3. PHASE C TRIGGER: Initiate Bedrock Analysis
-        print("DEBUG LOG: Starting Bedrock analysis trigger...")
+        # 3. PHASE C TRIGGER: Queue Bedrock Analysis
+        return self.finish(job, result)
+
+    def post_ndjson(self, request):
+        job_id = request.query_params.get('job_id')
+        on_conflict = request.query_params.get('on_conflict', 'update')
+
+        print(f"DEBUG LOG: Received NDJSON stream for Job ID: {job_id}")
         sys.stdout.flush()
-        
+
+        if not job_id:
+            return Response({"error": "Missing job_id query parameter."}, status=status.HTTP_400_BAD_REQUEST)
+        if on_conflict not in ON_CONFLICT_CHOICES:
+            return Response({"error": f"on_conflict must be one of {list(ON_CONFLICT_CHOICES)}."}, status=status.HTTP_400_BAD_REQUEST)
+        if request.stream is None:
+            return Response({"error": "Empty request body."}, status=status.HTTP_400_BAD_REQUEST)
+
+        job = self.get_or_create_job(job_id)
+        data_source_id = self.get_data_source_id()
+
+        job.status = 'RUNNING'
+        job.records_processed = 0
+        job.save(update_fields=['status', 'records_processed'])
+
         try:
-            start_bedrock_analysis(job_id)
-            print("DEBUG LOG: Bedrock analysis triggered successfully.")
+            result = ingest_ndjson(job, request.stream, data_source_id=data_source_id, on_conflict=on_conflict)
+        except IngestError as e:
+            job.refresh_from_db(fields=['records_processed'])
+            job.status = 'FAILED'; job.error_message = str(e); job.save()
+            print(f"ERROR LOG: NDJSON ingest stopped: {e}")
             sys.stdout.flush()
+            return Response({
+                "error": str(e),
+                "line": e.line,
+                "errors": e.errors,
+                "records_processed": job.records_processed,
+            }, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
-            job.status = 'FAILED'; job.log_details = f"start_bedrock_analysis raised an uncaught error: {e}"; job.save()
-            print(f"CRITICAL ERROR LOG: start_bedrock_analysis FAILED! Error: {e}")
+            job.status = 'FAILED'; job.error_message = f"Database error during streaming ingest: {e}"; job.save()
+            print(f"CRITICAL ERROR LOG: Streaming ingest failed! Error: {e}")
             sys.stdout.flush()
-            raise 
+            raise
+
+        if not result.total:
+            job.status = 'FAILED'; job.error_message = "NDJSON stream contained no metrics."; job.save()
+            return Response({"error": "NDJSON stream contained no metrics."}, status=status.HTTP_400_BAD_REQUEST)
+
+        job.status = 'METRICS_CREATED'
+        job.save(update_fields=['status'])
+
+        print(f"DEBUG LOG: Streamed metrics: {result.inserted} inserted, {result.updated} updated, {result.skipped} skipped.")
+        sys.stdout.flush()
+
+        return self.finish(job, result)
+
+    def finish(self, job, result):
+        counts = result.as_dict()
+        counts['records_processed'] = result.total
+        if not (result.inserted or result.updated):
+            # Pure retry of data we already hold: nothing new to analyse.
+            return Response(
+                {"message": f"No new or changed metrics ({result.skipped} skipped). Analysis not queued.", **counts},
+                status=status.HTTP_200_OK
+            )
 
+        task = self.trigger_analysis(job)
         return Response(
-            {"message": f"{len(metrics_to_create)} metrics created. Bedrock analysis triggered."}, 
-            status=status.HTTP_201_CREATED
+            {"message": f"{result.inserted + result.updated} metrics written. Bedrock analysis queued.", "task_id": task.id, **counts},
+            status=status.HTTP_202_ACCEPTED
         )
 
+    def get_or_create_job(self, job_id):
+        try:
+            job = IngestionJob.objects.get(id=job_id)
+            print(f"DEBUG LOG: Found existing Ingestion Job: {job_id}. Status: {job.status}")
+        except IngestionJob.DoesNotExist:
+            print(f"DEBUG LOG: IngestionJob {job_id} not found. Creating new one...")
+            job = IngestionJob.objects.create(
+                id=job_id,
+                data_source_id=self.get_data_source_id(),
+                status='PENDING',
+                error_message='Auto-created by BulkMetricCreateView'
+            )
+            print(f"DEBUG LOG: Created new Ingestion Job: {job_id}")
+        return job
+
+    def get_data_source_id(self, fallback=None):
+        # ------------------------------------------------------------------
+        # HACKATHON BYPASS: Ensure DataSource ID=1 exists
+        # ------------------------------------------------------------------
+        try:
+            ds, _ = DataSource.objects.get_or_create(
+                id=1,
+                defaults={'name': 'Hackathon Placeholder Source'}
+            )
+            return ds.id
+        except Exception as e:
+            print(f"WARNING LOG: DataSource get_or_create failed (non-critical): {e}")
+            sys.stdout.flush()
+            return fallback
+
+    def trigger_analysis(self, job):
+        # Bedrock runs on the task workers, not on this HTTP worker.
+        task = enqueue('services.start_bedrock_analysis', job_id=job.id)
+        print(f"DEBUG LOG: Bedrock analysis queued as task {task.id}.")
+        sys.stdout.flush()
+        return task
+
 
 # --- NEW: Anomaly Ingest View for Lookout for Metrics ---
 class AnomalyIngestView(APIView):
@@ -153,7 +235,7 @@ class AnomalyIngestView(APIView):
             sys.stdout.flush()
             return Response({"error": "DataSource not found."}, status=status.HTTP_404_NOT_FOUND)
 
-        # 2. Create the Insight record with LOOKOUT source
+        # 2. Raise a LOOKOUT alert; repeats of an open one are coalesced into it
         try:
             # Construct a detailed summary/recommendation for the Insight
             summary = (
@@ -166,17 +248,25 @@ class AnomalyIngestView(APIView):
                 "investigation": "Immediately check raw metric data around this timestamp.",
                 "analysis": "Compare trend with previous weeks/months to confirm root cause."
             }
+            # severity_score is a 0-1 confidence; alerts use a 1-10 scale.
+            severity = min(max(round(data.get('severity_score', 0.0) * 10), 1), 10)
 
-            with transaction.atomic():
-                Insight.objects.create(
-                    data_source=data_source,
-                    source='LOOKOUT', # Set the source correctly
-                    title=data['anomaly_title'],
-                    summary=summary,
-                    recommendations=recommendations # Stored as JSON
-                )
+            alert_id, created = raise_alert(
+                data_source,
+                data['metric_name'],
+                severity,
+                title=data['anomaly_title'],
+                summary=summary,
+                recommendations=recommendations, # Stored as JSON
+                source='LOOKOUT', # Set the source correctly
+                details={
+                    "anomaly_title": data['anomaly_title'],
+                    "timestamp": data['timestamp'].isoformat(),
+                    "severity_score": data.get('severity_score', 0.0),
+                },
+            )
                 
-            print("DEBUG LOG: Anomaly Insight created successfully.")
+            print(f"DEBUG LOG: Anomaly {'raised as' if created else 'coalesced into'} alert {alert_id}.")
             sys.stdout.flush()
 
         except Exception as e:
@@ -184,7 +274,9 @@ class AnomalyIngestView(APIView):
             sys.stdout.flush()
             return Response({"error": "Database error saving anomaly insight."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-        return Response({"message": "Anomaly Insight created."}, status=status.HTTP_201_CREATED)
+        if not created:
+            return Response({"message": "Anomaly coalesced into an open alert.", "alert_id": alert_id}, status=status.HTTP_200_OK)
+        return Response({"message": "Anomaly Insight created.", "alert_id": alert_id}, status=status.HTTP_201_CREATED)
     
 class ForecastIngestView(APIView):
     permission_classes = [IsInternalService]
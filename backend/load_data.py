@@ -9,6 +9,7 @@ django.setup()
 
 from core.models import DataSource, IngestionJob
 from services.models import Metric
+from services.ingest import write_metrics
 from django.db import transaction
 from django.contrib.auth import get_user_model
 
@@ -63,9 +64,9 @@ def load_business_data():
         )
         metrics_to_create.append(metric)
 
-    # Bulk create
+    # Bulk insert (COPY on PostgreSQL, batched bulk_create on SQLite)
     with transaction.atomic():
-        Metric.objects.bulk_create(metrics_to_create)
+        write_metrics(metrics_to_create)
         job.status = 'COMPLETED'
         job.save()
 
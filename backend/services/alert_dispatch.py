@@ -0,0 +1,238 @@
+# services/alert_dispatch.py
+"""
+Batched alert delivery.
+
+Creating an alert only inserts a PENDING row and queues one
+"services.dispatch_alerts" task (enqueue_alert_dispatch() skips that when
+one is already waiting or running), so an alert storm never blocks the request or
+ingest transaction that raised it. The task drains due alerts in batches:
+
+* a batch is claimed as SENDING with a lease, using SKIP LOCKED where the
+  database has it, so several workers can drain side by side;
+* claimed alerts are grouped by (recipient, channel) and each group goes
+  out as ONE message through the configured transport;
+* each recipient/channel may receive ALERT_RATE_LIMIT messages per
+  window; groups over the limit are deferred to the next window;
+* failed groups retry with exponential backoff until ALERT_MAX_ATTEMPTS;
+* outcomes are written with bulk UPDATEs, not per-alert saves.
+
+Transports: SNSTransport (SMS straight to the phone number, EMAIL/PUSH
+through ALERT_SNS_TOPIC_ARN) and FileTransport, a JSON-lines stand-in
+for local development.
+"""
+import json
+import sys
+import uuid
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from core.aws_clients import get_client
+from core.models import Task
+from core.queue import enqueue
+
+from .models import Alert
+
+DISPATCH_TASK = "services.dispatch_alerts"
+
+
+# --- Transports ---
+
+class FileTransport:
+    """Append each message as a JSON line to `path` (local stand-in for SNS/SMTP)."""
+
+    def __init__(self, path=None):
+        self.path = path or settings.ALERT_FILE_PATH
+
+    def send(self, channel, recipient, subject, body):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({
+                'channel': channel, 'recipient': recipient, 'subject': subject, 'body': body,
+                'sent_at': timezone.now().isoformat(),
+            }) + '\n')
+
+
+class SNSTransport:
+    def __init__(self, client=None, topic_arn=None):
+        self.client = client or get_client('sns')
+        self.topic_arn = topic_arn or settings.ALERT_SNS_TOPIC_ARN
+
+    def send(self, channel, recipient, subject, body):
+        if channel == 'SMS':
+            self.client.publish(PhoneNumber=recipient, Message=f"{subject}\n{body}"[:1600])
+            return
+        if not self.topic_arn:
+            raise RuntimeError("ALERT_SNS_TOPIC_ARN is not configured")
+        self.client.publish(
+            TopicArn=self.topic_arn,
+            Subject=subject[:100],
+            Message=body,
+            MessageAttributes={
+                'recipient': {'DataType': 'String', 'StringValue': recipient},
+                'channel': {'DataType': 'String', 'StringValue': channel},
+            },
+        )
+
+
+TRANSPORTS = {'file': FileTransport, 'sns': SNSTransport}
+
+
+def get_transport():
+    return TRANSPORTS[settings.ALERT_TRANSPORT]()
+
+
+# --- Scheduling ---
+
+def enqueue_alert_dispatch():
+    """
+    Queue a dispatch run unless one is already waiting or running; a running
+    dispatch keeps claiming until no alert is due, so it takes new ones too.
+    A waiting run parked until a deferred or retrying alert is due is
+    brought forward instead, so new alerts do not wait behind it.
+    """
+    now = timezone.now()
+    active = Task.objects.filter(name=DISPATCH_TASK, status__in=("PENDING", "RUNNING"))
+    if active.exists():
+        active.filter(status="PENDING", run_after__gt=now).update(run_after=now)
+        return
+    enqueue(DISPATCH_TASK)
+
+
+def _due(now):
+    # Pending alerts that are due, plus SENDING alerts whose dispatcher lost its lease.
+    return (
+        Q(status='PENDING') & (Q(next_attempt_at__isnull=True) | Q(next_attempt_at__lte=now))
+        | Q(status='SENDING', next_attempt_at__lt=now)
+    )
+
+
+def claim_alerts(token, limit, now=None):
+    """Lease up to `limit` due alerts to `token`; returns how many were claimed."""
+    now = now or timezone.now()
+    lease = {
+        'status': 'SENDING',
+        'claimed_by': token,
+        'next_attempt_at': now + timedelta(seconds=settings.ALERT_LEASE_SECONDS),
+    }
+    candidates = Alert.objects.filter(_due(now)).order_by('-severity', 'timestamp', 'id')
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            ids = list(candidates.select_for_update(skip_locked=True).values_list('id', flat=True)[:limit])
+            return Alert.objects.filter(id__in=ids).update(**lease)
+    # SQLite serialises writers, so re-checking the predicate in the UPDATE is enough.
+    ids = list(candidates.values_list('id', flat=True)[:limit])
+    return Alert.objects.filter(_due(now), id__in=ids).update(**lease)
+
+
+# --- Delivery ---
+
+def rate_limit_allows(channel, recipient, now):
+    """Count one message against the recipient's window; False once the limit is reached."""
+    window = settings.ALERT_RATE_LIMIT_WINDOW_SECONDS
+    key = f"alert-rate:{channel}:{recipient}:{int(now.timestamp()) // window}"
+    cache.add(key, 0, timeout=window)
+    try:
+        return cache.incr(key) <= settings.ALERT_RATE_LIMIT
+    except ValueError:   # evicted between add() and incr()
+        cache.set(key, 1, timeout=window)
+        return True
+
+
+def rate_window_end(now):
+    window = settings.ALERT_RATE_LIMIT_WINDOW_SECONDS
+    return now + timedelta(seconds=window - int(now.timestamp()) % window)
+
+
+def backoff(attempts):
+    return min(
+        settings.ALERT_RETRY_BACKOFF_SECONDS * 2 ** max(attempts - 1, 0),
+        settings.ALERT_RETRY_BACKOFF_MAX_SECONDS,
+    )
+
+
+def compose(alerts):
+    """Subject and body of one message covering `alerts` (highest severity first)."""
+    top = alerts[0]
+    if len(alerts) == 1:
+        subject = f"[BizPulse] {top.insight.title} (severity {top.severity})"
+    else:
+        subject = f"[BizPulse] {len(alerts)} alerts, highest severity {top.severity}"
+    lines = [f"- [severity {alert.severity}] {alert.insight.title}: {alert.insight.summary[:300]}" for alert in alerts]
+    return subject, "\n".join(lines)
+
+
+def deliver_claimed(token, transport, now=None):
+    """Send every alert leased to `token` and record the outcomes. Returns counts."""
+    now = now or timezone.now()
+    claimed = Alert.objects.filter(claimed_by=token, status='SENDING').select_related('insight')
+    counts = {'sent': 0, 'deferred': 0, 'retrying': 0, 'failed': 0}
+
+    groups = OrderedDict()
+    for alert in claimed.order_by('-severity', 'timestamp', 'id'):
+        groups.setdefault((alert.recipient or '', alert.type), []).append(alert)
+
+    sent_ids = []
+    for (recipient, channel), alerts in groups.items():
+        ids = [alert.id for alert in alerts]
+        mine = Alert.objects.filter(id__in=ids, claimed_by=token)
+        if not recipient:
+            counts['failed'] += mine.update(status='FAILED', claimed_by=None, next_attempt_at=None,
+                                            last_error="Alert has no recipient.")
+            continue
+        if not rate_limit_allows(channel, recipient, now):
+            # Not a failure: wait for the recipient's next window.
+            counts['deferred'] += mine.update(status='PENDING', claimed_by=None, next_attempt_at=rate_window_end(now))
+            continue
+        try:
+            transport.send(channel, recipient, *compose(alerts))
+        except Exception as e:
+            print(f"DEBUG LOG: Alert delivery to {recipient} via {channel} failed: {e}")
+            sys.stdout.flush()
+            error = f"{type(e).__name__}: {e}"
+            attempts = max(alert.attempts for alert in alerts) + 1
+            if attempts >= settings.ALERT_MAX_ATTEMPTS:
+                counts['failed'] += mine.update(status='FAILED', attempts=F('attempts') + 1, claimed_by=None,
+                                                next_attempt_at=None, last_error=error)
+            else:
+                counts['retrying'] += mine.update(status='PENDING', attempts=F('attempts') + 1, claimed_by=None,
+                                                  next_attempt_at=now + timedelta(seconds=backoff(attempts)),
+                                                  last_error=error)
+            continue
+        sent_ids.extend(ids)
+
+    if sent_ids:
+        counts['sent'] = Alert.objects.filter(id__in=sent_ids, claimed_by=token).update(
+            status='SENT', sent=True, sent_at=now, attempts=F('attempts') + 1,
+            claimed_by=None, next_attempt_at=None, last_error=None,
+        )
+    return counts
+
+
+def dispatch_alerts(transport=None, batch_size=None, max_batches=None):
+    """
+    Drain due alerts batch by batch. Returns summed counts plus `next_due`,
+    the earliest datetime a deferred or retrying alert becomes due (or None).
+    """
+    transport = transport or get_transport()
+    batch_size = batch_size or settings.ALERT_DISPATCH_BATCH_SIZE
+    totals = {'sent': 0, 'deferred': 0, 'retrying': 0, 'failed': 0}
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        token = uuid.uuid4().hex
+        if not claim_alerts(token, batch_size):
+            break
+        for key, value in deliver_claimed(token, transport).items():
+            totals[key] += value
+        batches += 1
+
+    next_due = (
+        Alert.objects.filter(status='PENDING', next_attempt_at__isnull=False)
+        .order_by('next_attempt_at').values_list('next_attempt_at', flat=True).first()
+    )
+    totals['next_due'] = next_due
+    return totals
@@ -0,0 +1,178 @@
+# services/alerts.py
+"""
+Alert workflow state and set-based bulk actions.
+
+An alert moves OPEN -> ACKNOWLEDGED -> DISMISSED -> ARCHIVED (any later
+state may be reached directly). Actions run as a single UPDATE over
+whatever alerts a queryset selects, so acknowledging 100k alerts after an
+incident is one statement rather than 100k saves:
+
+    alerts = select_alerts(min_severity=8, states=['OPEN'])
+    apply_alert_action(alerts, 'acknowledge', request.user)
+    # {'matched': 1200, 'updated': 1200, 'skipped': 0}
+
+New alerts should be raised with raise_alert(), which coalesces repeats:
+an event with the same (data source, metric) as an OPEN alert last seen
+within ALERT_COALESCE_WINDOW_SECONDS bumps that alert's occurrences and
+last_seen_at instead of inserting another Insight and Alert. An event in
+a higher severity band raises the alert's severity and queues its
+notification again, so an escalation is not swallowed. Open keys are
+indexed in the cache, so the hot path is one cache get plus one
+conditional UPDATE.
+"""
+import hashlib
+from collections import namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, F, Q, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .alert_dispatch import enqueue_alert_dispatch
+from .models import Alert, Insight
+
+Transition = namedtuple('Transition', 'from_states state stamp_field actor_field')
+
+ALERT_ACTIONS = {
+    'acknowledge': Transition(('OPEN',), 'ACKNOWLEDGED', 'acknowledged_at', 'acknowledged_by'),
+    'dismiss': Transition(('OPEN', 'ACKNOWLEDGED'), 'DISMISSED', 'dismissed_at', 'dismissed_by'),
+    'archive': Transition(('OPEN', 'ACKNOWLEDGED', 'DISMISSED'), 'ARCHIVED', 'archived_at', None),
+}
+ALERT_STATES = [state for state, _ in Alert.STATE_CHOICES]
+DELIVERY_STATUSES = [status for status, _ in Alert._meta.get_field('status').choices]
+
+
+def select_alerts(ids=None, min_severity=None, max_severity=None, data_source_id=None,
+                  start=None, end=None, states=None, statuses=None):
+    """Alerts matching every given criterion; `end` is exclusive."""
+    alerts = Alert.objects.all()
+    if ids is not None:
+        alerts = alerts.filter(id__in=ids)
+    if min_severity is not None:
+        alerts = alerts.filter(severity__gte=min_severity)
+    if max_severity is not None:
+        alerts = alerts.filter(severity__lte=max_severity)
+    if data_source_id is not None:
+        alerts = alerts.filter(insight__data_source_id=data_source_id)
+    if start is not None:
+        alerts = alerts.filter(timestamp__gte=start)
+    if end is not None:
+        alerts = alerts.filter(timestamp__lt=end)
+    if states:
+        alerts = alerts.filter(state__in=states)
+    if statuses:
+        alerts = alerts.filter(status__in=statuses)
+    return alerts
+
+
+def apply_alert_action(alerts, action, user=None, now=None):
+    """
+    Apply `action` to the alerts selected by `alerts` with one UPDATE.
+    Alerts whose state the action does not apply to (e.g. acknowledging a
+    dismissed alert) are left alone and reported as skipped. No rows are
+    loaded: returns {'matched', 'updated', 'skipped'} counts.
+    """
+    transition = ALERT_ACTIONS[action]
+    changes = {'state': transition.state, transition.stamp_field: now or timezone.now()}
+    if transition.actor_field:
+        changes[transition.actor_field] = user if user is not None and user.is_authenticated else None
+
+    matched = alerts.count()
+    updated = alerts.filter(state__in=transition.from_states).update(**changes) if matched else 0
+    return {'matched': matched, 'updated': updated, 'skipped': matched - updated}
+
+
+# --- Coalescing ---
+
+# (lowest severity, band); severities run from 1 (low) to 10 (critical).
+SEVERITY_BANDS = ((9, 'critical'), (7, 'high'), (4, 'medium'), (1, 'low'))
+
+
+def severity_floor(severity):
+    """Lowest severity in `severity`'s band."""
+    for floor, _ in SEVERITY_BANDS:
+        if severity >= floor:
+            return floor
+    return SEVERITY_BANDS[-1][0]
+
+
+def coalesce_key(data_source_id, metric_name):
+    return f"{data_source_id}:{metric_name}"[:255]
+
+
+def _cache_key(key):
+    # Hashed: metric names may hold spaces or be longer than cache backends allow.
+    return f"alert-open:{hashlib.sha1(key.encode()).hexdigest()}"
+
+
+def _bump(alert_id, severity, details, now, cutoff, escalates):
+    """
+    Fold one occurrence into an open alert still inside its window; False if
+    it no longer qualifies. When `escalates` and the event is in a higher
+    band than the alert, the alert takes the event's severity and a
+    notification that already went out (or gave up) is queued again.
+    """
+    alerts = Alert.objects.filter(id=alert_id, state='OPEN', last_seen_at__gte=cutoff)
+    changes = {'occurrences': F('occurrences') + 1, 'last_seen_at': now, 'severity': Greatest('severity', severity)}
+    if details is not None:
+        changes['details_json'] = details
+    if escalates:
+        delivered = Q(status__in=('SENT', 'FAILED'))
+        escalated = alerts.filter(severity__lt=severity_floor(severity)).update(
+            **changes,
+            status=Case(When(delivered, then=Value('PENDING')), default=F('status')),
+            attempts=Case(When(delivered, then=Value(0)), default=F('attempts')),
+        )
+        if escalated:
+            transaction.on_commit(enqueue_alert_dispatch)
+            return True
+    return bool(alerts.update(**changes))
+
+
+def _fold(key, alert_id, known_severity, severity, details, now, cutoff, window):
+    """_bump() an alert last known at `known_severity`, and index it in the cache when that worked."""
+    if not _bump(alert_id, severity, details, now, cutoff, escalates=known_severity < severity_floor(severity)):
+        return False
+    cache.set(_cache_key(key), (alert_id, max(known_severity, severity)), timeout=window)
+    return True
+
+
+def raise_alert(data_source, metric_name, severity, title, summary, recommendations=None,
+                source='BEDROCK', channel='EMAIL', recipient=None, details=None, now=None):
+    """
+    Record an alert-worthy event. Returns (alert_id, created): created is
+    False when the event was folded into an existing open alert, in which
+    case no Insight is written and a notification is only queued again if
+    the event raised the alert into a higher severity band.
+    """
+    now = now or timezone.now()
+    window = settings.ALERT_COALESCE_WINDOW_SECONDS
+    cutoff = now - timedelta(seconds=window)
+    key = coalesce_key(data_source.id, metric_name)
+
+    cached = cache.get(_cache_key(key))   # (alert id, severity)
+    if cached is not None and _fold(key, *cached, severity, details, now, cutoff, window):
+        return cached[0], False
+
+    # Cache miss (restart, eviction, another process): the indexed lookup is authoritative.
+    row = (
+        Alert.objects.filter(coalesce_key=key, state='OPEN', last_seen_at__gte=cutoff)
+        .order_by('-last_seen_at').values_list('id', 'severity').first()
+    )
+    if row is not None and _fold(key, *row, severity, details, now, cutoff, window):
+        return row[0], False
+
+    with transaction.atomic():
+        insight = Insight.objects.create(
+            data_source=data_source, source=source, title=title, summary=summary, recommendations=recommendations,
+        )
+        alert = Alert.objects.create(
+            insight=insight, type=channel, recipient=recipient or settings.ALERT_DEFAULT_RECIPIENT,
+            severity=severity, details_json=details, coalesce_key=key, last_seen_at=now,
+        )
+        transaction.on_commit(enqueue_alert_dispatch)
+    cache.set(_cache_key(key), (alert.id, severity), timeout=window)
+    return alert.id, True
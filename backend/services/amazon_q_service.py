@@ -1,8 +1,9 @@
 # services/amazon_q_service.py
-import boto3
 import os
 import json
 
+from core.aws_clients import get_client
+
 class BizPulseAmazonQService:
     def __init__(self):
         self.app_id = os.getenv('AMAZON_Q_APP_ID')
@@ -11,7 +12,7 @@ class BizPulseAmazonQService:
         if not self.app_id:
             raise ValueError("AMAZON_Q_APP_ID environment variable is not set")
             
-        self.client = boto3.client('qbusiness', region_name=self.region)
+        self.client = get_client('qbusiness', self.region)
     
     def ask_question(self, question):
         """
@@ -55,7 +56,7 @@ class BizPulseAmazonQService:
         except Exception as e:
             return self._create_error_response(question, str(e))
     
-    def get_business_recommendations(self):
+    def get_business_recommendations(self, business_context=None):
         """Proactive business recommendations"""
         prompt = """
         Based on the business data available, provide 3 specific, actionable recommendations 
@@ -66,9 +67,9 @@ class BizPulseAmazonQService:
         Format as JSON with title, description, and expected impact.
         """
         
-        return self.ask_business_question(prompt)
+        return self.ask_business_question(prompt, business_context)
     
-    def analyze_business_health(self):
+    def analyze_business_health(self, business_context=None):
         """Generate business health assessment"""
         prompt = """
         Analyze the business data and provide a health assessment covering:
@@ -79,7 +80,7 @@ class BizPulseAmazonQService:
         Rate each category 1-10 and provide overall score.
         """
         
-        return self.ask_business_question(prompt)
+        return self.ask_business_question(prompt, business_context)
     
     def _enhance_question(self, question, context):
         """Add business context to improve answers"""
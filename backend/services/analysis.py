@@ -1,30 +1,84 @@
-import os
-import json
-import time
-import boto3 
+from botocore.exceptions import (
+    ClientError, ConnectionClosedError, ConnectionError as BotoConnectionError, ReadTimeoutError,
+)
+from django.conf import settings
 from django.db import transaction
-from django.db.models import Avg, Max
+from core.ai_service import invoke_claude, parse_json_response
+from core.queue import heartbeat
+from services.digest import build_digest, digest_prompt
 from services.models import IngestionJob, Insight, Metric
 import sys 
 
-# --- Setup Boto3 Client ---
-REGION = os.environ.get('AWS_REGION_NAME', 'us-east-1')
+# Bedrock failures worth another attempt: throttling and other service errors, timeouts, connection errors.
+THROTTLING_CODES = ('ThrottlingException', 'TooManyRequestsException', 'ServiceUnavailableException')
+TRANSIENT_CODES = THROTTLING_CODES + ('InternalServerException', 'ModelTimeoutException')
+# Connect timeouts and endpoint errors are BotoConnectionErrors.
+TRANSIENT_ERRORS = (BotoConnectionError, ConnectionClosedError, ReadTimeoutError)
 
-def get_bedrock_client():
-    return boto3.client(
-        service_name='bedrock-runtime',
-        region_name=REGION
+
+def _error_code(error):
+    return error.response.get('Error', {}).get('Code') if isinstance(error, ClientError) else None
+
+
+def is_throttling(error):
+    return _error_code(error) in THROTTLING_CODES
+
+
+def is_transient(error):
+    """True for a Bedrock error worth retrying; access, validation and missing-model errors are not."""
+    return isinstance(error, TRANSIENT_ERRORS) or _error_code(error) in TRANSIENT_CODES
+
+# --- Prompt and result helpers (shared with services.batch_analysis) ---
+
+def analysis_prompt(job):
+    """
+    (prompt, digest) for a job's metrics, read in one streamed query; the
+    prompt is None when the job has no metrics.
+    """
+    metrics = Metric.objects.filter(ingestion_job=job).order_by('timestamp')
+    digest = build_digest(
+        metrics,
+        max_metrics=settings.ANALYSIS_DIGEST_MAX_METRICS,
+        max_dimensions=settings.ANALYSIS_DIGEST_MAX_DIMENSIONS,
     )
+    if not digest['total_points']:
+        return None, digest
+
+    prompt = f"""
+    Analyze the following key performance metrics for the {job.data_source.name} data source.
+    Per-metric statistics (count, min, max, mean, std, trend_per_day = least-squares slope,
+    top/bottom = dimension totals), as JSON:
+    {digest_prompt(digest, settings.ANALYSIS_PROMPT_MAX_CHARS)}
+
+    Based on this data, provide a two-sentence narrative business insight and a short recommendation.
+    Format your response STRICTLY as a JSON object with keys: "title", "summary", and "recommendation".
+    """
+    return prompt, digest
+
+
+def insight_from_output(data_source, llm_output):
+    """Unsaved Insight from the model's parsed JSON reply."""
+    return Insight(
+        data_source=data_source,
+        title=llm_output.get('title', "Bedrock Analysis Error"),
+        summary=llm_output.get('summary', "Could not parse analysis summary."),
+        recommendations=llm_output.get('recommendation', "No recommendation provided.")
+    )
+
 
 # --- Service Function to Start Bedrock Interaction ---
 
-def start_bedrock_analysis(job_id: int):
+def start_bedrock_analysis(job_id: int, final_attempt=True):
     """
     Triggers the actual Bedrock analysis after metrics are saved.
+
+    Transient Bedrock errors (is_transient) are re-raised so the task
+    queue retries them with backoff; the job is marked FAILED only on the
+    final attempt, or at once for permanent errors (e.g. an unparseable reply).
     """
     # 1. Update job status immediately (decoupling)
     try:
-        job = IngestionJob.objects.get(id=job_id)
+        job = IngestionJob.objects.select_related('data_source').get(id=job_id)
         job.status = 'ANALYSIS_KICKED_OFF'
         job.save()
         print(f"BEDROCK LOG: Job {job_id} status updated to ANALYSIS_KICKED_OFF")
@@ -34,113 +88,47 @@ def start_bedrock_analysis(job_id: int):
         sys.stdout.flush()
         return
 
-    # 2. Get data for the prompt
-    metrics = Metric.objects.filter(ingestion_job=job).order_by('timestamp')
-    if not metrics.exists():
-        job.status = 'FAILED'; job.log_details = "Analysis failed: No metrics found for job."; job.save()
+    # 2-3. Digest the job's metrics in one streamed pass and build the prompt
+    prompt, digest = analysis_prompt(job)
+    if prompt is None:
+        job.status = 'FAILED'; job.error_message = "Analysis failed: No metrics found for job."; job.save()
         print("BEDROCK LOG: No metrics found, exiting analysis.")
         sys.stdout.flush()
         return
-        
-    # Check for DataSource existence before accessing
-    if not metrics.first().data_source:
-        job.status = 'FAILED'; job.log_details = "Analysis failed: Metric has no data_source."; job.save()
-        print("BEDROCK LOG: Metric is missing a data_source relation, exiting analysis.")
-        sys.stdout.flush()
-        return
 
-    data_source = metrics.first().data_source
-    summary_stats = metrics.aggregate(
-        avg_value=Avg('value'),
-        max_value=Max('value')
-    )
-    
-    print("BEDROCK LOG: Data aggregation successful. Starting prompt construction.")
+    data_source = job.data_source
+    print(f"BEDROCK LOG: Digested {digest['total_points']} points across {digest['metric_count']} metrics. Prompt constructed.")
     sys.stdout.flush()
 
-    # 3. Construct the prompt for the LLM
-    prompt_data = {
-        "data_source_name": data_source.name,
-        "max_value": f"{summary_stats['max_value']:.2f}" if summary_stats['max_value'] is not None else "N/A",
-        "avg_value": f"{summary_stats['avg_value']:.2f}" if summary_stats['avg_value'] is not None else "N/A",
-        "sample_metrics": [
-            {'name': m.name, 'value': m.value, 'timestamp': str(m.timestamp)} 
-            for m in metrics[:5]
-        ]
-    }
-
-    prompt = f"""
-    Analyze the following key performance metrics for the {prompt_data['data_source_name']} data source:
-    Maximum Value: {prompt_data['max_value']}
-    Average Value: {prompt_data['avg_value']}
-    
-    Sample Data Points: {prompt_data['sample_metrics']}
-
-    Based on this data, provide a two-sentence narrative business insight and a short recommendation.
-    Format your response STRICTLY as a JSON object with keys: "title", "summary", and "recommendation".
-    """
-    
-    # 4. Call Bedrock API
+    # 4. Call Bedrock API (answered from the LLM cache when this digest was analysed before)
+    heartbeat()   # the digest may have taken a while; keep the task's lease for the call
     try:
-        bedrock_client = get_bedrock_client()
-        
-        model_id = 'anthropic.claude-3-haiku-20240307-v1:0' 
-        
-        # --- CRITICAL FIX: Use Messages API format for Claude 3 ---
-        body = json.dumps({
-            "anthropic_version": "bedrock-2023-05-31",
-            "messages": [
-                {
-                    "role": "user",
-                    "content": [{"type": "text", "text": prompt}] # Use the constructed prompt
-                }
-            ],
-            "max_tokens": 1024, # Note: Changed from max_tokens_to_sample
-            "temperature": 0.5,
-        })
-        # -------------------------------------------------------------
-        
-        response = bedrock_client.invoke_model(
-            modelId=model_id,
-            contentType='application/json',
-            accept='application/json',
-            body=body
-        )
-        
-        # --- CRITICAL FIX: Update response parsing for Messages API ---
-        response_body = response.get('body').read().decode('utf-8')
-        response_json = json.loads(response_body)
-        
-        # Get the first text block from the response content array
-        insight_text = response_json.get('content', [{}])[0].get('text', '').strip()
-        # -------------------------------------------------------------
-        
-        if insight_text.startswith("```json"):
-            insight_text = insight_text.replace("```json", "").replace("```", "").strip()
-        
-        llm_output = json.loads(insight_text)
+        llm_output = invoke_claude(prompt, parse=parse_json_response)
         print("BEDROCK LOG: LLM call and JSON parsing successful.")
         sys.stdout.flush()
 
     except Exception as e:
-        job.status = 'FAILED'; job.log_details = f"Bedrock API call or JSON parsing failed: {e}"; job.save()
+        if is_transient(e) and not final_attempt:
+            job.error_message = f"Bedrock API call failed, will retry: {e}"; job.save()
+            print(f"BEDROCK LOG: Transient Bedrock error for job {job_id}, retrying. Error: {e}")
+            sys.stdout.flush()
+            raise
+        job.status = 'FAILED'; job.error_message = f"Bedrock API call or JSON parsing failed: {e}"; job.save()
         print(f"CRITICAL BEDROCK ERROR: Bedrock call failed. Error: {e}")
         sys.stdout.flush()
+        if is_transient(e):
+            raise   # out of attempts: let the task record the failure too
         return
 
     # 5. Save the resulting Insight (Database Transaction)
     with transaction.atomic():
-        insight = Insight.objects.create(
-            data_source=data_source,
-            title=llm_output.get('title', "Bedrock Analysis Error"),
-            summary=llm_output.get('summary', "Could not parse analysis summary."),
-            recommendations=llm_output.get('recommendation', "No recommendation provided.")
-        )
-
-        metrics.update(insight=insight)
+        insight = insight_from_output(data_source, llm_output)
+        insight.save()
+
+        Metric.objects.filter(ingestion_job=job).update(insight=insight)
         
         job.status = 'COMPLETED'
-        job.log_details = f"Analysis complete via Bedrock. Insight ID {insight.id} created."
+        job.error_message = f"Analysis complete via Bedrock. Insight ID {insight.id} created."
         job.save()
 
     print("BEDROCK LOG: Insight saved and job marked COMPLETED.")
@@ -0,0 +1,211 @@
+# services/batch_analysis.py
+"""
+Bedrock analysis for many ingestion jobs at once.
+
+start_bedrock_analysis() analyses one job per task, so after a backfill
+hundreds of jobs wait on one Bedrock call after another. run_batch_analysis()
+analyses a whole set of jobs:
+
+* prompts are built (and LLM-cache hits answered) on the calling thread;
+* the remaining Bedrock calls run in a pool of BATCH_ANALYSIS_WORKERS
+  threads, which only make network calls and never touch the database;
+* every call first takes a request and its estimated tokens from a shared
+  BedrockLimiter, a pair of token buckets sized to the account's
+  requests/minute and tokens/minute quotas, so the pool stays under quota
+  instead of hammering into throttling;
+* a throttled call backs off exponentially and retries;
+* results are written in one transaction: bulk-created Insights, one
+  UPDATE linking every job's metrics, one UPDATE per job outcome.
+
+It returns throughput and queueing figures: how long calls waited between
+submission and leaving the limiter, and how long Bedrock took.
+"""
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, IntegerField, Value, When
+
+from core import llm_cache
+from core.ai_service import CLAUDE_MODEL_ID, call_claude, get_bedrock_client, parse_json_response
+from core.models import IngestionJob
+
+from .analysis import analysis_prompt, insight_from_output, is_throttling
+from .models import Insight, Metric
+
+TEMPERATURE = 0.5
+MAX_TOKENS = 1024
+
+
+# --- Rate limiting ---
+
+class TokenBucket:
+    """Holds up to `capacity` tokens, refilled at `rate_per_minute`; take() blocks until enough are available."""
+
+    def __init__(self, rate_per_minute, capacity=None, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or rate_per_minute
+        self.tokens = float(self.capacity)
+        self.clock = clock
+        self.sleep = sleep
+        self.updated = clock()
+        self.lock = threading.Lock()
+
+    def take(self, amount=1):
+        """Remove `amount` tokens (at most the capacity), waiting as needed. Returns seconds waited."""
+        amount = min(amount, self.capacity)
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = self.clock()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return waited
+                delay = (amount - self.tokens) / self.rate
+            self.sleep(delay)
+            waited += delay
+
+
+class BedrockLimiter:
+    """Requests/minute and tokens/minute quotas, shared by every worker of a batch."""
+
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None, clock=time.monotonic, sleep=time.sleep):
+        self.requests = TokenBucket(requests_per_minute or settings.BEDROCK_REQUESTS_PER_MINUTE, clock=clock, sleep=sleep)
+        self.tokens = TokenBucket(tokens_per_minute or settings.BEDROCK_TOKENS_PER_MINUTE, clock=clock, sleep=sleep)
+
+    def acquire(self, tokens):
+        return self.requests.take(1) + self.tokens.take(tokens)
+
+
+def estimate_tokens(prompt, max_tokens=MAX_TOKENS):
+    # Bedrock counts the input (~4 characters a token) plus the reserved max_tokens against the quota.
+    return len(prompt) // 4 + max_tokens
+
+
+# --- Runner ---
+
+def _invoke(client, limiter, prompt, submitted, clock, sleep):
+    """Worker: wait for quota, call Bedrock, retry throttling. Returns (text, queued, call_seconds, retries)."""
+    retries = 0
+    queued = 0.0
+    while True:
+        limiter.acquire(estimate_tokens(prompt))
+        started = clock()
+        if not retries:
+            queued = started - submitted
+        try:
+            text = call_claude(client, prompt, CLAUDE_MODEL_ID, TEMPERATURE, MAX_TOKENS)
+            return text, queued, clock() - started, retries
+        except Exception as e:
+            if not is_throttling(e) or retries >= settings.BEDROCK_THROTTLE_RETRIES:
+                raise
+            retries += 1
+            sleep(settings.BEDROCK_THROTTLE_BACKOFF_SECONDS * 2 ** (retries - 1))
+
+
+def _percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(int(fraction * len(values)), len(values) - 1)], 4)
+
+
+def select_jobs(job_ids=None, data_source_ids=None):
+    """Jobs to analyse: the given ids, plus every not yet completed job of the given data sources."""
+    jobs = IngestionJob.objects.select_related('data_source')
+    if job_ids and data_source_ids:
+        return jobs.filter(id__in=job_ids) | jobs.filter(data_source_id__in=data_source_ids).exclude(status='COMPLETED')
+    if data_source_ids:
+        return jobs.filter(data_source_id__in=data_source_ids).exclude(status='COMPLETED')
+    return jobs.filter(id__in=job_ids or [])
+
+
+def run_batch_analysis(job_ids=None, data_source_ids=None, workers=None, client=None, limiter=None,
+                       clock=time.monotonic, sleep=time.sleep):
+    """
+    Analyse the selected jobs with bounded concurrency. Returns counts
+    (jobs, completed, failed, cached, throttle_retries) and timings:
+    elapsed seconds, jobs per minute, and p50/p95/max of queue wait and of
+    Bedrock call time, in seconds.
+    """
+    workers = workers or settings.BATCH_ANALYSIS_WORKERS
+    client = client or get_bedrock_client()
+    limiter = limiter or BedrockLimiter(clock=clock, sleep=sleep)
+    started = clock()
+
+    jobs = {job.id: job for job in select_jobs(job_ids, data_source_ids)}
+    IngestionJob.objects.filter(id__in=list(jobs)).update(status='ANALYSIS_KICKED_OFF')
+
+    outputs, failed, prompts = {}, {}, {}
+    cached = 0
+    for job in jobs.values():
+        prompt, _ = analysis_prompt(job)
+        if prompt is None:
+            failed[job.id] = "No metrics found for job."
+            continue
+        hit = llm_cache.get(CLAUDE_MODEL_ID, prompt, TEMPERATURE, MAX_TOKENS)
+        if hit is not None:
+            try:
+                outputs[job.id] = parse_json_response(hit)
+                cached += 1
+                continue
+            except ValueError:
+                llm_cache.forget(CLAUDE_MODEL_ID, prompt, TEMPERATURE, MAX_TOKENS)
+        prompts[job.id] = prompt
+
+    queued, call_seconds = [], []
+    throttle_retries = 0
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bedrock-batch') as pool:
+        futures = {
+            pool.submit(_invoke, client, limiter, prompt, clock(), clock, sleep): job_id
+            for job_id, prompt in prompts.items()
+        }
+        for future in as_completed(futures):
+            job_id = futures[future]
+            try:
+                text, wait, seconds, retries = future.result()
+                throttle_retries += retries
+                queued.append(wait)
+                call_seconds.append(seconds)
+                outputs[job_id] = parse_json_response(text)
+                llm_cache.put(CLAUDE_MODEL_ID, prompts[job_id], TEMPERATURE, MAX_TOKENS, text)
+            except Exception as e:
+                print(f"CRITICAL BEDROCK ERROR: Batch analysis of job {job_id} failed. Error: {e}")
+                sys.stdout.flush()
+                failed[job_id] = f"Bedrock API call or JSON parsing failed: {e}"
+
+    with transaction.atomic():
+        insights = Insight.objects.bulk_create([
+            insight_from_output(jobs[job_id].data_source, output) for job_id, output in outputs.items()
+        ])
+        links = [When(ingestion_job_id=job_id, then=Value(insight.id)) for job_id, insight in zip(outputs, insights)]
+        if links:
+            Metric.objects.filter(ingestion_job_id__in=list(outputs)).update(
+                insight_id=Case(*links, output_field=IntegerField())
+            )
+        IngestionJob.objects.filter(id__in=list(outputs)).update(status='COMPLETED')
+        IngestionJob.objects.filter(id__in=list(failed)).update(status='FAILED')
+
+    elapsed = clock() - started
+    report = {
+        'jobs': len(jobs),
+        'completed': len(outputs),
+        'failed': len(failed),
+        'cached': cached,
+        'throttle_retries': throttle_retries,
+        'elapsed_seconds': round(elapsed, 3),
+        'jobs_per_minute': round(len(outputs) / elapsed * 60, 1) if elapsed else None,
+        'queue_wait_p50': _percentile(queued, 0.5),
+        'queue_wait_p95': _percentile(queued, 0.95),
+        'queue_wait_max': _percentile(queued, 1.0),
+        'call_p50': _percentile(call_seconds, 0.5),
+        'call_p95': _percentile(call_seconds, 0.95),
+    }
+    print(f"BEDROCK LOG: Batch analysis finished: {report}")
+    sys.stdout.flush()
+    return report
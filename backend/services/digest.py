@@ -0,0 +1,181 @@
+# services/digest.py
+"""
+Single-pass statistical digest of a metric queryset, for LLM prompts.
+
+build_digest() streams (name, value, timestamp, dimension) rows once with
+iterator() and folds each chunk into per-metric accumulators with NumPy
+(bincount / ufunc.at), so memory stays flat however large the job is:
+
+* count, min, max, mean and standard deviation per metric name;
+* trend slope (value units per day) from a least-squares fit on time;
+* per-dimension totals, reported as the top and bottom few.
+
+Sums are taken around each metric's first value and time is measured from
+the first row, which keeps the one-pass variance and slope numerically
+stable. digest_prompt() renders the digest as compact JSON capped at
+MAX_PROMPT_CHARS by dropping the smallest metrics first.
+"""
+import json
+
+import numpy as np
+
+MAX_METRICS = 25
+MAX_DIMENSIONS = 3
+MAX_PROMPT_CHARS = 6000
+CHUNK_SIZE = 5000
+SECONDS_PER_DAY = 86400.0
+SUMS = ('n', 'y', 'yy', 't', 'tt', 'ty')
+
+
+class _Accumulator:
+    """Per-metric running sums, grown as new metric names appear."""
+
+    def __init__(self):
+        self.index = {}
+        self.names = []
+        self.shift = np.zeros(0)
+        self.sums = {key: np.zeros(0) for key in SUMS}
+        self.min = np.zeros(0)
+        self.max = np.zeros(0)
+        self.first = np.zeros(0)
+        self.last = np.zeros(0)
+        self.dimensions = {}   # metric index -> {dimension: total}
+
+    def codes(self, names, values):
+        """Map a chunk's names to metric indexes, registering new ones."""
+        unique, inverse = np.unique(names, return_inverse=True)
+        mapping = np.empty(len(unique), dtype=np.int64)
+        for i, name in enumerate(unique):
+            if name not in self.index:
+                self.index[name] = len(self.names)
+                self.names.append(name)
+                # Shift each metric's sums by its first value for a stable variance.
+                self.shift = np.append(self.shift, values[inverse == i][0])
+            mapping[i] = self.index[name]
+        size = len(self.names)
+        if size > len(self.min):
+            grow = size - len(self.min)
+            for key in SUMS:
+                self.sums[key] = np.append(self.sums[key], np.zeros(grow))
+            self.min = np.append(self.min, np.full(grow, np.inf))
+            self.max = np.append(self.max, np.full(grow, -np.inf))
+            self.first = np.append(self.first, np.full(grow, np.inf))
+            self.last = np.append(self.last, np.full(grow, -np.inf))
+        return mapping[inverse]
+
+    def add(self, names, values, times, dimensions):
+        codes = self.codes(names, values)
+        size = len(self.names)
+        y = values - self.shift[codes]
+        for key, weights in (('n', None), ('y', y), ('yy', y * y), ('t', times), ('tt', times * times), ('ty', times * y)):
+            self.sums[key] += np.bincount(codes, weights=weights, minlength=size)
+        np.minimum.at(self.min, codes, values)
+        np.maximum.at(self.max, codes, values)
+        np.minimum.at(self.first, codes, times)
+        np.maximum.at(self.last, codes, times)
+
+        has_dimension = dimensions != ''
+        if has_dimension.any():
+            labels, dimension_codes = np.unique(dimensions[has_dimension], return_inverse=True)
+            pairs, inverse = np.unique(codes[has_dimension] * len(labels) + dimension_codes, return_inverse=True)
+            totals = np.bincount(inverse, weights=values[has_dimension], minlength=len(pairs))
+            for pair, total in zip(pairs, totals):
+                code, label = divmod(int(pair), len(labels))
+                per_metric = self.dimensions.setdefault(code, {})
+                per_metric[labels[label]] = per_metric.get(labels[label], 0.0) + total
+
+
+def _round(value, digits=4):
+    """Round to `digits` significant digits so the prompt stays short."""
+    if value is None or not np.isfinite(value):
+        return None
+    return float(f"{value:.{digits}g}")
+
+
+def build_digest(metrics, max_metrics=MAX_METRICS, max_dimensions=MAX_DIMENSIONS, chunk_size=CHUNK_SIZE):
+    """
+    Digest a Metric queryset in one query. Returns a dict with the overall
+    point count and period plus per-metric statistics for the `max_metrics`
+    metrics with the most points (the rest are counted in other_metrics).
+    """
+    rows = metrics.values_list('name', 'value', 'timestamp', 'dimension_key').iterator(chunk_size=chunk_size)
+    acc = _Accumulator()
+    origin = None
+    start = end = None
+
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            origin, start, end = _fold(acc, chunk, origin, start, end)
+            chunk = []
+    if chunk:
+        origin, start, end = _fold(acc, chunk, origin, start, end)
+
+    n = acc.sums['n']
+    total = int(n.sum())
+    digest = {
+        'total_points': total,
+        'metric_count': len(acc.names),
+        'period': {'start': start.isoformat() if start else None, 'end': end.isoformat() if end else None},
+        'metrics': [],
+        'other_metrics': 0,
+    }
+    if not total:
+        return digest
+
+    s = acc.sums
+    mean_y = s['y'] / n
+    variance = np.maximum(s['yy'] / n - mean_y ** 2, 0)
+    spread = n * s['tt'] - s['t'] ** 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope = np.where(spread > 0, (n * s['ty'] - s['t'] * s['y']) / spread, 0.0)
+
+    order = np.argsort(-n, kind='stable')
+    for i in order[:max_metrics]:
+        dimensions = sorted(acc.dimensions.get(int(i), {}).items(), key=lambda item: item[1], reverse=True)
+        entry = {
+            'name': acc.names[i],
+            'count': int(n[i]),
+            'min': _round(acc.min[i]),
+            'max': _round(acc.max[i]),
+            'mean': _round(mean_y[i] + acc.shift[i]),
+            'std': _round(np.sqrt(variance[i])),
+            'trend_per_day': _round(slope[i]),
+            'days': _round(acc.last[i] - acc.first[i], 3),
+        }
+        if dimensions:
+            entry['top'] = [[dimension, _round(value)] for dimension, value in dimensions[:max_dimensions]]
+            if len(dimensions) > max_dimensions:
+                entry['bottom'] = [[dimension, _round(value)] for dimension, value in dimensions[-max_dimensions:]]
+        digest['metrics'].append(entry)
+    digest['other_metrics'] = max(len(acc.names) - max_metrics, 0)
+    return digest
+
+
+def _fold(acc, chunk, origin, start, end):
+    names, values, timestamps, dimensions = zip(*chunk)
+    seconds = np.fromiter((ts.timestamp() for ts in timestamps), dtype=float, count=len(timestamps))
+    if origin is None:
+        origin = seconds[0]
+    acc.add(
+        np.array(names, dtype=object),
+        np.asarray(values, dtype=float),
+        (seconds - origin) / SECONDS_PER_DAY,
+        np.array(dimensions, dtype=object),
+    )
+    chunk_start, chunk_end = min(timestamps), max(timestamps)
+    start = chunk_start if start is None else min(start, chunk_start)
+    end = chunk_end if end is None else max(end, chunk_end)
+    return origin, start, end
+
+
+def digest_prompt(digest, max_chars=MAX_PROMPT_CHARS):
+    """Compact JSON of `digest`, dropping the smallest metrics until it fits in `max_chars`."""
+    digest = dict(digest, metrics=list(digest['metrics']))
+    text = json.dumps(digest, separators=(',', ':'))
+    while len(text) > max_chars and digest['metrics']:
+        digest['metrics'].pop()
+        digest['other_metrics'] += 1
+        text = json.dumps(digest, separators=(',', ':'))
+    return text[:max_chars]
@@ -0,0 +1,119 @@
+# services/dimensions.py
+"""
+Dimension storage for Metric metadata.
+
+Metric.metadata is free-form JSON, so grouping or filtering on a key such as
+"product" used to mean loading every row into Python. At ingest time every
+scalar top-level metadata key is promoted to a Dimension, its value to a
+DimensionValue, and the metric is linked to it through MetricDimension. That
+lets views filter and group by any dimension in SQL with indexes:
+
+    filter_dimensions(Metric.objects.filter(name='Daily_Sales'), {'product': 'Product Alpha'})
+    with_dimension(Metric.objects.all(), 'product').values('product').annotate(total=Sum('value'))
+"""
+from django.db.models import F, FilteredRelation, Q
+
+from .models import Dimension, DimensionValue, MetricDimension
+
+MAX_VALUE_LENGTH = 255
+
+
+def extract_dimensions(metadata):
+    """Return {dimension name: value string} for the scalar, non-empty keys of `metadata`."""
+    if not isinstance(metadata, dict):
+        return {}
+    dimensions = {}
+    for key, value in metadata.items():
+        if value is None or isinstance(value, (dict, list)):
+            continue
+        if isinstance(value, bool):
+            value = 'true' if value else 'false'
+        value = str(value).strip()
+        if key and value:
+            dimensions[str(key)[:100]] = value[:MAX_VALUE_LENGTH]
+    return dimensions
+
+
+def get_dimension_ids(names):
+    """Map dimension names to ids, creating missing dimensions in bulk."""
+    names = set(names)
+    if not names:
+        return {}
+    Dimension.objects.bulk_create([Dimension(name=name) for name in names], ignore_conflicts=True)
+    return dict(Dimension.objects.filter(name__in=names).values_list('name', 'id'))
+
+
+def get_value_ids(pairs):
+    """Map (dimension_id, value) pairs to DimensionValue ids, creating missing values in bulk."""
+    pairs = set(pairs)
+    if not pairs:
+        return {}
+    DimensionValue.objects.bulk_create(
+        [DimensionValue(dimension_id=dimension_id, value=value) for dimension_id, value in pairs],
+        ignore_conflicts=True,
+    )
+    ids = {}
+    rows = DimensionValue.objects.filter(
+        dimension_id__in={dimension_id for dimension_id, _ in pairs},
+        value__in={value for _, value in pairs},
+    ).values_list('dimension_id', 'value', 'id')
+    for dimension_id, value, value_id in rows.iterator():
+        if (dimension_id, value) in pairs:
+            ids[(dimension_id, value)] = value_id
+    return ids
+
+
+def link_dimensions(rows, replace=True):
+    """
+    Link metrics to their dimension values. `rows` is a list of (metric_id, metadata).
+
+    With replace=True existing links of those metrics are dropped first, so an
+    updated metric never keeps a value its new metadata no longer has. Returns
+    the number of links written.
+    """
+    extracted = [(metric_id, extract_dimensions(metadata)) for metric_id, metadata in rows]
+    if replace:
+        MetricDimension.objects.filter(metric_id__in=[metric_id for metric_id, _ in rows]).delete()
+
+    dimension_ids = get_dimension_ids(name for _, dimensions in extracted for name in dimensions)
+    value_ids = get_value_ids(
+        (dimension_ids[name], value) for _, dimensions in extracted for name, value in dimensions.items()
+    )
+    links = [
+        MetricDimension(
+            metric_id=metric_id,
+            dimension_id=dimension_ids[name],
+            value_id=value_ids[(dimension_ids[name], value)],
+        )
+        for metric_id, dimensions in extracted
+        for name, value in dimensions.items()
+    ]
+    MetricDimension.objects.bulk_create(links, ignore_conflicts=True)
+    return len(links)
+
+
+def filter_dimensions(queryset, filters):
+    """Restrict a Metric queryset to rows matching every {dimension: value} in `filters`."""
+    for name, value in filters.items():
+        # One join per dimension, so several filters combine with AND.
+        queryset = queryset.filter(
+            dimension_links__dimension__name=name,
+            dimension_links__value__value=value,
+        )
+    return queryset
+
+
+def with_dimension(queryset, name, field=None):
+    """
+    Annotate a Metric queryset with the value of dimension `name` as `field`
+    (defaults to the dimension name). Metrics without the dimension get None,
+    so the result can be grouped with .values(field).annotate(...).
+    """
+    field = field or name
+    relation = f'_{field}_link'
+    # FilteredRelation conditions cannot span a further join, so resolve the id first.
+    dimension_id = Dimension.objects.filter(name=name).values_list('id', flat=True).first()
+    return queryset.annotate(**{
+        relation: FilteredRelation('dimension_links', condition=Q(dimension_links__dimension_id=dimension_id)),
+        field: F(f'{relation}__value__value'),
+    })
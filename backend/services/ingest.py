@@ -0,0 +1,385 @@
+# services/ingest.py
+"""
+Shared write path for Metric ingestion.
+
+The internal bulk API (JSON and NDJSON modes) builds its Metric rows here so
+both modes store exactly the same shape of data. Payloads are validated
+column-wise by services.validation rather than row by row through DRF.
+
+write_metrics() is the single insert path for every ingest entry point. It is
+idempotent on the metric natural key, so retried batches do not duplicate
+rows. On PostgreSQL rows stream through COPY ... FROM STDIN into a staging
+table and are upserted from there; elsewhere (SQLite) it falls back to batched
+bulk_create with ON CONFLICT handling.
+"""
+import csv
+import io
+import json
+from collections import namedtuple
+from datetime import datetime, timezone as dt_timezone
+from itertools import islice
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from core.models import IngestionJob
+from .dimensions import link_dimensions
+from .intents import forget_vocabulary
+from .models import Metric
+from .precompute import enqueue_refresh
+from .question_cache import invalidate as invalidate_questions
+from .rollups import update_rollups
+from .validation import validate_metric_records
+
+
+class IngestError(Exception):
+    """Raised when a streamed payload cannot be parsed or validated."""
+
+    def __init__(self, message, line=None, errors=None):
+        super().__init__(message)
+        self.line = line
+        self.errors = errors or {}
+
+
+def get_batch_size(batch_size=None):
+    return batch_size or getattr(settings, 'METRIC_INGEST_BATCH_SIZE', 5000)
+
+
+def build_metric(job, metric_data, data_source_id):
+    """Turn one validated metric dict into an unsaved Metric instance."""
+    # Build metadata with product if it exists
+    metadata = {}
+    if metric_data.get('product'):
+        metadata['product'] = metric_data['product']
+
+    return Metric(
+        ingestion_job=job,
+        data_source_id=data_source_id,
+        name=metric_data['name'],
+        value=metric_data['value'],
+        timestamp=metric_data['timestamp'],
+        metadata=metadata if metadata else None,  # Only set if not empty
+        dimension_key=metric_data.get('product') or '',
+    )
+
+
+def iter_ndjson(stream):
+    """
+    Yield (line_number, record) for every non-blank line of an NDJSON stream.
+    Lines are read one at a time, so the body is never held in memory.
+    """
+    for line_number, raw_line in enumerate(stream, start=1):
+        line = raw_line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            raise IngestError(f"Invalid JSON on line {line_number}: {e}", line=line_number)
+        if not isinstance(record, dict):
+            raise IngestError(f"Line {line_number} is not a JSON object.", line=line_number)
+        yield line_number, record
+
+
+def iter_batches(iterable, batch_size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def ingest_ndjson(job, stream, data_source_id=None, batch_size=None, on_conflict='update'):
+    """
+    Validate and store an NDJSON metric stream in bounded batches.
+
+    Each batch is committed in its own transaction and bumps
+    job.records_processed, so progress is visible while the upload runs and
+    peak memory only depends on the batch size. Returns a WriteResult with
+    per-batch inserted/updated/skipped counts. Raises IngestError on the first
+    batch that fails validation; batches committed before it are kept.
+    """
+    result = WriteResult()
+    for batch in iter_batches(iter_ndjson(stream), get_batch_size(batch_size)):
+        line_numbers = [line_number for line_number, _ in batch]
+        validated = validate_metric_records([record for _, record in batch])
+        if not validated.is_valid:
+            errors = {line_numbers[index]: row_errors for index, row_errors in validated.errors.items()}
+            first_line = min(errors)
+            raise IngestError(
+                f"Metrics data validation failed on line {first_line}.",
+                line=first_line,
+                errors=errors,
+            )
+
+        metrics_to_create = [
+            build_metric(job, metric_data, data_source_id or metric_data['data_source_id'])
+            for metric_data in validated.rows()
+        ]
+        with transaction.atomic():
+            result.merge(write_metrics(metrics_to_create, batch_size=len(metrics_to_create), on_conflict=on_conflict))
+            IngestionJob.objects.filter(pk=job.pk).update(
+                records_processed=F('records_processed') + len(metrics_to_create)
+            )
+
+    return result
+
+
+# Natural key backing services_metric_natural_key; a re-posted row with the same key is not duplicated.
+NATURAL_KEY = ('data_source', 'name', 'timestamp', 'dimension_key')
+# Columns replaced when an upsert hits an existing row.
+UPSERT_FIELDS = ('value', 'metadata', 'ingestion_job')
+ON_CONFLICT_CHOICES = ('update', 'skip')
+# Columns written by the COPY path, in COPY order.
+COPY_FIELDS = ('data_source', 'name', 'value', 'timestamp', 'dimension_key', 'ingestion_job', 'insight', 'metadata')
+STAGING_TABLE = 'services_metric_staging'
+# Timestamps per IN (...) lookup of stored rows, under SQLite's variable limit.
+LOOKUP_CHUNK = 500
+
+# A row a batch inserted or changed, as handed to dimension linking and rollups.
+WrittenRow = namedtuple('WrittenRow', 'id data_source_id name dimension_key timestamp value metadata inserted')
+
+
+class WriteResult:
+    """Inserted/updated/skipped counts for a write, overall and per batch."""
+
+    def __init__(self):
+        self.inserted = self.updated = self.skipped = 0
+        self.batches = []
+
+    @property
+    def total(self):
+        return self.inserted + self.updated + self.skipped
+
+    def add_batch(self, inserted, updated, skipped):
+        self.inserted += inserted
+        self.updated += updated
+        self.skipped += skipped
+        self.batches.append({'inserted': inserted, 'updated': updated, 'skipped': skipped})
+
+    def merge(self, other):
+        for batch in other.batches:
+            self.add_batch(**batch)
+
+    def as_dict(self):
+        return {
+            'inserted': self.inserted,
+            'updated': self.updated,
+            'skipped': self.skipped,
+            'batches': self.batches,
+        }
+
+
+def prepare_metric(metric):
+    """Normalise the fields that make up the natural key before comparing or writing."""
+    if isinstance(metric.timestamp, str):
+        metric.timestamp = parse_datetime(metric.timestamp) or datetime.fromisoformat(metric.timestamp)
+    if timezone.is_naive(metric.timestamp):
+        metric.timestamp = timezone.make_aware(metric.timestamp, dt_timezone.utc)
+    if not metric.dimension_key and isinstance(metric.metadata, dict) and metric.metadata.get('product'):
+        metric.dimension_key = str(metric.metadata['product'])[:255]
+    return metric
+
+
+def natural_key(metric):
+    return (metric.data_source_id, metric.name, metric.timestamp, metric.dimension_key)
+
+
+def write_metrics(metrics, batch_size=None, method=None, on_conflict='update'):
+    """
+    Idempotently write an iterable of unsaved Metric instances; returns a WriteResult.
+
+    Rows are matched on the natural key (data_source, name, timestamp,
+    product dimension). New keys are inserted. Existing keys are updated when
+    the value or metadata changed and on_conflict='update', otherwise counted
+    as skipped. Conflicts are resolved per batch in bulk, never row by row.
+
+    Inserted and updated rows get their metadata keys linked as dimensions
+    (services.dimensions) and are folded into the hour/day/month rollups
+    (services.rollups) in the same transaction. A refresh of their data
+    sources' dashboard answers is queued (services.precompute), and their
+    question cache is invalidated once the write commits
+    (services.question_cache).
+
+    method=None picks COPY on PostgreSQL and bulk_create everywhere else;
+    'copy' or 'bulk_create' forces a path (used by benchmark.py). The iterable
+    is consumed in batches, so generators are never materialised in full.
+    Primary keys are not set on the passed instances.
+    """
+    if on_conflict not in ON_CONFLICT_CHOICES:
+        raise ValueError(f"on_conflict must be one of {ON_CONFLICT_CHOICES}")
+    if method is None:
+        method = 'copy' if connection.vendor == 'postgresql' else 'bulk_create'
+    batch_size = get_batch_size(batch_size)
+
+    result = WriteResult()
+    data_source_ids = set()
+    with transaction.atomic():
+        if method == 'copy':
+            with connection.cursor() as cursor:
+                for batch in iter_batches(metrics, batch_size):
+                    counts, written = _copy_batch(cursor, [prepare_metric(m) for m in batch], on_conflict)
+                    result.add_batch(*counts)
+                    data_source_ids.update(_after_write(written))
+        else:
+            for batch in iter_batches(metrics, batch_size):
+                counts, written = _bulk_create_batch([prepare_metric(m) for m in batch], on_conflict)
+                result.add_batch(*counts)
+                data_source_ids.update(_after_write(written))
+        # Answers about these sources may now be wrong: dashboard answers are queued for
+        # refresh in the same transaction, and cached question answers are dropped once
+        # it commits, so no reader can re-cache them from the data before the write.
+        for data_source_id in data_source_ids:
+            enqueue_refresh(data_source_id)
+        if data_source_ids:
+            enqueue_refresh(None)
+            transaction.on_commit(lambda: _forget_answers(data_source_ids))
+    return result
+
+
+def _forget_answers(data_source_ids):
+    invalidate_questions(*data_source_ids)
+    forget_vocabulary()   # the local answer engine's known metrics and products
+
+
+def _after_write(written):
+    """Link dimensions and update rollups for one batch; returns the data source ids it wrote."""
+    link_dimensions([(row.id, row.metadata) for row in written])
+    update_rollups(written)
+    return {row.data_source_id for row in written}
+
+
+def _stored_rows(keys, *fields):
+    """
+    `fields` of the stored rows whose natural key may be in `keys`: indexed
+    lookups on the batch's exact timestamps, so a sparse batch never reads
+    the history between them.
+    """
+    data_source_ids = {key[0] for key in keys}
+    names = {key[1] for key in keys}
+    timestamps = sorted({key[2] for key in keys})
+    for i in range(0, len(timestamps), LOOKUP_CHUNK):
+        yield from Metric.objects.filter(
+            data_source_id__in=data_source_ids,
+            name__in=names,
+            timestamp__in=timestamps[i:i + LOOKUP_CHUNK],
+        ).values_list(*fields).iterator()
+
+
+def _bulk_create_batch(metrics, on_conflict):
+    # Last occurrence wins when a key repeats inside the batch.
+    latest = {natural_key(metric): metric for metric in metrics}
+    skipped = len(metrics) - len(latest)
+
+    # Every stored row the batch could collide with.
+    existing = {
+        (data_source_id, name, timestamp, dimension_key): (value, metadata)
+        for data_source_id, name, timestamp, dimension_key, value, metadata in _stored_rows(
+            latest, 'data_source_id', 'name', 'timestamp', 'dimension_key', 'value', 'metadata'
+        )
+    }
+
+    inserts, updates = [], []
+    for key, metric in latest.items():
+        current = existing.get(key)
+        if current is None:
+            inserts.append(metric)
+        elif on_conflict == 'update' and current != (metric.value, metric.metadata):
+            updates.append(metric)
+        else:
+            skipped += 1
+
+    if inserts:
+        Metric.objects.bulk_create(inserts, ignore_conflicts=True)
+    if updates:
+        Metric.objects.bulk_create(
+            updates, update_conflicts=True, unique_fields=NATURAL_KEY, update_fields=UPSERT_FIELDS
+        )
+
+    # Ids of the written rows, for dimension linking.
+    written = {natural_key(metric): (metric, True) for metric in inserts}
+    written.update({natural_key(metric): (metric, False) for metric in updates})
+    written_rows = []
+    if written:
+        for metric_id, *key in _stored_rows(written, 'id', 'data_source_id', 'name', 'timestamp', 'dimension_key'):
+            if tuple(key) in written:
+                metric, inserted = written[tuple(key)]
+                written_rows.append(WrittenRow(
+                    metric_id, metric.data_source_id, metric.name, metric.dimension_key,
+                    metric.timestamp, metric.value, metric.metadata, inserted,
+                ))
+    return (len(inserts), len(updates), skipped), written_rows
+
+
+def _copy_batch(cursor, metrics, on_conflict):
+    """COPY the batch into a temp staging table, then upsert it with one INSERT ... ON CONFLICT."""
+    quote = connection.ops.quote_name
+    table, staging = quote(Metric._meta.db_table), quote(STAGING_TABLE)
+    columns = ', '.join(quote(Metric._meta.get_field(name).column) for name in COPY_FIELDS)
+    key_columns = ', '.join(quote(Metric._meta.get_field(name).column) for name in NATURAL_KEY)
+
+    cursor.execute(
+        f"CREATE TEMP TABLE IF NOT EXISTS {staging} ON COMMIT DROP "
+        f"AS SELECT {columns} FROM {table} WITH NO DATA"
+    )
+    cursor.execute(f"ALTER TABLE {staging} ADD COLUMN IF NOT EXISTS seq bigserial")
+    cursor.execute(f"TRUNCATE {staging}")
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for metric in metrics:
+        writer.writerow((
+            metric.data_source_id,
+            metric.name,
+            repr(float(metric.value)),
+            metric.timestamp.isoformat(),
+            metric.dimension_key,
+            '' if metric.ingestion_job_id is None else metric.ingestion_job_id,  # unquoted empty = NULL
+            '' if metric.insight_id is None else metric.insight_id,
+            '' if metric.metadata is None else json.dumps(metric.metadata),
+        ))
+    buffer.seek(0)
+    # An empty dimension_key is '' rather than NULL, so it still takes part in the unique key.
+    copy_sql = (
+        f"COPY {staging} ({columns}) FROM STDIN WITH (FORMAT csv, "
+        f"FORCE_NOT_NULL ({quote(Metric._meta.get_field('dimension_key').column)}))"
+    )
+    raw_cursor = cursor.cursor
+    if hasattr(raw_cursor, 'copy_expert'):  # psycopg2
+        raw_cursor.copy_expert(copy_sql, buffer)
+    else:  # psycopg 3
+        with raw_cursor.copy(copy_sql) as copy:
+            copy.write(buffer.getvalue())
+
+    if on_conflict == 'update':
+        assignments = ', '.join(
+            f"{quote(Metric._meta.get_field(name).column)} = EXCLUDED.{quote(Metric._meta.get_field(name).column)}"
+            for name in UPSERT_FIELDS
+        )
+        conflict = (
+            f"DO UPDATE SET {assignments} "
+            f"WHERE (existing.value, existing.metadata) IS DISTINCT FROM (EXCLUDED.value, EXCLUDED.metadata)"
+        )
+    else:
+        conflict = "DO NOTHING"
+
+    # DISTINCT ON keeps the last occurrence of a repeated key; xmax = 0 marks a fresh insert.
+    cursor.execute(
+        f"INSERT INTO {table} AS existing ({columns}) "
+        f"SELECT DISTINCT ON ({key_columns}) {columns} FROM {staging} "
+        f"ORDER BY {key_columns}, seq DESC "
+        f"ON CONFLICT ({key_columns}) {conflict} "
+        f"RETURNING existing.id, existing.data_source_id, existing.name, existing.dimension_key, "
+        f"existing.timestamp, existing.value, existing.metadata, (xmax = 0)"
+    )
+    written = [
+        WrittenRow(*row[:6], json.loads(row[6]) if isinstance(row[6], str) else row[6], row[7])
+        for row in cursor.fetchall()
+    ]
+    inserted = sum(1 for row in written if row.inserted)
+    updated = len(written) - inserted
+    return (inserted, updated, len(metrics) - inserted - updated), written
@@ -0,0 +1,255 @@
+# services/intents.py
+"""
+Local answers for simple metric questions.
+
+Many questions sent to /services/q/ask/ are plain aggregations over our own
+metrics ("total Daily_Sales in March", "average Conversion_Rate this
+quarter", "sales by product last month"). parse_intent() recognises
+
+* the metric: a known metric name ("Daily_Sales", "daily sales") or an
+  alias ("revenue" -> Daily_Sales);
+* the aggregation: total, average, minimum, maximum or count (default:
+  average for rates and averages, total otherwise);
+* the period: today, yesterday, this/last week/month/quarter/year, the
+  last N days/weeks/months, a month ("in March", "March 2025"), a year,
+  year to date, or all time;
+* the dimension: a known product ("for Product Alpha") or a breakdown
+  ("by product", "top products").
+
+answer_intent() then answers from MetricRollup in one indexed query. It
+reads month buckets when the period is whole months and day buckets
+otherwise. Questions it cannot parse, and anything asking why, what if,
+for a forecast or for advice, return None and go to Amazon Q; so do
+comparisons ("2025 vs 2024") and questions scoped to something that is not
+a known dimension ("for Product Zeta").
+"""
+import calendar
+import re
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.core.cache import cache
+from django.db.models import ExpressionWrapper, F, FloatField, Max, Min, Sum
+from django.utils import timezone
+
+from .models import MetricRollup
+from .rollups import bucket_start
+
+Intent = namedtuple('Intent', 'metric aggregation start end period dimension breakdown ascending', defaults=(False,))
+
+AGGREGATIONS = (
+    ('avg', ('average', 'avg', 'mean')),
+    ('min', ('minimum', 'lowest', 'min', 'smallest')),
+    ('max', ('maximum', 'highest', 'max', 'peak', 'largest', 'biggest')),
+    ('count', ('how many data points', 'number of data points', 'count', 'data points')),
+    ('sum', ('total', 'sum', 'how much', 'overall')),
+)
+AGGREGATION_LABELS = {'sum': 'Total', 'avg': 'Average', 'min': 'Minimum', 'max': 'Maximum', 'count': 'Data points of'}
+METRIC_ALIASES = {
+    'revenue': 'Daily_Sales', 'sales': 'Daily_Sales', 'turnover': 'Daily_Sales',
+    'conversion rate': 'Conversion_Rate', 'conversion': 'Conversion_Rate',
+    'average order value': 'Average_Order_Value', 'order value': 'Average_Order_Value', 'aov': 'Average_Order_Value',
+}
+# Questions that need reasoning rather than arithmetic.
+OPEN_ENDED = re.compile(
+    r"\b(why|what if|should|recommend|advice|suggest|predict|forecast|expect|will|explain|improve|strategy|compare"
+    r"|how (?:do|can|to)|ways?|tips|grow|boost|increase|decrease|reduce|trend|cause)\b"
+)
+# Comparisons need both sides answered; a single aggregate would drop one.
+COMPARISON = re.compile(r"\b(vs|versus|compared|comparison|against|relative to)\b")
+BREAKDOWN = re.compile(r"\b(by|per|each|top|bottom|best|worst)\s+(selling\s+)?(products?|items?|dimensions?)\b")
+MONTHS = {name.lower(): i for i, name in enumerate(calendar.month_name) if name}
+MONTHS.update({name.lower(): i for i, name in enumerate(calendar.month_abbr) if name})
+MONTH_PATTERN = '|'.join(sorted(MONTHS, key=len, reverse=True))
+# What may follow "for"/"of" (and an optional "the") besides a known dimension: a period,
+# a breakdown or an aggregation's own words.
+SCOPE_WORDS = (
+    r"today|yesterday|this|current|last|past|previous|all|each|every|top|bottom|best|worst|in|during|over"
+    r"|since|from|for|of|by|per|data|week|month|quarter|year|ytd|mtd|\d+|" + MONTH_PATTERN
+)
+UNKNOWN_SCOPE = re.compile(rf"\b(?:for|of)\s+(?:the\s+(?!(?:{SCOPE_WORDS})\b)\w|(?!(?:the|{SCOPE_WORDS})\b)\w)")
+BREAKDOWN_LIMIT = 10
+VOCABULARY_KEY = 'intents:vocabulary'
+VOCABULARY_SECONDS = 300
+VOCABULARY_DIMENSIONS = 1000
+
+
+def vocabulary():
+    """Known metric names and dimension values (from month rollups), cached briefly."""
+    vocab = cache.get(VOCABULARY_KEY)
+    if vocab is None:
+        month = MetricRollup.objects.filter(grain='month').order_by()
+        dimensions = month.exclude(dimension_key__in=['', 'Unknown']).values_list('dimension_key', flat=True)
+        vocab = {
+            'metrics': sorted(month.values_list('name', flat=True).distinct()),
+            'dimensions': sorted(dimensions.distinct()[:VOCABULARY_DIMENSIONS]),
+        }
+        cache.set(VOCABULARY_KEY, vocab, timeout=VOCABULARY_SECONDS)
+    return vocab
+
+
+def forget_vocabulary():
+    """New data may name new metrics or products: read the vocabulary again on the next question."""
+    cache.delete(VOCABULARY_KEY)
+
+
+def _month_start(year, month):
+    return datetime(year, month, 1, tzinfo=dt_timezone.utc)
+
+
+def _add_months(start, months):
+    index = start.year * 12 + start.month - 1 + months
+    return _month_start(index // 12, index % 12 + 1)
+
+
+def parse_period(text, now):
+    """(start, end, label) of the period named in `text`; (None, None, 'all time') when none is."""
+    today = bucket_start(now, 'day')
+    this_month = _month_start(today.year, today.month)
+    this_quarter = _month_start(today.year, (today.month - 1) // 3 * 3 + 1)
+    this_year = _month_start(today.year, 1)
+    this_week = today - timedelta(days=today.weekday())
+
+    match = re.search(r"\b(?:last|past|previous)\s+(\d+)\s+(day|week|month)s?\b", text)
+    if match:
+        n, unit = int(match.group(1)), match.group(2)
+        end = today + timedelta(days=1)
+        if unit == 'month':
+            return _add_months(end, -n), end, f"the last {n} months"
+        return end - timedelta(days=n * (7 if unit == 'week' else 1)), end, f"the last {n} {unit}s"
+
+    simple = [
+        (r"\btoday\b", today, today + timedelta(days=1), "today"),
+        (r"\byesterday\b", today - timedelta(days=1), today, "yesterday"),
+        (r"\b(this|current)\s+week\b", this_week, today + timedelta(days=1), "this week"),
+        (r"\b(last|previous|past)\s+week\b", this_week - timedelta(days=7), this_week, "last week"),
+        (r"\b(this|current)\s+month\b|\bmonth to date\b|\bmtd\b", this_month, today + timedelta(days=1), "this month"),
+        (r"\b(last|previous|past)\s+month\b", _add_months(this_month, -1), this_month, "last month"),
+        (r"\b(this|current)\s+quarter\b", this_quarter, today + timedelta(days=1), "this quarter"),
+        (r"\b(last|previous|past)\s+quarter\b", _add_months(this_quarter, -3), this_quarter, "last quarter"),
+        (r"\b(this|current)\s+year\b|\byear to date\b|\bytd\b", this_year, today + timedelta(days=1), "this year"),
+        (r"\b(last|previous|past)\s+year\b", _add_months(this_year, -12), this_year, "last year"),
+    ]
+    for pattern, start, end, label in simple:
+        if re.search(pattern, text):
+            return start, end, label
+
+    match = re.search(rf"\b({MONTH_PATTERN})\b(?:\s+(\d{{4}}))?", text)
+    if match:
+        month = MONTHS[match.group(1)]
+        year = int(match.group(2)) if match.group(2) else today.year
+        if not match.group(2) and _month_start(year, month) > today:
+            year -= 1   # "in March" means the most recent March
+        start = _month_start(year, month)
+        return start, _add_months(start, 1), f"{calendar.month_name[month]} {year}"
+
+    match = re.search(r"\b(?:in|for|during)\s+(\d{4})\b", text)
+    if match:
+        year = int(match.group(1))
+        return _month_start(year, 1), _month_start(year + 1, 1), str(year)
+    return None, None, "all time"
+
+
+def parse_intent(question, now=None):
+    """The Intent of a simple metric question, or None when it should go to Amazon Q."""
+    text = question.lower().strip()
+    if OPEN_ENDED.search(text) or COMPARISON.search(text):
+        return None
+    vocab = vocabulary()
+
+    metric = None
+    candidates = [(name, name.lower()) for name in vocab['metrics']]
+    candidates += [(name, name.lower().replace('_', ' ')) for name in vocab['metrics']]
+    candidates += [(name, alias) for alias, name in METRIC_ALIASES.items() if name in vocab['metrics']]
+    for name, form in sorted(candidates, key=lambda item: len(item[1]), reverse=True):
+        # One- and two-letter names would match stray letters ("what's").
+        if len(form) > 2 and re.search(rf"\b{re.escape(form)}\b", text):
+            metric = name
+            # Drop the metric's own words so "Average_Order_Value" does not read as an average.
+            text = re.sub(rf"\b{re.escape(form)}\b", " ", text)
+            break
+    if metric is None:
+        return None
+
+    aggregation = next(
+        (key for key, words in AGGREGATIONS if any(re.search(rf"\b{word}\b", text) for word in words)),
+        'avg' if re.search(r"rate|average|ratio", metric.lower()) else 'sum',
+    )
+    start, end, period = parse_period(text, now or timezone.now())
+    dimension = next(
+        (value for value in sorted(vocab['dimensions'], key=len, reverse=True)
+         if re.search(rf"\b{re.escape(value.lower())}\b", text)),
+        None,
+    )
+    if dimension is not None:
+        text = re.sub(rf"\b{re.escape(dimension.lower())}\b", " ", text)
+    # "for Product Zeta" naming something we do not know: answering for everything would be wrong.
+    if UNKNOWN_SCOPE.search(text):
+        return None
+    match = BREAKDOWN.search(text) if dimension is None else None
+    ascending = match is not None and match.group(1) in ('bottom', 'worst')
+    return Intent(metric, aggregation, start, end, period, dimension, match is not None, ascending)
+
+
+def _grain(start, end):
+    aligned = all(bound is None or bound == _month_start(bound.year, bound.month) for bound in (start, end))
+    return 'month' if aligned else 'day'
+
+
+def _value(aggregation, row):
+    if aggregation == 'avg':
+        return row['sum'] / row['count'] if row['count'] else None
+    return row[aggregation]
+
+
+def answer_intent(intent, question, data_source_id=None):
+    """Answer `intent` from MetricRollup in one query, shaped like an Amazon Q answer."""
+    rollups = MetricRollup.objects.filter(grain=_grain(intent.start, intent.end), name=intent.metric)
+    if intent.start is not None:
+        rollups = rollups.filter(bucket_start__gte=intent.start, bucket_start__lt=intent.end)
+    if data_source_id is not None:
+        rollups = rollups.filter(data_source_id=data_source_id)
+    if intent.dimension is not None:
+        rollups = rollups.filter(dimension_key=intent.dimension)
+    stats = {'sum': Sum('sum'), 'count': Sum('count'), 'min': Min('min'), 'max': Max('max')}
+
+    label = f"{AGGREGATION_LABELS[intent.aggregation]} {intent.metric}"
+    scope = f" for {intent.dimension}" if intent.dimension else ""
+    period = intent.period if intent.start is None else f"{intent.period} ({intent.start:%Y-%m-%d} to {intent.end - timedelta(days=1):%Y-%m-%d})"
+    data = {
+        'metric': intent.metric, 'aggregation': intent.aggregation, 'period': intent.period,
+        'start': intent.start, 'end': intent.end, 'dimension': intent.dimension,
+    }
+
+    if intent.breakdown:
+        # Rank by the value being reported; an average is ranked by sum / count, not by the sum.
+        ranking = intent.aggregation if intent.ascending else f'-{intent.aggregation}'
+        rows = list(
+            rollups.exclude(dimension_key__in=['', 'Unknown']).values('dimension_key').annotate(**stats)
+            .annotate(avg=ExpressionWrapper(F('sum') / F('count'), output_field=FloatField()))
+            .order_by(ranking, 'dimension_key')[:BREAKDOWN_LIMIT]
+        )
+        data['breakdown'] = [{'dimension': row['dimension_key'], 'value': _value(intent.aggregation, row)} for row in rows]
+        order = ", lowest first" if intent.ascending else ""
+        if not rows:
+            answer = f"No {intent.metric} data by product, {period}."
+        else:
+            lines = [f"{item['dimension']}: {item['value']:,.2f}" for item in data['breakdown'] if item['value'] is not None]
+            answer = f"{label} by product{order}, {period}: " + "; ".join(lines) + "."
+    else:
+        row = rollups.aggregate(**stats)
+        row['count'] = row['count'] or 0
+        value = _value(intent.aggregation, row)
+        data.update(value=value, data_points=row['count'])
+        if not row['count']:
+            answer = f"No {intent.metric} data{scope}, {period}."
+        else:
+            answer = f"{label}{scope}, {period}: {value:,.2f} (from {row['count']:,} data points)."
+
+    return {
+        "question": question,
+        "answer": answer,
+        "sources": [],
+        "conversation_id": None,
+        "data": data,
+    }
@@ -0,0 +1,178 @@
+# services/kpis.py
+"""
+Declarative KPI engine for the dashboard summary cards.
+
+A KPI set is a dict of name -> definition:
+
+    evaluate({
+        'total_revenue': Total('Daily_Sales'),
+        'conversion_rate': Average('Conversion_Rate'),
+        'revenue_growth': Growth('Daily_Sales', days=30),
+    })
+
+evaluate() compiles the whole set into ONE conditional-aggregation query
+over MetricRollup: every definition contributes FILTER-ed aggregates, and
+the WHERE clause is the OR of their bucket predicates. All-time figures
+read month buckets and windowed figures read day buckets, so a card load
+is one round trip whose cost does not grow with raw metric history.
+Windows are whole UTC days ending today (inclusive).
+"""
+import operator
+from datetime import timedelta
+from functools import reduce
+
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+from .models import MetricRollup
+from .rollups import bucket_start
+
+
+def buckets(metric=None, start=None, end=None):
+    """Predicate selecting the rollup buckets of `metric` (all metrics if None) in [start, end)."""
+    if start is None and end is None:
+        condition = Q(grain='month')
+    else:
+        condition = Q(grain='day')
+        if start is not None:
+            condition &= Q(bucket_start__gte=start)
+        if end is not None:
+            condition &= Q(bucket_start__lt=end)
+    if metric is not None:
+        condition &= Q(name=metric)
+    return condition
+
+
+class KPI:
+    """
+    Base definition. Subclasses declare the aggregates they need with
+    aggregates() (alias suffix -> (aggregate function, field, predicate))
+    and turn the aggregated row back into a value with resolve().
+    """
+
+    def aggregates(self, end):
+        raise NotImplementedError
+
+    def resolve(self, values):
+        raise NotImplementedError
+
+
+class Total(KPI):
+    """Sum of a metric, all-time or over the last `days` days."""
+
+    def __init__(self, metric, days=None):
+        self.metric = metric
+        self.days = days
+
+    def window(self, end):
+        return buckets(self.metric, end - timedelta(days=self.days), end) if self.days else buckets(self.metric)
+
+    def aggregates(self, end):
+        return {'sum': (Sum, 'sum', self.window(end))}
+
+    def resolve(self, values):
+        return values['sum'] or 0
+
+
+class DataPoints(Total):
+    """Number of data points of a metric, all-time or over the last `days` days."""
+
+    def aggregates(self, end):
+        return {'count': (Sum, 'count', self.window(end))}
+
+    def resolve(self, values):
+        return values['count'] or 0
+
+
+class Average(Total):
+    """Mean data point value of a metric (None without data)."""
+
+    def aggregates(self, end):
+        window = self.window(end)
+        return {'sum': (Sum, 'sum', window), 'count': (Sum, 'count', window)}
+
+    def resolve(self, values):
+        return values['sum'] / values['count'] if values['count'] else None
+
+
+class Growth(KPI):
+    """
+    Period-over-period growth in percent: total of the last `days` days vs
+    the `days` before them (None when the previous period is empty).
+    """
+
+    def __init__(self, metric, days=30):
+        self.metric = metric
+        self.days = days
+
+    def aggregates(self, end):
+        middle = end - timedelta(days=self.days)
+        start = middle - timedelta(days=self.days)
+        return {
+            'current': (Sum, 'sum', buckets(self.metric, middle, end)),
+            'previous': (Sum, 'sum', buckets(self.metric, start, middle)),
+        }
+
+    def resolve(self, values):
+        current, previous = values['current'] or 0, values['previous'] or 0
+        return (current - previous) / previous * 100 if previous else None
+
+
+class DistinctMetrics(KPI):
+    """Number of distinct metric names with data."""
+
+    def aggregates(self, end):
+        return {'names': (Count, 'name', buckets())}
+
+    def resolve(self, values):
+        return values['names'] or 0
+
+
+def compile_kpis(kpis, end):
+    """Return (where, aggregates) for one .filter(where).aggregate(**aggregates) call."""
+    predicates, aggregates = [], {}
+    for name, kpi in kpis.items():
+        for suffix, (function, field, predicate) in kpi.aggregates(end).items():
+            predicates.append(predicate)
+            extra = {'distinct': True} if function is Count else {}
+            aggregates[f'{name}__{suffix}'] = function(field, filter=predicate, **extra)
+    return reduce(operator.or_, predicates), aggregates
+
+
+def evaluate(kpis, data_source_id=None, now=None):
+    """Evaluate a KPI set with one aggregate query and return {name: value}."""
+    # Windows end at the start of tomorrow (UTC), i.e. they include today.
+    end = bucket_start(now or timezone.now(), 'day') + timedelta(days=1)
+    where, aggregates = compile_kpis(kpis, end)
+    rollups = MetricRollup.objects.filter(where)
+    if data_source_id is not None:
+        rollups = rollups.filter(data_source_id=data_source_id)
+    row = rollups.aggregate(**aggregates)
+
+    results = {}
+    for name, kpi in kpis.items():
+        prefix = f'{name}__'
+        results[name] = kpi.resolve({key[len(prefix):]: value for key, value in row.items() if key.startswith(prefix)})
+    return results
+
+
+# --- Dashboard KPI sets ---
+
+def sales_summary_kpis(window=30):
+    """Cards of the sales deep-dive page (SalesSummaryView)."""
+    return {
+        'total_revenue': Total('Daily_Sales'),
+        'avg_order_value': Average('Average_Order_Value'),
+        'conversion_rate': Average('Conversion_Rate'),
+        'revenue_growth': Growth('Daily_Sales', days=window),
+    }
+
+
+def metrics_summary_kpis(window=30):
+    """Cards of the main dashboard (MetricsSummaryView)."""
+    return {
+        'total_sales': Total('Daily_Sales'),
+        'avg_conversion': Average('Conversion_Rate'),
+        'sales_growth': Growth('Daily_Sales', days=window),
+        'active_metrics': DistinctMetrics(),
+    }
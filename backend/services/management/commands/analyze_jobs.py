@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.aws_fakes import FakeBedrock
+from services.batch_analysis import run_batch_analysis
+
+
+class Command(BaseCommand):
+    help = "Run Bedrock analysis for many ingestion jobs with bounded concurrency and quota-aware rate limiting."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--job-ids', type=lambda value: [int(i) for i in value.split(',')], default=None,
+                            help="Comma separated ingestion job ids.")
+        parser.add_argument('--data-source-ids', type=lambda value: [int(i) for i in value.split(',')], default=None,
+                            help="Analyse every not yet completed job of these data sources.")
+        parser.add_argument('--workers', type=int, default=None,
+                            help="Concurrent Bedrock calls (defaults to BATCH_ANALYSIS_WORKERS).")
+        parser.add_argument('--fake-latency', type=float, default=None,
+                            help="Answer from a local fake Bedrock with this many seconds of latency.")
+
+    def handle(self, *args, **options):
+        if not options['job_ids'] and not options['data_source_ids']:
+            raise CommandError("Pass --job-ids and/or --data-source-ids.")
+        client = FakeBedrock(latency=options['fake_latency']) if options['fake_latency'] is not None else None
+        report = run_batch_analysis(
+            job_ids=options['job_ids'], data_source_ids=options['data_source_ids'],
+            workers=options['workers'], client=client,
+        )
+        self.stdout.write(
+            f"{report['completed']} completed ({report['cached']} cached), {report['failed']} failed "
+            f"in {report['elapsed_seconds']}s: {report['jobs_per_minute']} jobs/min, "
+            f"queue wait p50 {report['queue_wait_p50']}s p95 {report['queue_wait_p95']}s, "
+            f"{report['throttle_retries']} throttle retries"
+        )
+        self.stdout.write(self.style.SUCCESS("Batch analysis finished."))
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from services.dimensions import link_dimensions
+from services.ingest import get_batch_size
+from services.models import Metric
+
+
+class Command(BaseCommand):
+    help = "Link existing metrics to dimension values extracted from their metadata."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help="Metrics per transaction (defaults to METRIC_INGEST_BATCH_SIZE).")
+        parser.add_argument('--data-source', type=int, default=None,
+                            help="Only backfill metrics of this data source id.")
+
+    def handle(self, *args, **options):
+        batch_size = get_batch_size(options['batch_size'])
+        metrics = Metric.objects.filter(metadata__isnull=False).order_by('id')
+        if options['data_source']:
+            metrics = metrics.filter(data_source_id=options['data_source'])
+
+        # Walk the table in primary-key order so each batch is one indexed range read.
+        last_id, processed, linked = 0, 0, 0
+        while True:
+            rows = list(metrics.filter(id__gt=last_id).values_list('id', 'metadata')[:batch_size])
+            if not rows:
+                break
+            with transaction.atomic():
+                linked += link_dimensions(rows)
+            processed += len(rows)
+            last_id = rows[-1][0]
+            self.stdout.write(f"Backfilled {processed} metrics ({linked} dimension links)...")
+
+        self.stdout.write(self.style.SUCCESS(f"Done: {processed} metrics, {linked} dimension links."))
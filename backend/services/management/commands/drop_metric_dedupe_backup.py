@@ -0,0 +1,25 @@
+from importlib import import_module
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+BACKUP_TABLE = import_module('services.migrations.0002_metric_natural_key').BACKUP_TABLE
+
+
+class Command(BaseCommand):
+    help = (
+        "Drop the backup of duplicate metrics removed by migration services.0002. "
+        "Safe once that deploy is verified and rolling back past services.0002 is no longer needed; "
+        "afterwards the migration can no longer be reversed."
+    )
+
+    def handle(self, *args, **options):
+        if BACKUP_TABLE not in connection.introspection.table_names():
+            self.stdout.write(f"No {BACKUP_TABLE} table; nothing to drop.")
+            return
+        table = connection.ops.quote_name(BACKUP_TABLE)
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT COUNT(*) FROM {table}")
+            rows = cursor.fetchone()[0]
+            cursor.execute(f"DROP TABLE {table}")
+        self.stdout.write(self.style.SUCCESS(f"Dropped {BACKUP_TABLE} ({rows} duplicate metrics)."))
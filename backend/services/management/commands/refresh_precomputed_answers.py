@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from core.models import DataSource
+from services.precompute import refresh_answers
+
+
+class Command(BaseCommand):
+    help = "Regenerate the precomputed Amazon Q dashboard answers (run on a schedule, e.g. hourly cron)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--data-source-ids', type=lambda value: [int(i) for i in value.split(',')], default=None,
+                            help="Comma separated data source ids (defaults to every active source).")
+        parser.add_argument('--skip-global', action='store_true',
+                            help="Do not refresh the all-sources answers.")
+
+    def handle(self, *args, **options):
+        data_source_ids = options['data_source_ids']
+        if data_source_ids is None:
+            data_source_ids = list(DataSource.objects.filter(is_active=True).values_list('id', flat=True))
+        targets = ([] if options['skip_global'] else [None]) + data_source_ids
+
+        failed = 0
+        for data_source_id in targets:
+            outcome = refresh_answers(data_source_id)
+            failed += list(outcome.values()).count('failed')
+            self.stdout.write(f"{data_source_id or 'all sources'}: {outcome}")
+        if failed:
+            self.stdout.write(self.style.WARNING(f"{failed} answers could not be refreshed; previous answers kept."))
+        else:
+            self.stdout.write(self.style.SUCCESS("Precomputed answers refreshed."))
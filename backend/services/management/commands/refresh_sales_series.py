@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from services.object_store import LocalObjectStore
+from services.sales_series import refresh_sales_series
+
+
+class Command(BaseCommand):
+    help = "Fold new, changed and deleted raw-data CSVs into the materialized sales series."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prefix', default=None,
+                            help="Object key prefix to scan (defaults to DATA_LAKE_PREFIX).")
+        parser.add_argument('--local-root', default=None,
+                            help="Read from this directory instead of the configured store.")
+
+    def handle(self, *args, **options):
+        store = LocalObjectStore(options['local_root']) if options['local_root'] else None
+        counts = refresh_sales_series(store=store, prefix=options['prefix'])
+        self.stdout.write(
+            f"{counts['processed']} processed, {counts['unchanged']} unchanged, "
+            f"{counts['removed']} removed, {counts['failed']} failed"
+        )
+        self.stdout.write(self.style.SUCCESS("Sales series refreshed."))
@@ -0,0 +1,71 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ForecastPrediction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('metric_name', models.CharField(help_text="The metric being forecasted (e.g., 'Daily Sales').", max_length=255)),
+                ('prediction_time', models.DateTimeField(help_text='The start time for the predicted period (e.g., today).')),
+                ('prediction_data', models.JSONField(help_text="A JSON array of predicted values, e.g., [{'date': '2025-10-02', 'value': 1200.50}, ...]")),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('data_source', models.ForeignKey(help_text='The source data this prediction is based on.', on_delete=django.db.models.deletion.CASCADE, related_name='forecasts', to='core.datasource')),
+            ],
+            options={
+                'verbose_name_plural': 'Forecast Predictions',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Insight',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(choices=[('BEDROCK', 'Amazon Bedrock'), ('LOOKOUT', 'Amazon Lookout for Metrics'), ('FORECAST', 'Amazon Forecast')], default='BEDROCK', help_text='The AWS service that generated this insight.', max_length=50)),
+                ('title', models.CharField(max_length=255)),
+                ('summary', models.TextField()),
+                ('recommendations', models.JSONField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('data_source', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='insights', to='core.datasource')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Alert',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('type', models.CharField(choices=[('EMAIL', 'Email'), ('SMS', 'SMS'), ('PUSH', 'Push Notification')], max_length=20)),
+                ('sent', models.BooleanField(default=False)),
+                ('timestamp', models.DateTimeField(auto_now_add=True)),
+                ('recipient', models.CharField(blank=True, max_length=255, null=True)),
+                ('severity', models.IntegerField(default=5, help_text='Severity score, e.g., from 1 (low) to 10 (critical)')),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('SENT', 'Sent'), ('FAILED', 'Failed')], default='PENDING', max_length=20)),
+                ('details_json', models.JSONField(blank=True, help_text='Detailed alert metadata.', null=True)),
+                ('acknowledged_at', models.DateTimeField(blank=True, null=True)),
+                ('insight', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='alerts', to='services.insight')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Metric',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('value', models.FloatField()),
+                ('timestamp', models.DateTimeField()),
+                ('metadata', models.JSONField(blank=True, null=True)),
+                ('data_source', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='metrics', to='core.datasource')),
+                ('ingestion_job', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='core.ingestionjob')),
+                ('insight', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='metrics', to='services.insight')),
+            ],
+        ),
+    ]
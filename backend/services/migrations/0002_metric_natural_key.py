@@ -0,0 +1,82 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:08
+
+from django.db import migrations, models
+
+# Rows removed as duplicates are kept here so the migration can be reversed.
+BACKUP_TABLE = 'services_metric_dedupe_backup'
+
+
+def duplicate_filter(schema_editor, table):
+    """WHERE clause matching every row but the newest (highest id) for its natural key."""
+    qn = schema_editor.quote_name
+    key = ', '.join(qn(column) for column in ('data_source_id', 'name', 'timestamp', 'dimension_key'))
+    return f'{qn("id")} NOT IN (SELECT MAX({qn("id")}) FROM {table} GROUP BY {key})'
+
+
+def backfill_and_dedupe(apps, schema_editor):
+    """
+    Fill dimension_key from metadata['product'] and drop duplicate rows left by
+    retried bulk-create calls, keeping the most recent row for each natural key.
+
+    The duplicates are copied to BACKUP_TABLE and then removed with one
+    set-based DELETE; restore_duplicates() puts them back on reverse. Once
+    the deploy is verified and reversing past this migration is not needed,
+    drop the backup with `manage.py drop_metric_dedupe_backup`; after that
+    the reverse refuses to run.
+    """
+    Metric = apps.get_model('services', 'Metric')
+
+    batch = []
+    for metric in Metric.objects.filter(metadata__has_key='product').only('id', 'metadata').iterator(chunk_size=2000):
+        product = metric.metadata.get('product') if isinstance(metric.metadata, dict) else None
+        if product:
+            metric.dimension_key = str(product)[:255]
+            batch.append(metric)
+        if len(batch) >= 2000:
+            Metric.objects.bulk_update(batch, ['dimension_key'])
+            batch = []
+    if batch:
+        Metric.objects.bulk_update(batch, ['dimension_key'])
+
+    qn = schema_editor.quote_name
+    table, backup = qn(Metric._meta.db_table), qn(BACKUP_TABLE)
+    schema_editor.execute(f'CREATE TABLE {backup} AS SELECT * FROM {table} WHERE {duplicate_filter(schema_editor, table)}')
+    schema_editor.execute(f'DELETE FROM {table} WHERE {qn("id")} IN (SELECT {qn("id")} FROM {backup})')
+
+
+def restore_duplicates(apps, schema_editor):
+    """Reinsert the rows backfill_and_dedupe() removed (runs after the unique constraint is dropped)."""
+    Metric = apps.get_model('services', 'Metric')
+    if BACKUP_TABLE not in schema_editor.connection.introspection.table_names():
+        raise RuntimeError(
+            f"Cannot reverse services.0002: backup table {BACKUP_TABLE} with the removed duplicate metrics is missing."
+        )
+    qn = schema_editor.quote_name
+    with schema_editor.connection.cursor() as cursor:
+        columns = ', '.join(
+            qn(column.name) for column in schema_editor.connection.introspection.get_table_description(cursor, BACKUP_TABLE)
+        )
+    schema_editor.execute(f'INSERT INTO {qn(Metric._meta.db_table)} ({columns}) SELECT {columns} FROM {qn(BACKUP_TABLE)}')
+    schema_editor.execute(f'DROP TABLE {qn(BACKUP_TABLE)}')
+    # Fire the deferred FK checks now; PostgreSQL will not ALTER a table with pending trigger events.
+    schema_editor.connection.check_constraints(table_names=[Metric._meta.db_table])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('services', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='metric',
+            name='dimension_key',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.RunPython(backfill_and_dedupe, restore_duplicates),
+        migrations.AddConstraint(
+            model_name='metric',
+            constraint=models.UniqueConstraint(fields=('data_source', 'name', 'timestamp', 'dimension_key'), name='services_metric_natural_key'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_task'),
+        ('services', '0002_metric_natural_key'),
+    ]
+
+    operations = [
+        # Build the composite indexes before dropping the single-column FK indexes they replace.
+        migrations.AddIndex(
+            model_name='metric',
+            index=models.Index(fields=['name', 'timestamp', 'value'], name='services_metric_name_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='metric',
+            index=models.Index(fields=['ingestion_job', 'timestamp'], name='services_metric_job_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='metric',
+            index=models.Index(fields=['timestamp', 'id'], name='services_metric_ts_id_idx'),
+        ),
+        migrations.AlterField(
+            model_name='metric',
+            name='data_source',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='metrics', to='core.datasource'),
+        ),
+        migrations.AlterField(
+            model_name='metric',
+            name='ingestion_job',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, to='core.ingestionjob'),
+        ),
+    ]
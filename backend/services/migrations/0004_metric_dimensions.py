@@ -0,0 +1,56 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('services', '0003_metric_timeseries_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Dimension',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DimensionValue',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('value', models.CharField(max_length=255)),
+                ('dimension', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='values', to='services.dimension')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='MetricDimension',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dimension', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='metric_links', to='services.dimension')),
+                ('metric', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='dimension_links', to='services.metric')),
+                ('value', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='metric_links', to='services.dimensionvalue')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='metric',
+            name='dimension_values',
+            field=models.ManyToManyField(blank=True, related_name='metrics', through='services.MetricDimension', to='services.dimensionvalue'),
+        ),
+        migrations.AddConstraint(
+            model_name='dimensionvalue',
+            constraint=models.UniqueConstraint(fields=('dimension', 'value'), name='services_dimensionvalue_unique'),
+        ),
+        migrations.AddIndex(
+            model_name='metricdimension',
+            index=models.Index(fields=['value', 'metric'], name='services_metricdim_value_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='metricdimension',
+            constraint=models.UniqueConstraint(fields=('metric', 'dimension'), name='services_metricdimension_unique'),
+        ),
+    ]
@@ -0,0 +1,74 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:18
+
+from datetime import timezone as dt_timezone
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, F, Max, Min, Sum
+from django.db.models.functions import TruncDay, TruncHour, TruncMonth
+
+# Frozen copy of services.rollups as of this migration, so later changes there cannot alter it.
+TRUNC = {'hour': TruncHour, 'day': TruncDay, 'month': TruncMonth}
+STAT_FIELDS = ('count', 'sum', 'min', 'max', 'sumsq')
+BATCH_SIZE = 5000
+
+
+def build_rollups(apps, schema_editor):
+    """Fill MetricRollup from existing metrics, one grouped query per grain."""
+    Metric = apps.get_model('services', 'Metric')
+    MetricRollup = apps.get_model('services', 'MetricRollup')
+
+    for grain, trunc in TRUNC.items():
+        rows = (
+            Metric.objects.annotate(bucket=trunc('timestamp', tzinfo=dt_timezone.utc))
+            .values('data_source_id', 'name', 'dimension_key', 'bucket')
+            .annotate(
+                count=Count('id'), sum=Sum('value'), min=Min('value'), max=Max('value'),
+                sumsq=Sum(F('value') * F('value')),
+            )
+            .order_by()
+        )
+        batch = []
+        for row in rows.iterator(chunk_size=BATCH_SIZE):
+            batch.append(MetricRollup(
+                data_source_id=row['data_source_id'], name=row['name'], dimension_key=row['dimension_key'],
+                grain=grain, bucket_start=row['bucket'], **{field: row[field] for field in STAT_FIELDS},
+            ))
+            if len(batch) >= BATCH_SIZE:
+                MetricRollup.objects.bulk_create(batch)
+                batch = []
+        if batch:
+            MetricRollup.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_task'),
+        ('services', '0004_metric_dimensions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MetricRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('dimension_key', models.CharField(blank=True, default='', max_length=255)),
+                ('grain', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day'), ('month', 'Month')], max_length=10)),
+                ('bucket_start', models.DateTimeField()),
+                ('count', models.BigIntegerField(default=0)),
+                ('sum', models.FloatField(default=0)),
+                ('min', models.FloatField(null=True)),
+                ('max', models.FloatField(null=True)),
+                ('sumsq', models.FloatField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('data_source', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='core.datasource')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['grain', 'name', 'bucket_start'], name='services_rollup_chart_idx')],
+                'constraints': [models.UniqueConstraint(fields=('data_source', 'name', 'dimension_key', 'grain', 'bucket_start'), name='services_metricrollup_bucket')],
+            },
+        ),
+        migrations.RunPython(build_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('services', '0005_metric_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SalesSeriesObject',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=1024, unique=True)),
+                ('etag', models.CharField(max_length=255)),
+                ('size', models.BigIntegerField(default=0)),
+                ('rows', models.IntegerField(default=0)),
+                ('buckets', models.JSONField(default=dict)),
+                ('processed_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SalesSeriesBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('grain', models.CharField(choices=[('day', 'Day'), ('week', 'Week'), ('month', 'Month')], max_length=10)),
+                ('bucket_start', models.DateTimeField()),
+                ('total', models.FloatField(default=0)),
+                ('count', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('grain', 'bucket_start'), name='services_salesseries_bucket')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_task'),
+        ('services', '0006_sales_series'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='metric',
+            index=models.Index(fields=['data_source', 'timestamp', 'id'], name='services_metric_source_ts_idx'),
+        ),
+    ]
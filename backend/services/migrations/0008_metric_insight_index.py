@@ -0,0 +1,25 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:33
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_task'),
+        ('services', '0007_metric_source_listing_index'),
+    ]
+
+    operations = [
+        # Create the composite index before dropping the single-column FK index it replaces.
+        migrations.AddIndex(
+            model_name='metric',
+            index=models.Index(fields=['insight', 'timestamp', 'id'], name='services_metric_insight_ts_idx'),
+        ),
+        migrations.AlterField(
+            model_name='metric',
+            name='insight',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='metrics', to='services.insight'),
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:35
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Case, F, Value, When
+
+
+def move_legacy_states(apps, schema_editor):
+    """
+    The old acknowledge/dismiss views wrote ACKNOWLEDGED/DISMISSED into the
+    delivery `status`. Move those into `state` and restore the delivery
+    status from `sent`, in one UPDATE.
+    """
+    Alert = apps.get_model('services', 'Alert')
+    Alert.objects.filter(status__in=['ACKNOWLEDGED', 'DISMISSED']).update(
+        state=F('status'),
+        status=Case(When(sent=True, then=Value('SENT')), default=Value('PENDING')),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('services', '0008_metric_insight_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='alert',
+            name='acknowledged_by',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='alert',
+            name='archived_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='alert',
+            name='dismissed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='alert',
+            name='dismissed_by',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='alert',
+            name='state',
+            field=models.CharField(choices=[('OPEN', 'Open'), ('ACKNOWLEDGED', 'Acknowledged'), ('DISMISSED', 'Dismissed'), ('ARCHIVED', 'Archived')], default='OPEN', max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='alert',
+            index=models.Index(fields=['state', 'severity', 'timestamp'], name='services_alert_state_idx'),
+        ),
+        migrations.RunPython(move_legacy_states, migrations.RunPython.noop),
+    ]
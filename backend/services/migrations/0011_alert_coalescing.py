@@ -0,0 +1,34 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:40
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('services', '0010_alert_delivery'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='alert',
+            name='coalesce_key',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='alert',
+            name='last_seen_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='alert',
+            name='occurrences',
+            field=models.IntegerField(default=1),
+        ),
+        migrations.AddIndex(
+            model_name='alert',
+            index=models.Index(fields=['coalesce_key', 'last_seen_at'], name='services_alert_coalesce_idx'),
+        ),
+    ]
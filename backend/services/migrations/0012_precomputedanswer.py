@@ -0,0 +1,29 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_llmresponse'),
+        ('services', '0011_alert_coalescing'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PrecomputedAnswer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('recommendations', 'Business recommendations'), ('health', 'Business health')], max_length=30)),
+                ('payload', models.JSONField(default=dict)),
+                ('generated_at', models.DateTimeField()),
+                ('last_error', models.TextField(blank=True, null=True)),
+                ('data_source', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='precomputed_answers', to='core.datasource')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('data_source', 'kind'), name='services_precomputed_answer'), models.UniqueConstraint(condition=models.Q(('data_source__isnull', True)), fields=('kind',), name='services_precomputed_global_answer')],
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_llmresponse'),
+        ('services', '0012_precomputedanswer'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnsweredQuestion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=40, unique=True)),
+                ('question', models.TextField()),
+                ('normalized', models.TextField()),
+                ('signature', models.JSONField()),
+                ('answer', models.JSONField()),
+                ('answer_ms', models.FloatField(default=0)),
+                ('hits', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField()),
+                ('last_hit_at', models.DateTimeField(blank=True, null=True)),
+                ('data_source', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='answered_questions', to='core.datasource')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['data_source', 'created_at'], name='services_answered_source_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 13:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_llmresponse'),
+        ('services', '0013_answeredquestion'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='metricrollup',
+            index=models.Index(fields=['grain', 'name', 'dimension_key', 'bucket_start'], name='services_rollup_dimension_idx'),
+        ),
+    ]
@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.db import models
 
 # Assuming this is the correct path for your core models
@@ -11,17 +12,164 @@ INSIGHT_SOURCE_CHOICES = (
 )
 
 class Metric(models.Model):
-    data_source = models.ForeignKey(DataSource, on_delete=models.CASCADE, related_name="metrics")
+    # data_source, ingestion_job and insight lookups are served by the composite indexes below.
+    data_source = models.ForeignKey(DataSource, on_delete=models.CASCADE, related_name="metrics", db_index=False)
     name = models.CharField(max_length=255)   # e.g., "Daily Sales", "Customer Sentiment Score"
     value = models.FloatField()
     timestamp = models.DateTimeField()
-    ingestion_job = models.ForeignKey(IngestionJob, on_delete=models.SET_NULL, null=True, blank=True)
-    insight = models.ForeignKey("Insight", on_delete=models.SET_NULL, null=True, blank=True, related_name="metrics")
+    ingestion_job = models.ForeignKey(IngestionJob, on_delete=models.SET_NULL, null=True, blank=True, db_index=False)
+    insight = models.ForeignKey(
+        "Insight", on_delete=models.SET_NULL, null=True, blank=True, related_name="metrics", db_index=False
+    )
     metadata = models.JSONField(null=True, blank=True)
+    # Product dimension ('' when none); part of the natural key so re-posted batches are idempotent.
+    dimension_key = models.CharField(max_length=255, blank=True, default='')
+    # Every scalar metadata key, normalised for SQL filters and group-bys (see services.dimensions).
+    dimension_values = models.ManyToManyField(
+        "DimensionValue", through="MetricDimension", related_name="metrics", blank=True
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['data_source', 'name', 'timestamp', 'dimension_key'],
+                name='services_metric_natural_key',
+            ),
+        ]
+        # The natural key above doubles as the (data_source, name, timestamp) index.
+        indexes = [
+            # Chart/summary views: filter on name, range or order on timestamp, aggregate value.
+            # Including value makes it a covering index for Sum/Avg over a time window.
+            models.Index(fields=['name', 'timestamp', 'value'], name='services_metric_name_ts_idx'),
+            # start_bedrock_analysis: metrics of one job in time order.
+            models.Index(fields=['ingestion_job', 'timestamp'], name='services_metric_job_ts_idx'),
+            # Unfiltered newest-first listing (MetricViewSet).
+            models.Index(fields=['timestamp', 'id'], name='services_metric_ts_id_idx'),
+            # MetricViewSet filtered to one data source: keyset pages on (timestamp, id).
+            models.Index(fields=['data_source', 'timestamp', 'id'], name='services_metric_source_ts_idx'),
+            # Insight metric previews and /insights/{id}/metrics/ pages, newest first.
+            models.Index(fields=['insight', 'timestamp', 'id'], name='services_metric_insight_ts_idx'),
+        ]
 
     def __str__(self):
         return f"{self.name} = {self.value} @ {self.timestamp}"
 
+class Dimension(models.Model):
+    """A metadata key promoted to a queryable dimension, e.g. "product" or "region"."""
+    name = models.CharField(max_length=100, unique=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.name
+
+class DimensionValue(models.Model):
+    dimension = models.ForeignKey(Dimension, on_delete=models.CASCADE, related_name="values", db_index=False)
+    value = models.CharField(max_length=255)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['dimension', 'value'], name='services_dimensionvalue_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.dimension.name}={self.value}"
+
+class MetricDimension(models.Model):
+    """Links a metric to its value for one dimension (at most one value per dimension)."""
+    metric = models.ForeignKey(Metric, on_delete=models.CASCADE, related_name="dimension_links", db_index=False)
+    dimension = models.ForeignKey(Dimension, on_delete=models.CASCADE, related_name="metric_links")
+    value = models.ForeignKey(DimensionValue, on_delete=models.CASCADE, related_name="metric_links", db_index=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['metric', 'dimension'], name='services_metricdimension_unique'),
+        ]
+        indexes = [
+            # Filter metrics by dimension value.
+            models.Index(fields=['value', 'metric'], name='services_metricdim_value_idx'),
+        ]
+
+class MetricRollup(models.Model):
+    """
+    Pre-aggregated metric bucket per data source, metric name and product
+    dimension, kept current by services.rollups at ingest time.
+    """
+    GRAIN_CHOICES = [
+        ("hour", "Hour"),
+        ("day", "Day"),
+        ("month", "Month"),
+    ]
+    data_source = models.ForeignKey(DataSource, on_delete=models.CASCADE, related_name="rollups", db_index=False)
+    name = models.CharField(max_length=255)
+    dimension_key = models.CharField(max_length=255, blank=True, default='')
+    grain = models.CharField(max_length=10, choices=GRAIN_CHOICES)
+    bucket_start = models.DateTimeField()
+    count = models.BigIntegerField(default=0)
+    sum = models.FloatField(default=0)
+    min = models.FloatField(null=True)
+    max = models.FloatField(null=True)
+    sumsq = models.FloatField(default=0)   # sum of squares, for variance/stddev
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['data_source', 'name', 'dimension_key', 'grain', 'bucket_start'],
+                name='services_metricrollup_bucket',
+            ),
+        ]
+        indexes = [
+            # Chart views: one metric name at one grain over a time range, across data sources.
+            models.Index(fields=['grain', 'name', 'bucket_start'], name='services_rollup_chart_idx'),
+            # Local answers for one product ("sales for Product Bravo in March"), across data sources.
+            models.Index(fields=['grain', 'name', 'dimension_key', 'bucket_start'], name='services_rollup_dimension_idx'),
+        ]
+
+    @property
+    def avg(self):
+        return self.sum / self.count if self.count else None
+
+    def __str__(self):
+        return f"{self.name} [{self.grain} {self.bucket_start:%Y-%m-%d %H:%M}] sum={self.sum} n={self.count}"
+
+class SalesSeriesObject(models.Model):
+    """
+    A raw-data CSV folded into the sales series, keyed by object key and
+    ETag so services.sales_series only reprocesses new or changed objects.
+    `buckets` keeps this object's own contribution ({grain: {bucket start:
+    [sum, count]}}) so it can be subtracted again when the object changes.
+    """
+    key = models.CharField(max_length=1024, unique=True)
+    etag = models.CharField(max_length=255)
+    size = models.BigIntegerField(default=0)
+    rows = models.IntegerField(default=0)
+    buckets = models.JSONField(default=dict)
+    processed_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.key} ({self.etag})"
+
+
+class SalesSeriesBucket(models.Model):
+    """Daily_Sales total per day/week/month bucket, merged across all SalesSeriesObjects."""
+    GRAIN_CHOICES = [
+        ("day", "Day"),
+        ("week", "Week"),
+        ("month", "Month"),
+    ]
+    grain = models.CharField(max_length=10, choices=GRAIN_CHOICES)
+    bucket_start = models.DateTimeField()
+    total = models.FloatField(default=0)
+    count = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['grain', 'bucket_start'], name='services_salesseries_bucket'),
+        ]
+
+    def __str__(self):
+        return f"Sales [{self.grain} {self.bucket_start:%Y-%m-%d}] total={self.total} n={self.count}"
+
 class Insight(models.Model):
     # --- NEW FIELD FOR AI/ML INTEGRATION ---
     source = models.CharField(
@@ -53,9 +201,49 @@ class Alert(models.Model):
     recipient = models.CharField(max_length=255, blank=True, null=True)  # email or phone
     
     severity = models.IntegerField(default=5, help_text="Severity score, e.g., from 1 (low) to 10 (critical)")
-    status = models.CharField(max_length=20, default='PENDING', choices=[('PENDING', 'Pending'), ('SENT', 'Sent'), ('FAILED', 'Failed')])
+    # Delivery status of the notification; the operator workflow lives in `state`.
+    status = models.CharField(max_length=20, default='PENDING', choices=[('PENDING', 'Pending'), ('SENDING', 'Sending'), ('SENT', 'Sent'), ('FAILED', 'Failed')])
     details_json = models.JSONField(blank=True, null=True, help_text="Detailed alert metadata.")
+
+    # Delivery bookkeeping for services.alert_dispatch.
+    attempts = models.IntegerField(default=0)
+    next_attempt_at = models.DateTimeField(blank=True, null=True)   # retry time, or lease expiry while SENDING
+    claimed_by = models.CharField(max_length=255, blank=True, null=True)
+    last_error = models.TextField(blank=True, null=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+
+    # Coalescing (services.alerts.raise_alert): repeats of an open alert within
+    # the window bump occurrences/last_seen_at instead of adding rows.
+    coalesce_key = models.CharField(max_length=255, blank=True, default='')
+    occurrences = models.IntegerField(default=1)
+    last_seen_at = models.DateTimeField(blank=True, null=True)
+
+    STATE_CHOICES = [
+        ("OPEN", "Open"),
+        ("ACKNOWLEDGED", "Acknowledged"),
+        ("DISMISSED", "Dismissed"),
+        ("ARCHIVED", "Archived"),
+    ]
+    state = models.CharField(max_length=20, default='OPEN', choices=STATE_CHOICES)
     acknowledged_at = models.DateTimeField(blank=True, null=True)
+    acknowledged_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name="+"
+    )
+    dismissed_at = models.DateTimeField(blank=True, null=True)
+    dismissed_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name="+"
+    )
+    archived_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            # Alert inbox and bulk actions: alerts in a state, by severity, over a time range.
+            models.Index(fields=['state', 'severity', 'timestamp'], name='services_alert_state_idx'),
+            # Dispatcher: due PENDING alerts and expired SENDING leases.
+            models.Index(fields=['status', 'next_attempt_at'], name='services_alert_dispatch_idx'),
+            # Coalescing fallback when the cache index misses.
+            models.Index(fields=['coalesce_key', 'last_seen_at'], name='services_alert_coalesce_idx'),
+        ]
 
     def __str__(self):
         return f"{self.type} alert for {self.insight.title} sent={self.sent}"
@@ -86,4 +274,60 @@ class ForecastPrediction(models.Model):
         verbose_name_plural = "Forecast Predictions"
 
     def __str__(self):
-        return f"Forecast for {self.metric_name} on {self.data_source.name}"
\ No newline at end of file
+        return f"Forecast for {self.metric_name} on {self.data_source.name}"
+
+class PrecomputedAnswer(models.Model):
+    """
+    A stored Amazon Q answer for a fixed dashboard prompt (see
+    services.precompute), per data source; data_source is null for the
+    all-sources answer. Served until stale, refreshed in the background.
+    """
+    KIND_CHOICES = [
+        ("recommendations", "Business recommendations"),
+        ("health", "Business health"),
+    ]
+    data_source = models.ForeignKey(DataSource, on_delete=models.CASCADE, null=True, blank=True,
+                                    related_name="precomputed_answers")
+    kind = models.CharField(max_length=30, choices=KIND_CHOICES)
+    payload = models.JSONField(default=dict)
+    generated_at = models.DateTimeField()
+    last_error = models.TextField(blank=True, null=True)  # most recent failed refresh, kept out of payload
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['data_source', 'kind'], name='services_precomputed_answer'),
+            # NULLs never collide in the constraint above.
+            models.UniqueConstraint(fields=['kind'], condition=models.Q(data_source__isnull=True),
+                                    name='services_precomputed_global_answer'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} answer for {self.data_source_id or 'all sources'} @ {self.generated_at}"
+
+
+class AnsweredQuestion(models.Model):
+    """
+    An Amazon Q answer to a natural-language question, reused for equivalent
+    questions by services.question_cache. `normalized` is the question's
+    sorted token set and `signature` its MinHash.
+    """
+    data_source = models.ForeignKey(DataSource, on_delete=models.CASCADE, null=True, blank=True,
+                                    related_name="answered_questions")
+    key = models.CharField(max_length=40, unique=True)  # sha1 of (data source, normalized)
+    question = models.TextField()
+    normalized = models.TextField()
+    signature = models.JSONField()
+    answer = models.JSONField()
+    answer_ms = models.FloatField(default=0)  # how long Q took, i.e. what each hit saves
+    hits = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField()
+    last_hit_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            # Similarity index load, invalidation and eviction per data source.
+            models.Index(fields=['data_source', 'created_at'], name='services_answered_source_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.question[:60]} ({self.hits} hits)"
@@ -0,0 +1,63 @@
+# services/object_store.py
+"""
+Minimal object-store interface over the raw-data lake.
+
+    store = get_object_store()
+    for obj in store.list('raw-data/'):
+        body = store.read(obj.key)
+
+S3ObjectStore pages through list_objects_v2 (no 1000-key ceiling);
+LocalObjectStore serves a directory tree the same way, for development and
+tests. Both report an ETag per object so callers can skip unchanged ones.
+"""
+import os
+from collections import namedtuple
+
+from django.conf import settings
+
+from core.aws_clients import get_client
+
+ObjectInfo = namedtuple('ObjectInfo', 'key etag size')
+
+
+class S3ObjectStore:
+    def __init__(self, bucket, client=None):
+        self.bucket = bucket
+        self.client = client or get_client('s3')
+
+    def list(self, prefix=''):
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+            for obj in page.get('Contents', []):
+                yield ObjectInfo(obj['Key'], obj['ETag'].strip('"'), obj['Size'])
+
+    def read(self, key):
+        return self.client.get_object(Bucket=self.bucket, Key=key)['Body'].read()
+
+
+class LocalObjectStore:
+    """Directory-backed store; keys are '/'-separated paths relative to `root`."""
+
+    def __init__(self, root):
+        self.root = root
+
+    def list(self, prefix=''):
+        for directory, _, files in os.walk(self.root):
+            for filename in sorted(files):
+                path = os.path.join(directory, filename)
+                key = os.path.relpath(path, self.root).replace(os.sep, '/')
+                if key.startswith(prefix):
+                    info = os.stat(path)
+                    # mtime + size stands in for an ETag without reading the file.
+                    yield ObjectInfo(key, f"{info.st_mtime_ns:x}-{info.st_size:x}", info.st_size)
+
+    def read(self, key):
+        with open(os.path.join(self.root, *key.split('/')), 'rb') as f:
+            return f.read()
+
+
+def get_object_store():
+    """The raw-data store configured by DATA_LAKE_STORE ('s3' or 'local')."""
+    if settings.DATA_LAKE_STORE == 'local':
+        return LocalObjectStore(settings.DATA_LAKE_LOCAL_ROOT)
+    return S3ObjectStore(settings.DATA_LAKE_BUCKET)
@@ -0,0 +1,120 @@
+# services/precompute.py
+"""
+Precomputed Amazon Q answers for the dashboard's fixed prompts.
+
+BusinessRecommendationsView and BusinessHealthView used to send the same
+prompt to Q chat_sync on every GET, seconds per page view. The answers are
+now produced by refresh_answers() and stored as PrecomputedAnswer rows (one
+per kind and data source) with their generation time:
+
+* a "services.refresh_precomputed_answers" task refreshes a data source's
+  answers, and the all-sources answers, whenever its metrics are written
+  (services.ingest) or a file is synced to Amazon Q (enqueue_refresh(),
+  skipped when one is already pending), and `manage.py
+  refresh_precomputed_answers` does it on a schedule;
+* read_answer() serves the stored answer from the Django cache (kept for
+  CACHE_SECONDS), falling back to one indexed row read;
+* stale-while-revalidate: an answer older than PRECOMPUTE_FRESH_SECONDS is
+  still served, flagged stale, and a background refresh is queued (at most
+  once per PRECOMPUTE_REFRESH_LOCK_SECONDS per answer).
+
+A failed refresh keeps the previous answer and records last_error, so Q
+traffic follows data changes and the refresh schedule, not page views.
+"""
+import sys
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from core.models import DataSource, Task
+from core.queue import enqueue
+
+from .amazon_q_service import BizPulseAmazonQService
+from .models import PrecomputedAnswer
+
+REFRESH_TASK = "services.refresh_precomputed_answers"
+# kind -> BizPulseAmazonQService method answering it
+ANSWERS = {
+    'recommendations': 'get_business_recommendations',
+    'health': 'analyze_business_health',
+}
+# Per-process cache lifetime, so every process soon sees a refresh made elsewhere.
+CACHE_SECONDS = 60
+
+
+def _cache_key(kind, data_source_id):
+    return f"precomputed:{kind}:{data_source_id or 'all'}"
+
+
+def _entry(answer):
+    return {'payload': answer.payload, 'generated_at': answer.generated_at}
+
+
+def enqueue_refresh(data_source_id=None, run_after=None):
+    """
+    Queue a refresh of one data source's answers unless one is already waiting.
+    With `run_after`, a waiting refresh due earlier is pushed back to it, so
+    the refresh does not run before whatever it waits for (an Amazon Q sync).
+    """
+    pending = Task.objects.filter(name=REFRESH_TASK, status="PENDING", payload__data_source_id=data_source_id)
+    if run_after is not None:
+        pending.filter(run_after__lt=run_after).update(run_after=run_after)
+    if not pending.exists():
+        enqueue(REFRESH_TASK, run_after=run_after, data_source_id=data_source_id)
+
+
+def refresh_answers(data_source_id=None, kinds=None, q_service=None):
+    """
+    Ask Q for every kind of answer for one data source (None: all sources)
+    and store the results. Returns {kind: 'refreshed' | 'failed'}.
+    """
+    q_service = q_service or BizPulseAmazonQService()
+    context = None
+    if data_source_id is not None:
+        data_source = DataSource.objects.get(id=data_source_id)
+        context = f"Focus on the '{data_source.name}' data source ({data_source.get_source_type_display()})"
+
+    outcome = {}
+    for kind in kinds or ANSWERS:
+        payload = getattr(q_service, ANSWERS[kind])(business_context=context)
+        now = timezone.now()
+        if 'error' in payload:
+            # Keep serving the last good answer.
+            print(f"DEBUG LOG: Precomputed {kind} refresh for data source {data_source_id} failed: {payload.get('error')}")
+            sys.stdout.flush()
+            PrecomputedAnswer.objects.filter(data_source_id=data_source_id, kind=kind).update(last_error=payload.get('error'))
+            outcome[kind] = 'failed'
+            continue
+        payload['timestamp'] = now.isoformat()
+        answer, _ = PrecomputedAnswer.objects.update_or_create(
+            data_source_id=data_source_id, kind=kind,
+            defaults={'payload': payload, 'generated_at': now, 'last_error': None},
+        )
+        cache.set(_cache_key(kind, data_source_id), _entry(answer), timeout=CACHE_SECONDS)
+        outcome[kind] = 'refreshed'
+    return outcome
+
+
+def read_answer(kind, data_source_id=None, now=None):
+    """
+    The stored answer as {'payload', 'generated_at', 'stale'}, or None when
+    none has been generated yet. Missing or stale answers queue a refresh.
+    """
+    now = now or timezone.now()
+    key = _cache_key(kind, data_source_id)
+    entry = cache.get(key)
+    if entry is None:
+        answer = PrecomputedAnswer.objects.filter(data_source_id=data_source_id, kind=kind).first()
+        if answer is not None:
+            entry = _entry(answer)
+            cache.set(key, entry, timeout=CACHE_SECONDS)
+
+    stale = entry is None or now - entry['generated_at'] > timedelta(seconds=settings.PRECOMPUTE_FRESH_SECONDS)
+    # cache.add is atomic: one refresh per answer per lock period, however many readers see it stale.
+    if stale and cache.add(f"{key}:refreshing", True, timeout=settings.PRECOMPUTE_REFRESH_LOCK_SECONDS):
+        enqueue_refresh(data_source_id)
+    if entry is None:
+        return None
+    return dict(entry, stale=stale)
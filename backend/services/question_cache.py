@@ -0,0 +1,252 @@
+# services/question_cache.py
+"""
+Semantic cache for natural-language questions sent to Amazon Q.
+
+Users ask the same few questions in many phrasings ("what were sales last
+month", "last month's sales?"). Questions are normalized to a token set:
+lowercased, punctuation and possessives dropped, stopwords removed, plurals
+folded and a few synonyms mapped ("revenue" -> "sales"). A previous answer
+is reused when
+
+* the normalized token set is identical (one indexed lookup on `key`), or
+* its MinHash signature estimates a Jaccard similarity of at least
+  QUESTION_CACHE_SIMILARITY with an answered question of the same data
+  source, AND both ask about the same period and numbers.
+
+Similarity alone would match "sales last month" with "sales this month",
+hence the second condition: period words (this/last/month/quarter...) and
+numbers must agree exactly. Signatures of a data source's answered questions are compared
+in one vectorized NumPy pass; there is no external service.
+
+New data for a data source (see the ingest path) deletes its answers and
+the all-sources answers. Hits, misses and the Q time saved are counted
+in the Django cache; stats() reports them.
+"""
+import hashlib
+import re
+import time
+import zlib
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F, Q
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import AnsweredQuestion
+
+STOPWORDS = frozenset("""
+    a an the of for to in on at by with from and or me us i we you my our your is are was were be been
+    what whats which who how much many did do does show tell give please can could would about
+    there their it its value values number
+""".split())
+SYNONYMS = {'revenue': 'sales', 'sale': 'sales', 'turnover': 'sales', 'income': 'sales', 'orders': 'order'}
+# Period and comparison words: a cached answer must agree on all of these, and on any number.
+PERIOD_WORDS = frozenset("""
+    today yesterday tomorrow this last next previous current past day week month quarter year ytd mtd
+    january february march april may june july august september october november december
+    jan feb mar apr jun jul aug sep sept oct nov dec monday tuesday wednesday thursday friday saturday sunday
+    top bottom best worst highest lowest increase decrease growth average total
+""".split())
+
+NUM_PERM = 64
+PRIME = (1 << 31) - 1
+_rng = np.random.RandomState(20251018)
+PERM_A = _rng.randint(1, PRIME, size=NUM_PERM).astype(np.int64)
+PERM_B = _rng.randint(0, PRIME, size=NUM_PERM).astype(np.int64)
+INDEX_CACHE_SECONDS = 60
+
+
+def _stem(token):
+    if token in SYNONYMS:
+        return SYNONYMS[token]
+    if token in PERIOD_WORDS or token.isdigit():
+        return token
+    if len(token) > 4 and token.endswith('ies'):
+        return token[:-3] + 'y'
+    if len(token) > 3 and token.endswith('s') and not token.endswith(('ss', 'us', 'is')):
+        token = token[:-1]
+    return SYNONYMS.get(token, token)
+
+
+def normalize_question(question):
+    """Sorted token tuple of a question, e.g. "Last month's sales?" -> ('last', 'month', 'sales')."""
+    text = question.lower().replace("'s", " ").replace("’s", " ")
+    tokens = {_stem(token) for token in re.findall(r"[a-z0-9]+", text) if token not in STOPWORDS}
+    return tuple(sorted(tokens - STOPWORDS))
+
+
+def _anchors(tokens):
+    return {token for token in tokens if token in PERIOD_WORDS or token.isdigit()}
+
+
+def signature(tokens):
+    """MinHash signature (NUM_PERM ints) of a token set."""
+    if not tokens:
+        return [0] * NUM_PERM
+    hashes = np.array([zlib.crc32(token.encode()) & PRIME for token in tokens], dtype=np.int64)
+    return ((np.outer(hashes, PERM_A) + PERM_B) % PRIME).min(axis=0).tolist()
+
+
+def _key(data_source_id, tokens):
+    return hashlib.sha1(f"{data_source_id or 'all'}|{' '.join(tokens)}".encode()).hexdigest()
+
+
+def _count(counter, amount=1):
+    key = f"question-cache:{counter}"
+    if not cache.add(key, amount, timeout=None):
+        try:
+            cache.incr(key, amount)
+        except ValueError:   # evicted between add() and incr()
+            cache.set(key, amount, timeout=None)
+
+
+def _index(data_source_id, cutoff):
+    """(ids, token tuples, signature matrix) of the source's live answers, cached briefly per process."""
+    cache_key = f"question-cache:index:{data_source_id or 'all'}"
+    index = cache.get(cache_key)
+    if index is None:
+        rows = list(
+            AnsweredQuestion.objects.filter(data_source_id=data_source_id, created_at__gte=cutoff)
+            .values_list('id', 'normalized', 'signature')
+        )
+        index = (
+            [row[0] for row in rows],
+            [tuple(row[1].split()) for row in rows],
+            np.array([row[2] for row in rows], dtype=np.int64).reshape(len(rows), NUM_PERM),
+        )
+        cache.set(cache_key, index, timeout=INDEX_CACHE_SECONDS)
+    return index
+
+
+def _forget_index(data_source_id):
+    cache.delete(f"question-cache:index:{data_source_id or 'all'}")
+
+
+def lookup(question, data_source_id=None, now=None):
+    """
+    A previous answer to an equivalent question as (answer row, similarity),
+    or (None, best similarity seen) on a miss.
+    """
+    now = now or timezone.now()
+    cutoff = now - timedelta(seconds=settings.QUESTION_CACHE_TTL_SECONDS)
+    tokens = normalize_question(question)
+    if not tokens:
+        return None, 0.0
+
+    answer = AnsweredQuestion.objects.filter(key=_key(data_source_id, tokens), created_at__gte=cutoff).first()
+    similarity = 1.0
+    if answer is None:
+        ids, token_sets, signatures = _index(data_source_id, cutoff)
+        if not ids:
+            return None, 0.0
+        scores = (signatures == np.array(signature(tokens), dtype=np.int64)).mean(axis=1)
+        anchors = _anchors(tokens)
+        similarity = 0.0
+        for i in np.argsort(-scores):
+            if scores[i] < settings.QUESTION_CACHE_SIMILARITY:
+                break
+            if _anchors(token_sets[i]) == anchors:
+                answer = AnsweredQuestion.objects.filter(id=ids[i], created_at__gte=cutoff).first()
+                similarity = float(scores[i])
+                break
+        if answer is None:   # also when the row was invalidated by another process
+            return None, float(scores.max())
+
+    AnsweredQuestion.objects.filter(id=answer.id).update(hits=F('hits') + 1, last_hit_at=now)
+    return answer, similarity
+
+
+def store(question, answer, answer_ms, data_source_id=None, now=None):
+    """Remember Q's answer; keeps at most QUESTION_CACHE_MAX_ENTRIES per data source."""
+    now = now or timezone.now()
+    tokens = normalize_question(question)
+    if not tokens:
+        return None
+    row, _ = AnsweredQuestion.objects.update_or_create(
+        key=_key(data_source_id, tokens),
+        defaults={
+            'data_source_id': data_source_id, 'question': question, 'normalized': ' '.join(tokens),
+            'signature': signature(tokens), 'answer': answer, 'answer_ms': answer_ms,
+            'hits': 0, 'created_at': now, 'last_hit_at': None,
+        },
+    )
+    keep = settings.QUESTION_CACHE_MAX_ENTRIES
+    entries = AnsweredQuestion.objects.filter(data_source_id=data_source_id)
+    surplus = list(
+        entries.order_by(Coalesce('last_hit_at', 'created_at').desc(), '-id').values_list('id', flat=True)[keep:]
+    )
+    if surplus:
+        AnsweredQuestion.objects.filter(id__in=surplus).delete()
+    _forget_index(data_source_id)
+    return row
+
+
+def invalidate(*data_source_ids):
+    """New data landed for these data sources: drop their answers and the all-sources ones."""
+    deleted, _ = AnsweredQuestion.objects.filter(
+        Q(data_source_id__in=data_source_ids) | Q(data_source__isnull=True)
+    ).delete()
+    for data_source_id in data_source_ids:
+        _forget_index(data_source_id)
+    _forget_index(None)
+    return deleted
+
+
+def cached_answer(question, data_source_id=None, started=None):
+    """
+    (answer, cache info) for a cached equivalent question, or (None, cache
+    info) on a miss. The info reports hit, similarity, and on a hit the Q
+    time saved in milliseconds.
+    """
+    started = started or time.perf_counter()
+    cached, similarity = lookup(question, data_source_id)
+    if cached is None:
+        return None, {'hit': False, 'similarity': round(similarity, 3)}
+    lookup_ms = (time.perf_counter() - started) * 1000
+    saved_ms = max(cached.answer_ms - lookup_ms, 0)
+    _count('hits')
+    _count('saved_ms', int(saved_ms))
+    return cached.answer, {
+        'hit': True, 'similarity': round(similarity, 3), 'matched_question': cached.question,
+        'lookup_ms': round(lookup_ms, 2), 'saved_ms': round(saved_ms, 1),
+    }
+
+
+def record_answer(question, answer, answer_ms, data_source_id=None):
+    """Count a miss and remember its answer unless it is an error."""
+    _count('misses')
+    if 'error' not in answer:
+        store(question, answer, answer_ms, data_source_id)
+
+
+def answer_question(question, ask, data_source_id=None):
+    """
+    Answer through the cache: ask(question) is only called on a miss.
+    Returns (answer, cache info dict), see cached_answer().
+    """
+    started = time.perf_counter()
+    answer, info = cached_answer(question, data_source_id, started)
+    if answer is not None:
+        return answer, info
+
+    answer = ask(question)
+    answer_ms = (time.perf_counter() - started) * 1000
+    record_answer(question, answer, answer_ms, data_source_id)
+    return answer, dict(info, answer_ms=round(answer_ms, 1))
+
+
+def stats():
+    """Hit/miss counters and Q time saved since the Django cache was last cleared, plus stored entries."""
+    names = ('hits', 'misses', 'saved_ms')
+    counters = cache.get_many([f"question-cache:{name}" for name in names])
+    hits, misses, saved_ms = (counters.get(f"question-cache:{name}", 0) for name in names)
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': round(hits / (hits + misses), 4) if hits + misses else None,
+        'saved_ms': saved_ms,
+        'entries': AnsweredQuestion.objects.count(),
+    }
@@ -0,0 +1,294 @@
+# services/rollups.py
+"""
+Incrementally maintained metric rollups.
+
+MetricRollup holds count/sum/min/max/sumsq per (data_source, name, product
+dimension) bucket at hour, day and month grain, so chart and summary views
+aggregate a few hundred bucket rows instead of the raw Metric history.
+
+write_metrics() calls update_rollups() for every batch inside its
+transaction:
+
+* inserted rows are folded in as deltas with one INSERT ... ON CONFLICT
+  DO UPDATE per batch (count/sum/sumsq add up, min/max widen);
+* buckets touched by updated rows are recomputed from Metric, since a
+  changed value can shrink min/max in a way deltas cannot express.
+
+`manage.py rebuild_rollups` recomputes everything from Metric.
+"""
+from datetime import timedelta, timezone as dt_timezone
+
+from django.db import connection
+from django.db.models import Count, F, Max, Min, Q, Sum
+from django.db.models.functions import Coalesce, TruncDay, TruncHour, TruncMonth, TruncWeek
+from django.utils import timezone
+
+from .models import Metric, MetricRollup
+
+GRAINS = ('hour', 'day', 'month')
+TRUNC = {'hour': TruncHour, 'day': TruncDay, 'month': TruncMonth}
+# Chart buckets served from rollups; weeks are folded from day buckets.
+SERIES_BUCKETS = {'day': TruncDay, 'week': TruncWeek, 'month': TruncMonth}
+ROLLUP_KEY = ('data_source', 'name', 'dimension_key', 'grain', 'bucket_start')
+STAT_FIELDS = ('count', 'sum', 'min', 'max', 'sumsq')
+# Rows per multi-row INSERT; 11 parameters each stays under SQLite's variable limit.
+UPSERT_CHUNK = 500
+
+
+def bucket_start(timestamp, grain):
+    """Start of the UTC bucket of `grain` containing `timestamp`."""
+    timestamp = timestamp.astimezone(dt_timezone.utc)
+    if grain == 'hour':
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    if grain == 'day':
+        return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+    return timestamp.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def bucket_end(start, grain):
+    if grain == 'hour':
+        return start + timedelta(hours=1)
+    if grain == 'day':
+        return start + timedelta(days=1)
+    return (start + timedelta(days=32)).replace(day=1)
+
+
+def stats():
+    return {
+        'count': Count('id'),
+        'sum': Sum('value'),
+        'min': Min('value'),
+        'max': Max('value'),
+        'sumsq': Sum(F('value') * F('value')),
+    }
+
+
+def update_rollups(written):
+    """
+    Fold one written batch into the rollups. `written` holds rows with
+    data_source_id, name, dimension_key, timestamp, value and inserted
+    attributes (services.ingest.WrittenRow).
+    """
+    deltas = {}
+    refresh = set()
+    for row in written:
+        if not row.inserted:
+            refresh.add((row.data_source_id, row.name, row.dimension_key, row.timestamp))
+            continue
+        value = float(row.value)
+        for grain in GRAINS:
+            key = (row.data_source_id, row.name, row.dimension_key, grain, bucket_start(row.timestamp, grain))
+            delta = deltas.get(key)
+            if delta is None:
+                deltas[key] = [1, value, value, value, value * value]
+            else:
+                delta[0] += 1
+                delta[1] += value
+                delta[2] = min(delta[2], value)
+                delta[3] = max(delta[3], value)
+                delta[4] += value * value
+
+    # Deltas first: a recompute afterwards sees the inserted rows and wins.
+    _upsert_deltas(deltas)
+    if refresh:
+        refresh_buckets(refresh)
+
+
+def _upsert_deltas(deltas):
+    if not deltas:
+        return
+    quote = connection.ops.quote_name
+    table = quote(MetricRollup._meta.db_table)
+    columns = [MetricRollup._meta.get_field(name).column for name in ROLLUP_KEY + STAT_FIELDS + ('updated_at',)]
+    key_columns = ', '.join(quote(MetricRollup._meta.get_field(name).column) for name in ROLLUP_KEY)
+    least, greatest = ('LEAST', 'GREATEST') if connection.vendor == 'postgresql' else ('MIN', 'MAX')
+    assignments = ', '.join([
+        f"{quote('count')} = {table}.{quote('count')} + EXCLUDED.{quote('count')}",
+        f"{quote('sum')} = {table}.{quote('sum')} + EXCLUDED.{quote('sum')}",
+        f"{quote('min')} = {least}({table}.{quote('min')}, EXCLUDED.{quote('min')})",
+        f"{quote('max')} = {greatest}({table}.{quote('max')}, EXCLUDED.{quote('max')})",
+        f"{quote('sumsq')} = {table}.{quote('sumsq')} + EXCLUDED.{quote('sumsq')}",
+        f"{quote('updated_at')} = EXCLUDED.{quote('updated_at')}",
+    ])
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    rows = [
+        (data_source_id, name, dimension_key, grain, connection.ops.adapt_datetimefield_value(start), *delta, now)
+        for (data_source_id, name, dimension_key, grain, start), delta in deltas.items()
+    ]
+    placeholder = '(' + ', '.join(['%s'] * len(columns)) + ')'
+    with connection.cursor() as cursor:
+        for offset in range(0, len(rows), UPSERT_CHUNK):
+            chunk = rows[offset:offset + UPSERT_CHUNK]
+            cursor.execute(
+                f"INSERT INTO {table} ({', '.join(quote(column) for column in columns)}) "
+                f"VALUES {', '.join([placeholder] * len(chunk))} "
+                f"ON CONFLICT ({key_columns}) DO UPDATE SET {assignments}",
+                [value for row in chunk for value in row],
+            )
+
+
+def refresh_buckets(points):
+    """Recompute, from Metric, every bucket containing one of `points` (data_source_id, name, dimension_key, timestamp)."""
+    for grain in GRAINS:
+        keys = {(ds, name, dimension_key, bucket_start(timestamp, grain)) for ds, name, dimension_key, timestamp in points}
+        starts = [key[3] for key in keys]
+        rows = (
+            Metric.objects.filter(
+                data_source_id__in={key[0] for key in keys},
+                name__in={key[1] for key in keys},
+                dimension_key__in={key[2] for key in keys},
+                timestamp__gte=min(starts),
+                timestamp__lt=bucket_end(max(starts), grain),
+            )
+            .annotate(bucket=TRUNC[grain]('timestamp', tzinfo=dt_timezone.utc))
+            .values('data_source_id', 'name', 'dimension_key', 'bucket')
+            .annotate(**stats())
+        )
+        MetricRollup.objects.bulk_create(
+            [
+                MetricRollup(
+                    data_source_id=row['data_source_id'], name=row['name'], dimension_key=row['dimension_key'],
+                    grain=grain, bucket_start=row['bucket'], **{field: row[field] for field in STAT_FIELDS},
+                )
+                for row in rows.iterator()
+                if (row['data_source_id'], row['name'], row['dimension_key'], row['bucket']) in keys
+            ],
+            update_conflicts=True,
+            unique_fields=ROLLUP_KEY,
+            update_fields=STAT_FIELDS + ('updated_at',),
+        )
+
+
+def rebuild_rollups(data_source_id=None, grains=GRAINS, batch_size=5000):
+    """
+    Drop and recompute rollups from the raw metrics, one grouped query per
+    grain. Returns {grain: buckets written}.
+    """
+    metrics = Metric.objects.all()
+    rollups = MetricRollup.objects.filter(grain__in=grains)
+    if data_source_id is not None:
+        metrics = metrics.filter(data_source_id=data_source_id)
+        rollups = rollups.filter(data_source_id=data_source_id)
+    rollups.delete()
+
+    written = {}
+    for grain in grains:
+        rows = (
+            metrics.annotate(bucket=TRUNC[grain]('timestamp', tzinfo=dt_timezone.utc))
+            .values('data_source_id', 'name', 'dimension_key', 'bucket')
+            .annotate(**stats())
+            .order_by()
+        )
+        batch, written[grain] = [], 0
+        for row in rows.iterator(chunk_size=batch_size):
+            batch.append(MetricRollup(
+                data_source_id=row['data_source_id'], name=row['name'], dimension_key=row['dimension_key'],
+                grain=grain, bucket_start=row['bucket'], **{field: row[field] for field in STAT_FIELDS},
+            ))
+            if len(batch) >= batch_size:
+                MetricRollup.objects.bulk_create(batch)
+                written[grain] += len(batch)
+                batch = []
+        if batch:
+            MetricRollup.objects.bulk_create(batch)
+            written[grain] += len(batch)
+    return written
+
+
+def rollup_totals(name, start=None, end=None, data_source_id=None):
+    """
+    {'sum', 'count', 'avg'} of metric `name` from rollups. Whole history reads
+    month buckets; a [start, end) window reads day buckets, so window edges
+    must fall on UTC midnight.
+    """
+    grain = 'day' if start is not None or end is not None else 'month'
+    rollups = MetricRollup.objects.filter(grain=grain, name=name)
+    if start is not None:
+        rollups = rollups.filter(bucket_start__gte=start)
+    if end is not None:
+        rollups = rollups.filter(bucket_start__lt=end)
+    if data_source_id is not None:
+        rollups = rollups.filter(data_source_id=data_source_id)
+    totals = rollups.aggregate(sum=Sum('sum'), count=Sum('count'))
+    totals['sum'] = totals['sum'] or 0
+    totals['count'] = totals['count'] or 0
+    totals['avg'] = totals['sum'] / totals['count'] if totals['count'] else None
+    return totals
+
+
+def rollup_series(name, bucket='month', start=None, end=None, data_source_id=None):
+    """
+    Per-product totals of metric `name` by day, week (Monday start) or month,
+    in one GROUP BY over the rollups. `start`/`end` bound a [start, end)
+    window at day granularity (UTC). Yields dicts with period, dimension_key
+    and total, ordered by period.
+    """
+    # Month buckets can come straight from month rollups unless a bound cuts a month.
+    aligned = all(bound is None or (bound.day == 1 and bound == bucket_start(bound, 'day')) for bound in (start, end))
+    grain = 'month' if bucket == 'month' and aligned else 'day'
+    rollups = MetricRollup.objects.filter(grain=grain, name=name)
+    if start is not None:
+        rollups = rollups.filter(bucket_start__gte=start)
+    if end is not None:
+        rollups = rollups.filter(bucket_start__lt=end)
+    if data_source_id is not None:
+        rollups = rollups.filter(data_source_id=data_source_id)
+    return (
+        rollups.annotate(period=SERIES_BUCKETS[bucket]('bucket_start', tzinfo=dt_timezone.utc))
+        .values('period', 'dimension_key')
+        .annotate(total=Sum('sum'))
+        .order_by('period', 'dimension_key')
+    )
+
+
+# Ranking periods in days; 'all' ranks on all-time revenue.
+RANKING_PERIODS = {'7d': 7, '30d': 30, '90d': 90, '365d': 365, 'all': None}
+# Growth window used when ranking on all-time revenue.
+DEFAULT_GROWTH_DAYS = 30
+
+
+def rank_products(name='Daily_Sales', period='all', limit=10, data_source_id=None, now=None):
+    """
+    Rank products by revenue of metric `name` over `period`, with
+    period-over-period growth, in one grouped conditional-sum query over day
+    rollups.
+
+    Growth compares the last N days with the N days before them (N = the
+    period, or DEFAULT_GROWTH_DAYS for 'all'); it is None when the previous
+    window has no revenue. Returns dicts with name, revenue, previous_revenue
+    and growth, highest revenue first.
+    """
+    days = RANKING_PERIODS[period]
+    growth_days = days or DEFAULT_GROWTH_DAYS
+    end = bucket_start(now or timezone.now(), 'day') + timedelta(days=1)
+    current_start = end - timedelta(days=growth_days)
+    previous_start = current_start - timedelta(days=growth_days)
+
+    rollups = MetricRollup.objects.filter(grain='day', name=name, bucket_start__lt=end).exclude(
+        dimension_key__in=['', 'Unknown']
+    )
+    if days is not None:
+        rollups = rollups.filter(bucket_start__gte=previous_start)
+    if data_source_id is not None:
+        rollups = rollups.filter(data_source_id=data_source_id)
+
+    revenue = Sum('sum', filter=Q(bucket_start__gte=current_start)) if days else Sum('sum')
+    ranked = (
+        rollups.values('dimension_key')
+        .annotate(
+            revenue=Coalesce(revenue, 0.0),
+            current=Coalesce(Sum('sum', filter=Q(bucket_start__gte=current_start)), 0.0),
+            previous=Coalesce(Sum('sum', filter=Q(bucket_start__gte=previous_start, bucket_start__lt=current_start)), 0.0),
+        )
+        .order_by('-revenue', 'dimension_key')[:limit]
+    )
+    return [
+        {
+            'name': row['dimension_key'],
+            'revenue': row['revenue'],
+            'previous_revenue': row['previous'],
+            # + 0.0 turns a rounded -0.0 into 0.0
+            'growth': round((row['current'] - row['previous']) / row['previous'] * 100, 1) + 0.0 if row['previous'] else None,
+        }
+        for row in ranked
+    ]
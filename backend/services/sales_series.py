@@ -0,0 +1,161 @@
+# services/sales_series.py
+"""
+Materialized Daily_Sales series over the raw-data CSVs in the data lake.
+
+EnhancedSalesDataView used to list the bucket and parse every CSV on each
+request. Instead, refresh_sales_series() (run by `manage.py
+refresh_sales_series` or the "services.refresh_sales_series" task) walks the
+store listing and only downloads objects whose ETag changed since the last
+refresh:
+
+* each object's per-bucket [sum, count] is kept on its SalesSeriesObject;
+* SalesSeriesBucket holds the merged totals, so a changed object is folded
+  in by subtracting its previous contribution and adding the new one, and
+  a deleted object by subtracting it.
+
+sales_series() then serves a chart straight from SalesSeriesBucket, in
+O(buckets) regardless of how many files the lake holds.
+"""
+import io
+import sys
+from datetime import datetime
+
+import pandas as pd
+from django.conf import settings
+from django.db import transaction
+
+from .models import SalesSeriesBucket, SalesSeriesObject
+from .object_store import get_object_store
+
+SERIES_METRIC = 'Daily_Sales'
+GRAINS = ('day', 'week', 'month')
+# EnhancedSalesDataView ?timeframe= values
+TIMEFRAMES = {'daily': 'day', 'weekly': 'week', 'monthly': 'month'}
+# Bucket starts per IN (...) lookup, under SQLite's variable limit.
+LOOKUP_CHUNK = 500
+
+
+def object_buckets(body):
+    """
+    Parse one raw-data CSV (metric_name, value, timestamp columns) and return
+    ({grain: {ISO bucket start: [sum, count]}}, number of sales rows).
+    """
+    df = pd.read_csv(io.BytesIO(body))
+    if not {'metric_name', 'value', 'timestamp'} <= set(df.columns):
+        return {}, 0
+
+    sales = df.loc[df['metric_name'] == SERIES_METRIC, ['value', 'timestamp']]
+    sales = pd.DataFrame({
+        'value': pd.to_numeric(sales['value'], errors='coerce'),
+        'timestamp': pd.to_datetime(sales['timestamp'], utc=True, errors='coerce'),
+    }).dropna()
+
+    day = sales['timestamp'].dt.floor('D')
+    starts = {
+        'day': day,
+        'week': day - pd.to_timedelta(day.dt.weekday, unit='D'),   # ISO weeks start on Monday
+        'month': day - pd.to_timedelta(day.dt.day - 1, unit='D'),
+    }
+    contribution = {}
+    for grain in GRAINS:
+        grouped = sales['value'].groupby(starts[grain]).agg(['sum', 'count'])
+        contribution[grain] = {
+            start.isoformat(): [float(row['sum']), int(row['count'])]
+            for start, row in grouped.iterrows()
+        }
+    return contribution, len(sales)
+
+
+def _locked_buckets(grain, starts):
+    """{bucket start: row} for the existing SalesSeriesBuckets among `starts`, locked for update."""
+    rows = {}
+    for i in range(0, len(starts), LOOKUP_CHUNK):
+        chunk = SalesSeriesBucket.objects.select_for_update().filter(
+            grain=grain, bucket_start__in=starts[i:i + LOOKUP_CHUNK],
+        ).order_by('bucket_start')
+        rows.update((row.bucket_start, row) for row in chunk)
+    return rows
+
+
+def _merge(contribution, sign):
+    """Add (sign=1) or subtract (sign=-1) one object's contribution to SalesSeriesBucket."""
+    for grain, buckets in contribution.items():
+        deltas = {datetime.fromisoformat(start): values for start, values in buckets.items()}
+        existing, missing = {}, sorted(deltas)
+        while missing:
+            if sign > 0:
+                # Another refresh may insert the same bucket concurrently: insert empty rows, keep
+                # whichever wins, then add to the locked row.
+                SalesSeriesBucket.objects.bulk_create(
+                    [SalesSeriesBucket(grain=grain, bucket_start=start) for start in missing],
+                    ignore_conflicts=True,
+                )
+            existing.update(_locked_buckets(grain, missing))
+            # A bucket emptied and deleted by another refresh before we locked it is inserted again.
+            missing = [start for start in missing if start not in existing] if sign > 0 else []
+
+        changed, emptied = [], []
+        for start, row in existing.items():
+            total, count = deltas[start]
+            row.total += sign * total
+            row.count += sign * count
+            (emptied if row.count <= 0 else changed).append(row)
+
+        SalesSeriesBucket.objects.bulk_update(changed, ['total', 'count'], batch_size=LOOKUP_CHUNK)
+        SalesSeriesBucket.objects.filter(id__in=[row.id for row in emptied]).delete()
+
+
+def refresh_sales_series(store=None, prefix=None):
+    """
+    Fold new, changed and deleted CSVs under `prefix` into the sales series.
+    Each object commits on its own, so a bad file only skips itself. Returns
+    counts of processed, unchanged, removed and failed objects.
+    """
+    store = store or get_object_store()
+    prefix = settings.DATA_LAKE_PREFIX if prefix is None else prefix
+    known = dict(SalesSeriesObject.objects.filter(key__startswith=prefix).values_list('key', 'etag'))
+    counts = {'processed': 0, 'unchanged': 0, 'removed': 0, 'failed': 0}
+    seen = set()
+
+    for obj in store.list(prefix):
+        if not obj.key.endswith('.csv'):
+            continue
+        seen.add(obj.key)
+        if known.get(obj.key) == obj.etag:
+            counts['unchanged'] += 1
+            continue
+        try:
+            contribution, rows = object_buckets(store.read(obj.key))
+        except Exception as e:
+            print(f"DEBUG LOG: Skipping {obj.key} in sales series refresh: {e}")
+            sys.stdout.flush()
+            counts['failed'] += 1
+            continue
+
+        with transaction.atomic():
+            # Re-read under lock: a concurrent refresh may have folded this key in already.
+            previous = SalesSeriesObject.objects.select_for_update().filter(key=obj.key).first()
+            if previous is not None:
+                _merge(previous.buckets, -1)
+            _merge(contribution, 1)
+            SalesSeriesObject.objects.update_or_create(
+                key=obj.key,
+                defaults={'etag': obj.etag, 'size': obj.size, 'rows': rows, 'buckets': contribution},
+            )
+        counts['processed'] += 1
+
+    for key in set(known) - seen:
+        with transaction.atomic():
+            removed = SalesSeriesObject.objects.select_for_update().filter(key=key).first()
+            if removed is not None:
+                _merge(removed.buckets, -1)
+                removed.delete()
+                counts['removed'] += 1
+    return counts
+
+
+def sales_series(grain):
+    """[(bucket start, total)] of the materialized series at `grain`, oldest first."""
+    return list(
+        SalesSeriesBucket.objects.filter(grain=grain).order_by('bucket_start').values_list('bucket_start', 'total')
+    )
@@ -27,11 +27,13 @@ class MetricCreateSerializer(serializers.ModelSerializer):
     """
     # Explicitly define data_source_id as the Glue job provides the ID, not the object.
     data_source_id = serializers.PrimaryKeyRelatedField(queryset=DataSource.objects.all(), source='data_source')
+    # Optional product dimension, stored in Metric.metadata by the ingest path.
+    product = serializers.CharField(max_length=255, required=False, allow_blank=True, allow_null=True)
 
     class Meta:
         model = Metric
         # Only include fields required for metric creation
-        fields = ['data_source_id', 'name', 'value', 'timestamp']
+        fields = ['data_source_id', 'name', 'value', 'timestamp', 'product']
 
 
 # --- NEW: Anomaly Ingest Serializer ---
@@ -74,18 +76,30 @@ class InsightViewSetSerializer(serializers.ModelSerializer):
     Includes nested metrics and the name of the data source.
     """
     data_source_name = serializers.CharField(source='data_source.name', read_only=True)
+    # Newest linked metrics only; the full set is paged at /insights/{id}/metrics/.
     metrics = serializers.SerializerMethodField()
+    metric_count = serializers.SerializerMethodField()
     
     # --- ADDED 'source' FIELD ---
     source = serializers.CharField(read_only=True) 
 
+    METRIC_PREVIEW = 5
+
     def get_metrics(self, obj):
-        return MetricReadSerializer(obj.metrics.all(), many=True).data
+        # InsightViewSet prefetches the preview as `metric_preview`.
+        preview = getattr(obj, 'metric_preview', None)
+        if preview is None:
+            preview = obj.metrics.order_by('-timestamp', '-id')[:self.METRIC_PREVIEW]
+        return MetricReadSerializer(preview, many=True).data
+
+    def get_metric_count(self, obj):
+        count = getattr(obj, 'metric_count', None)
+        return obj.metrics.count() if count is None else count
 
     class Meta:
         model = Insight
         # ADDED 'source' to fields
-        fields = ['id', 'title', 'summary', 'source', 'data_source', 'data_source_name', 'created_at', 'metrics']
+        fields = ['id', 'title', 'summary', 'source', 'data_source', 'data_source_name', 'created_at', 'metrics', 'metric_count']
         read_only_fields = ['data_source', 'created_at', 'metrics']
 
 
@@ -98,8 +112,12 @@ class AlertViewSetSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Alert
-        fields = ['id', 'insight', 'severity', 'status', 'details_json', 'acknowledged_at']
-        read_only_fields = ['insight', 'acknowledged_at']
+        fields = [
+            'id', 'insight', 'severity', 'status', 'details_json', 'state',
+            'acknowledged_at', 'acknowledged_by', 'dismissed_at', 'dismissed_by', 'archived_at',
+            'occurrences', 'last_seen_at',
+        ]
+        read_only_fields = fields
         
 class PredictionDataSerializer(serializers.Serializer):
     date = serializers.DateField()
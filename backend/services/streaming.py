@@ -0,0 +1,136 @@
+# services/streaming.py
+"""
+Server-sent-event streams of answers, for /q/ask/stream/ and /q/what-if/stream/.
+
+The blocking endpoints return once the whole chat_sync answer is ready. These
+push the answer while it is generated, as SSE events:
+
+    event: meta    {"engine": ...}
+    event: chunk   {"text": "..."}          (repeated)
+    event: done    {"answer": ..., "engine": ..., "first_chunk_ms": ..., "elapsed_ms": ...}
+    event: error   {"error": ..., "details": ...}
+
+Amazon Q Business's streaming Chat API needs an input event stream over
+HTTP/2, which boto3 cannot send, so generated answers stream from Claude on
+Bedrock (invoke_model_with_response_stream, via core.ai_service.stream_claude)
+with a one-line KPI summary as business context. Questions the local engine
+(services.intents) or the question cache can answer arrive as one chunk
+immediately; generated answers are added to the question cache when done.
+
+The generators are async and the Bedrock read runs on asyncio
+(core.bedrock_stream), so under backend/asgi.py a stream holds no thread
+while it waits for tokens; the short database steps go through
+sync_to_async. Under WSGI Django buffers async streams, so serve these
+endpoints from the ASGI application.
+"""
+import json
+import sys
+import time
+
+from asgiref.sync import sync_to_async
+
+from core.ai_service import stream_claude
+
+from .intents import answer_intent, parse_intent
+from .kpis import evaluate, metrics_summary_kpis
+from .question_cache import cached_answer, record_answer
+
+# Same framing as BizPulseAmazonQService._enhance_question.
+ANALYST_CONTEXT = "You are a business analyst. Provide specific, data-driven advice. "
+
+
+def sse(event, data):
+    """One server-sent event."""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+def _ms(started):
+    return round((time.perf_counter() - started) * 1000, 1)
+
+
+def business_context(data_source_id=None):
+    """Dashboard KPIs as one line of prompt context (one rollup query)."""
+    kpis = evaluate(metrics_summary_kpis(), data_source_id=data_source_id)
+    parts = [f"total sales {kpis['total_sales'] or 0:,.2f}"]
+    if kpis['avg_conversion'] is not None:
+        parts.append(f"average conversion rate {kpis['avg_conversion']:.2%}")
+    if kpis['sales_growth'] is not None:
+        parts.append(f"sales growth over the last 30 days {kpis['sales_growth']:+.1f}%")
+    parts.append(f"{kpis['active_metrics']} metrics tracked")
+    return "; ".join(parts)
+
+
+def business_prompt(question, context=None):
+    prompt = ANALYST_CONTEXT
+    if context:
+        prompt += f"Business context: {context}. "
+    return prompt + f"Question: {question}"
+
+
+async def _context(data_source_id):
+    try:
+        return await sync_to_async(business_context)(data_source_id)
+    except Exception as e:   # answer without context rather than fail the stream
+        print(f"DEBUG LOG: Business context for streaming answer failed: {e}")
+        sys.stdout.flush()
+        return None
+
+
+async def _whole(answer, started, **meta):
+    """An answer that is already complete, as meta, one chunk and done."""
+    yield sse('meta', meta)
+    yield sse('chunk', {'text': answer['answer']})
+    yield sse('done', dict(answer, **meta, first_chunk_ms=_ms(started), elapsed_ms=_ms(started)))
+
+
+async def _generated(prompt, started, outcome, **meta):
+    """Claude's answer to `prompt` as it streams; sets outcome['answer'] once complete."""
+    yield sse('meta', meta)
+    parts, first_chunk_ms = [], None
+    try:
+        async for text in stream_claude(prompt):
+            if first_chunk_ms is None:
+                first_chunk_ms = _ms(started)
+            parts.append(text)
+            yield sse('chunk', {'text': text})
+    except Exception as e:
+        print(f"DEBUG LOG: Streaming answer failed after {len(parts)} chunks: {e}")
+        sys.stdout.flush()
+        yield sse('error', {'error': "Failed to generate the answer", 'details': str(e)})
+        return
+    outcome['answer'] = ''.join(parts)
+    yield sse('done', dict(meta, answer=outcome['answer'], first_chunk_ms=first_chunk_ms, elapsed_ms=_ms(started)))
+
+
+async def ask_events(question, data_source_id=None):
+    """SSE stream answering `question`: local engine, then question cache, then Bedrock."""
+    started = time.perf_counter()
+    intent = await sync_to_async(parse_intent)(question)
+    if intent is not None:
+        answer = await sync_to_async(answer_intent)(intent, question, data_source_id)
+        async for event in _whole(answer, started, engine='local'):
+            yield event
+        return
+
+    answer, cache_info = await sync_to_async(cached_answer)(question, data_source_id, started)
+    if answer is not None:
+        async for event in _whole(answer, started, engine='question_cache', cache=cache_info):
+            yield event
+        return
+
+    context = await _context(data_source_id)
+    outcome = {}
+    async for event in _generated(business_prompt(question, context), started, outcome, engine='bedrock'):
+        yield event
+    if 'answer' in outcome:
+        answer = {"question": question, "answer": outcome['answer'], "sources": [], "conversation_id": None}
+        await sync_to_async(record_answer)(question, answer, _ms(started), data_source_id)
+
+
+async def what_if_events(scenario, data_source_id=None):
+    """SSE stream of a what-if analysis, generated by Bedrock."""
+    started = time.perf_counter()
+    context = await _context(data_source_id)
+    prompt = business_prompt(f"Analyze this business scenario: {scenario}. Provide projected outcomes and risks.", context)
+    async for event in _generated(prompt, started, {}, engine='bedrock', scenario=scenario):
+        yield event
@@ -0,0 +1,38 @@
+# services/tasks.py
+"""Background task handlers owned by the services app (see core.queue)."""
+from django.utils import timezone
+
+from core.queue import Retry, current_task, register_task
+
+from .alert_dispatch import DISPATCH_TASK, dispatch_alerts
+from .analysis import start_bedrock_analysis
+from .precompute import REFRESH_TASK, refresh_answers
+from .sales_series import refresh_sales_series
+
+
+@register_task("services.start_bedrock_analysis")
+def run_bedrock_analysis(job_id):
+    # Transient Bedrock errors propagate so the queue retries; the last attempt marks the job FAILED.
+    task = current_task()
+    start_bedrock_analysis(job_id, final_attempt=task is None or task.attempts >= task.max_attempts)
+
+
+@register_task("services.refresh_sales_series")
+def run_sales_series_refresh(prefix=None):
+    return refresh_sales_series(prefix=prefix)
+
+
+@register_task(REFRESH_TASK)
+def run_precomputed_answer_refresh(data_source_id=None):
+    return refresh_answers(data_source_id)
+
+
+@register_task(DISPATCH_TASK)
+def run_alert_dispatch():
+    counts = dispatch_alerts()
+    next_due = counts.pop('next_due')
+    print(f"DEBUG LOG: Alert dispatch: {counts}")
+    if next_due is not None:
+        # Come back when the earliest deferred/retrying alert is due.
+        raise Retry(delay=max((next_due - timezone.now()).total_seconds(), 1))
+    return counts
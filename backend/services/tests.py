@@ -1,3 +1,1720 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+from datetime import datetime, timedelta, timezone
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.db.models import Avg, Sum
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import AsyncClient, TestCase, override_settings
+from django.utils.timezone import now as timezone_now
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from core.models import DataSource, IngestionJob, Task
+from core.aws_clients import override_client
+from core.aws_fakes import FakeBedrock, FakeBedrockStream, throttling_error
+from core.bedrock_stream import STREAM_SERVICE
+from .alert_dispatch import DISPATCH_TASK, FileTransport, claim_alerts, dispatch_alerts, enqueue_alert_dispatch
+from .alerts import apply_alert_action, raise_alert, select_alerts
+from .batch_analysis import BedrockLimiter, TokenBucket, run_batch_analysis
+from .digest import build_digest, digest_prompt
+from .dimensions import extract_dimensions, filter_dimensions, link_dimensions, with_dimension
+from .intents import answer_intent, parse_intent, vocabulary
+from .ingest import write_metrics
+from .models import (
+    Alert, Dimension, DimensionValue, Insight, Metric, MetricDimension, MetricRollup, PrecomputedAnswer, SalesSeriesBucket, SalesSeriesObject,
+)
+from .object_store import LocalObjectStore, S3ObjectStore
+from .pagination import KeysetPagination
+from .precompute import REFRESH_TASK, enqueue_refresh, refresh_answers
+from .question_cache import invalidate as invalidate_questions, normalize_question
+from .rollups import GRAINS, STAT_FIELDS, rebuild_rollups
+from .sales_series import object_buckets, refresh_sales_series, sales_series
+from .serializers import InsightViewSetSerializer, MetricCreateSerializer
+from .validation import INVALID_NUMBER, INVALID_PK_TYPE, rows_to_columns, validate_metric_columns, validate_metric_records
+
+try:
+    import moto
+except ImportError:
+    moto = None
+
+
+# --- Query plan regression suite ---
+
+METRIC_TABLE = Metric._meta.db_table
+# Tables the dashboard reads; every query on them must be index-served.
+PLANNED_TABLES = (METRIC_TABLE, MetricRollup._meta.db_table, MetricDimension._meta.db_table)
+TABLE_PATTERN = '|'.join(PLANNED_TABLES)
+# SQLite reports a table scan as "SCAN <table>" (no USING), and a skip-scan over a leading
+# index column it cannot seek on as "ANY(<column>)"; both mean no index fits the query.
+SQLITE_TABLE_SCAN = re.compile(rf'^SCAN ({TABLE_PATTERN})\b(?!.*USING)|^SEARCH ({TABLE_PATTERN})\b.*\bANY\(')
+
+
+def index_info(cursor, index_name):
+    """(table name, leading column) of a PostgreSQL index."""
+    cursor.execute(
+        "SELECT t.relname, a.attname FROM pg_index i "
+        "JOIN pg_class c ON c.oid = i.indexrelid "
+        "JOIN pg_class t ON t.oid = i.indrelid "
+        "JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = i.indkey[0] "
+        "WHERE c.relname = %s",
+        [index_name],
+    )
+    return cursor.fetchone()
+
+
+def explain(sql):
+    """Return the scans on the dashboard tables in the plan for `sql` that no index serves."""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            # With seqscan disabled the planner still picks one when no index applies,
+            # so a Seq Scan here means a missing index, not a small-table costing choice.
+            cursor.execute("SET LOCAL enable_seqscan = off")
+            cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}")
+            plan = cursor.fetchone()[0]
+            cursor.execute("RESET enable_seqscan")
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            scans, nodes = [], [plan[0]['Plan']]
+            while nodes:
+                node = nodes.pop()
+                nodes.extend(node.get('Plans', []))
+                if node['Node Type'] == 'Seq Scan':
+                    if node.get('Relation Name') in PLANNED_TABLES:
+                        scans.append(f"Seq Scan on {node['Relation Name']}")
+                    continue
+                if 'Index Name' not in node:
+                    continue
+                table, leading = index_info(cursor, node['Index Name'])
+                if table not in PLANNED_TABLES:
+                    continue
+                condition = node.get('Index Cond')
+                if condition is None and 'Filter' in node:
+                    # Walking a whole index just to filter rows is a scan in disguise.
+                    scans.append(f"{node['Node Type']} on {node['Index Name']} with Filter: {node['Filter']}")
+                elif condition and not re.search(rf'\b{leading}\b', condition):
+                    # A condition on a non-leading column still reads the whole index.
+                    scans.append(f"{node['Node Type']} on {node['Index Name']} without its leading column: {condition}")
+            return scans
+        cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+        return [row[-1] for row in cursor.fetchall() if SQLITE_TABLE_SCAN.match(row[-1])]
+
+
+class MetricQueryPlanTests(TestCase):
+    """Every Metric/rollup query behind the dashboard must be served by an index."""
+
+    NAMES = ['Daily_Sales', 'Conversion_Rate', 'Average_Order_Value'] + [f'Metric_{i}' for i in range(17)]
+    PRODUCTS = ['Product Alpha', 'Product Bravo', 'Product Charlie', 'Product Delta']
+    DAYS = 400
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create(username='planner')
+        cls.data_source = DataSource.objects.create(owner=cls.user, name='Plan Source', source_type='CUSTOM')
+        cls.job = IngestionJob.objects.create(data_source=cls.data_source)
+        start = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=cls.DAYS)
+        write_metrics(
+            Metric(
+                data_source=cls.data_source,
+                ingestion_job=cls.job if day >= cls.DAYS - 7 else None,
+                name=name,
+                value=float(day + index),
+                timestamp=start + timedelta(days=day),
+                metadata={'product': product},
+            )
+            for day in range(cls.DAYS)
+            for index, name in enumerate(cls.NAMES)
+            for product in cls.PRODUCTS
+        )
+        # A second, smaller tenant: per-source listings must seek on data_source, not filter a scan.
+        cls.other_source = DataSource.objects.create(owner=cls.user, name='Other Source', source_type='CUSTOM')
+        write_metrics(
+            Metric(data_source=cls.other_source, name='Daily_Sales', value=float(day),
+                   timestamp=start + timedelta(days=day), metadata={'product': product})
+            for day in range(cls.DAYS)
+            for product in cls.PRODUCTS
+        )
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+    def metric_queries(self, call):
+        with CaptureQueriesContext(connection) as captured:
+            call()
+        # Server-side cursors (QuerySet.iterator() on PostgreSQL) wrap the SELECT in DECLARE ... FOR.
+        statements = [re.sub(r'^\s*DECLARE .+? CURSOR .*?FOR ', '', query['sql']) for query in captured.captured_queries]
+        return [
+            sql for sql in statements
+            if sql.lstrip().upper().startswith('SELECT') and re.search(rf'\b({TABLE_PATTERN})\b', sql)
+        ]
+
+    def assertIndexed(self, queries):
+        self.assertTrue(queries, "No metric or rollup queries were captured.")
+        for sql in queries:
+            with self.subTest(sql=sql[:120]):
+                self.assertEqual(explain(sql), [], f"Full table scan in plan for:\n{sql}")
+
+    def get_view(self, url):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        return lambda: self.assertEqual(client.get(url).status_code, 200)
+
+    def test_sales_summary_view(self):
+        self.assertIndexed(self.metric_queries(self.get_view('/api/v1/services/charts/sales-summary/')))
+
+    def test_sales_data_view(self):
+        self.assertIndexed(self.metric_queries(self.get_view('/api/v1/services/charts/sales/')))
+
+    def test_sales_data_view_weekly_window(self):
+        self.assertIndexed(self.metric_queries(
+            self.get_view('/api/v1/services/charts/sales/?bucket=week&from=2025-01-01&to=2025-03-31')
+        ))
+
+    def test_top_products_view(self):
+        self.assertIndexed(self.metric_queries(self.get_view('/api/v1/services/charts/top-products/?period=90d&limit=5')))
+
+    def test_metrics_summary_view(self):
+        self.assertIndexed(self.metric_queries(self.get_view('/api/v1/services/charts/summary/')))
+
+    def test_metric_list_view(self):
+        self.assertIndexed(self.metric_queries(self.get_view('/api/v1/services/metrics/')))
+
+    def test_metric_list_filtered_views(self):
+        source = self.other_source.id
+        for query in (
+            f'data_source_id={source}',
+            'name=Metric_3&from=2025-01-01&to=2025-06-30',
+            f'data_source_id={source}&name=Daily_Sales',
+            'name=Daily_Sales&dimension=product:Product%20Bravo',
+        ):
+            with self.subTest(query=query):
+                self.assertIndexed(self.metric_queries(self.get_view(f'/api/v1/services/metrics/?{query}')))
+
+    def test_metric_list_deep_page(self):
+        # Jump deep into the listing through a cursor: still one index seek.
+        middle = Metric.objects.order_by('-timestamp', '-id')[5000]
+        cursor = KeysetPagination().encode_cursor(middle.timestamp, middle.id)
+        for query in (f'cursor={cursor}', f'data_source_id={self.other_source.id}&cursor={cursor}'):
+            with self.subTest(query=query):
+                self.assertIndexed(self.metric_queries(self.get_view(f'/api/v1/services/metrics/?{query}')))
+
+    def test_insight_views(self):
+        insight = Insight.objects.create(data_source=self.data_source, title='Job insight', summary='...')
+        Metric.objects.filter(ingestion_job=self.job).update(insight=insight)
+        self.assertIndexed(self.metric_queries(self.get_view('/api/v1/services/insights/')))
+        self.assertIndexed(self.metric_queries(self.get_view(f'/api/v1/services/insights/{insight.id}/metrics/')))
+
+    def test_local_answers(self):
+        client = APIClient()
+        for question in ("total Daily_Sales in March 2025", "average Metric_3 for Product Bravo last quarter",
+                         "sales by product in the last 30 days"):
+            with self.subTest(question=question):
+                cache.clear()
+                self.assertIndexed(self.metric_queries(lambda: self.assertEqual(
+                    client.post('/api/v1/services/q/ask/', {'question': question}, format='json').data['engine'], 'local')))
+
+    def test_analysis_job_queries(self):
+        # The queries start_bedrock_analysis runs for a job, without calling Bedrock.
+        def run():
+            build_digest(Metric.objects.filter(ingestion_job=self.job).order_by('timestamp'))
+        self.assertIndexed(self.metric_queries(run))
+
+
+
+# --- Metric listing ---
+
+class MetricListPaginationTests(TestCase):
+    """Keyset pages cover every row exactly once, in order, with a fixed query count."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create(username='pager')
+        cls.data_source = DataSource.objects.create(owner=cls.user, name='Pager Source', source_type='CUSTOM')
+        insight = Insight.objects.create(data_source=cls.data_source, title='Spike', summary='Sales spiked')
+        start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+        # Four products share each timestamp, so pages split rows with equal timestamps.
+        write_metrics(
+            Metric(data_source=cls.data_source, name='Daily_Sales', value=float(day), timestamp=start + timedelta(days=day),
+                   metadata={'product': product})
+            for day in range(30)
+            for product in ('A', 'B', 'C', 'D')
+        )
+        Metric.objects.filter(timestamp__lt=start + timedelta(days=10)).update(insight=insight)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def walk(self, url):
+        ids, queries = [], []
+        while url:
+            with CaptureQueriesContext(connection) as captured:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            queries.append(len(captured))
+            ids.extend(row['id'] for row in response.json()['results'])
+            url = response.json()['next']
+        return ids, queries
+
+    def test_pages_cover_listing_in_order(self):
+        ids, queries = self.walk('/api/v1/services/metrics/?page_size=7')
+        expected = list(Metric.objects.order_by('-timestamp', '-id').values_list('id', flat=True))
+        self.assertEqual(ids, expected)
+        # One query per page whatever the page size or insight links (no N+1).
+        self.assertEqual(set(queries), {1})
+
+    def test_filters(self):
+        ids, _ = self.walk('/api/v1/services/metrics/?from=2025-01-05&to=2025-01-06&dimension=product:B&page_size=1')
+        expected = Metric.objects.filter(
+            timestamp__gte=datetime(2025, 1, 5, tzinfo=timezone.utc),
+            timestamp__lt=datetime(2025, 1, 7, tzinfo=timezone.utc),
+            dimension_key='B',
+        ).order_by('-timestamp', '-id')
+        self.assertEqual(ids, list(expected.values_list('id', flat=True)))
+        response = self.client.get('/api/v1/services/metrics/?name=Daily_Sales&page_size=1').json()
+        self.assertIsNone(response['results'][0].get('insight_summary'))
+
+    def test_invalid_params(self):
+        for query in ('cursor=garbage', 'from=yesterday', 'dimension=product', 'data_source_id=x'):
+            with self.subTest(query=query):
+                self.assertIn(self.client.get(f'/api/v1/services/metrics/?{query}').status_code, (400, 404))
+
+
+
+# --- Insight listing ---
+
+class InsightListQueryTests(TestCase):
+    """Listing insights costs a fixed number of queries and embeds a bounded metric preview."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create(username='insights')
+        start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+        cls.insights = []
+        for i in range(6):
+            source = DataSource.objects.create(owner=cls.user, name=f'Source {i}', source_type='CUSTOM')
+            insight = Insight.objects.create(data_source=source, title=f'Insight {i}', summary='...')
+            write_metrics(
+                Metric(data_source=source, name='Daily_Sales', value=float(day), timestamp=start + timedelta(days=day))
+                for day in range(3 + i * 5)
+            )
+            Metric.objects.filter(data_source=source).update(insight=insight)
+            cls.insights.append(insight)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_list_query_count(self):
+        # insights + data sources (one JOIN) with counts, then one windowed preview query.
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/v1/services/insights/')
+        self.assertEqual(response.status_code, 200)
+        by_title = {row['title']: row for row in response.json()}
+        for i, insight in enumerate(self.insights):
+            row = by_title[insight.title]
+            self.assertEqual(row['data_source_name'], f'Source {i}')
+            self.assertEqual(row['metric_count'], 3 + i * 5)
+            newest = insight.metrics.order_by('-timestamp', '-id').values_list('id', flat=True)
+            preview = InsightViewSetSerializer.METRIC_PREVIEW
+            self.assertEqual([m['id'] for m in row['metrics']], list(newest[:preview]))
+
+    def test_insight_metrics_pages(self):
+        insight = self.insights[-1]
+        url, ids = f'/api/v1/services/insights/{insight.id}/metrics/?page_size=4', []
+        while url:
+            with self.assertNumQueries(2):   # insight lookup + page
+                page = self.client.get(url).json()
+            ids.extend(row['id'] for row in page['results'])
+            url = page['next']
+        self.assertEqual(ids, list(insight.metrics.order_by('-timestamp', '-id').values_list('id', flat=True)))
+        self.assertEqual(self.client.get('/api/v1/services/insights/999999/metrics/').status_code, 404)
+
+
+
+# --- Alert workflow ---
+
+class BulkAlertActionTests(TestCase):
+    """Bulk alert actions are one COUNT plus one UPDATE, whatever they target."""
+
+    URL = '/api/v1/services/alerts/bulk-action/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create(username='oncall')
+        cls.sources = [
+            DataSource.objects.create(owner=cls.user, name=f'Source {i}', source_type='CUSTOM') for i in range(2)
+        ]
+        for source in cls.sources:
+            insight = Insight.objects.create(data_source=source, title='Incident', summary='...')
+            Alert.objects.bulk_create(
+                Alert(insight=insight, type='EMAIL', severity=severity) for severity in range(1, 11) for _ in range(5)
+            )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def post(self, body, queries=2):
+        with self.assertNumQueries(queries):
+            response = self.client.post(self.URL, body, format='json')
+        return response
+
+    def test_filter_targeted_acknowledge(self):
+        source = self.sources[0].id
+        response = self.post({'action': 'acknowledge', 'filter': {'min_severity': 8, 'data_source_id': source}})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['matched'], response.data['updated'], response.data['skipped']), (15, 15, 0))
+        acknowledged = Alert.objects.filter(state='ACKNOWLEDGED')
+        self.assertEqual(acknowledged.count(), 15)
+        self.assertFalse(acknowledged.exclude(severity__gte=8, insight__data_source_id=source).exists())
+        self.assertFalse(acknowledged.filter(acknowledged_by__isnull=True).exists())
+        self.assertFalse(acknowledged.filter(acknowledged_at__isnull=True).exists())
+
+        # Acknowledging again only skips; dismissing moves them on.
+        response = self.post({'action': 'acknowledge', 'filter': {'min_severity': 8, 'data_source_id': source}})
+        self.assertEqual((response.data['updated'], response.data['skipped']), (0, 15))
+        response = self.post({'action': 'dismiss', 'filter': {'state': 'ACKNOWLEDGED'}})
+        self.assertEqual(response.data['updated'], 15)
+        self.assertEqual(Alert.objects.filter(state='DISMISSED', dismissed_by=self.user).count(), 15)
+
+    def test_ids_and_filter_combine(self):
+        ids = list(Alert.objects.order_by('id').values_list('id', flat=True)[:20])
+        response = self.post({'action': 'archive', 'alert_ids': ids, 'filter': {'max_severity': 2}})
+        self.assertEqual(response.data['updated'], Alert.objects.filter(id__in=ids, severity__lte=2).count())
+        self.assertEqual(Alert.objects.filter(state='ARCHIVED', archived_at__isnull=False).count(), response.data['updated'])
+
+    def test_invalid_requests(self):
+        for body in (
+            {'action': 'explode', 'alert_ids': [1]},
+            {'action': 'acknowledge'},
+            {'action': 'acknowledge', 'filter': {'severity': 3}},
+            {'action': 'acknowledge', 'filter': {'state': 'SNOOZED'}},
+            {'action': 'acknowledge', 'filter': {'from': 'last week'}},
+            {'action': 'acknowledge', 'alert_ids': 'all'},
+        ):
+            with self.subTest(body=body):
+                self.assertEqual(self.post(body, queries=0).status_code, 400)
+
+    def test_single_alert_views(self):
+        alert = Alert.objects.first()
+        response = self.client.post(f'/api/v1/services/alerts/{alert.id}/acknowledge/')
+        self.assertEqual(response.data['state'], 'ACKNOWLEDGED')
+        self.assertEqual(self.client.post(f'/api/v1/services/alerts/{alert.id}/acknowledge/').status_code, 409)
+        self.assertEqual(self.client.post(f'/api/v1/services/alerts/{alert.id}/dismiss/').data['state'], 'DISMISSED')
+        self.assertEqual(self.client.post('/api/v1/services/alerts/999999/dismiss/').status_code, 404)
+
+
+
+# --- Alert delivery ---
+
+class RecordingTransport:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.messages = []
+
+    def send(self, channel, recipient, subject, body):
+        if self.fail:
+            raise ConnectionError("transport down")
+        self.messages.append((channel, recipient, subject, body))
+
+
+@override_settings(ALERT_RATE_LIMIT=100, ALERT_MAX_ATTEMPTS=3, ALERT_RETRY_BACKOFF_SECONDS=60)
+class AlertDispatchTests(TestCase):
+    """Storms go out as one message per recipient and channel, with bulk status updates."""
+
+    @classmethod
+    def setUpTestData(cls):
+        user = get_user_model().objects.create(username='dispatch')
+        source = DataSource.objects.create(owner=user, name='Dispatch Source', source_type='CUSTOM')
+        cls.insight = Insight.objects.create(data_source=source, title='Revenue drop', summary='Sales fell 40%')
+
+    def setUp(self):
+        cache.clear()
+
+    def storm(self, count, recipients=('ops@example.com', 'cfo@example.com'), channels=('EMAIL', 'SMS')):
+        Alert.objects.bulk_create(
+            Alert(insight=self.insight, type=channels[i % len(channels)], recipient=recipients[i // len(channels) % len(recipients)],
+                  severity=i % 10 + 1)
+            for i in range(count)
+        )
+
+    def test_storm_is_grouped_and_marked_in_bulk(self):
+        self.storm(200)
+        transport = RecordingTransport()
+        with CaptureQueriesContext(connection) as captured:
+            counts = dispatch_alerts(transport=transport, batch_size=500)
+        self.assertEqual(counts['sent'], 200)
+        self.assertEqual(len(transport.messages), 4)   # 2 recipients x 2 channels
+        self.assertEqual(Alert.objects.filter(status='SENT', sent=True, sent_at__isnull=False).count(), 200)
+        # Queries depend on the number of groups, not of alerts.
+        self.assertLess(len(captured), 20)
+
+    def test_rate_limit_defers_to_next_window(self):
+        self.storm(4, recipients=('ops@example.com',), channels=('EMAIL',))
+        with self.settings(ALERT_RATE_LIMIT=1):
+            dispatch_alerts(transport=RecordingTransport(), batch_size=2)
+            self.storm(3, recipients=('ops@example.com',), channels=('EMAIL',))
+            transport = RecordingTransport()
+            counts = dispatch_alerts(transport=transport)
+        # The first run sent one message and deferred its second batch; the new alerts wait too.
+        self.assertEqual(transport.messages, [])
+        self.assertEqual(counts['deferred'], 3)
+        self.assertGreater(counts['next_due'], timezone_now())
+        self.assertEqual(Alert.objects.filter(status='PENDING', attempts=0).count(), 5)
+
+    def test_failures_back_off_then_fail(self):
+        self.storm(3, recipients=('ops@example.com',), channels=('SMS',))
+        Alert.objects.create(insight=self.insight, type='EMAIL', recipient=None)
+        counts = dispatch_alerts(transport=RecordingTransport(fail=True))
+        self.assertEqual((counts['retrying'], counts['failed']), (3, 1))
+        retrying = Alert.objects.filter(status='PENDING')
+        self.assertFalse(retrying.filter(next_attempt_at__lte=timezone_now()).exists())
+        self.assertIn('transport down', retrying.first().last_error)
+
+        for attempt in range(2):
+            Alert.objects.filter(status='PENDING').update(next_attempt_at=timezone_now())
+            dispatch_alerts(transport=RecordingTransport(fail=True))
+        self.assertEqual(Alert.objects.filter(status='FAILED', attempts=3).count(), 3)
+
+    def test_expired_lease_is_reclaimed(self):
+        self.storm(2)
+        claim_alerts('crashed-worker', 10)
+        self.assertEqual(dispatch_alerts(transport=RecordingTransport())['sent'], 0)
+        Alert.objects.update(next_attempt_at=timezone_now() - timedelta(seconds=1))
+        self.assertEqual(dispatch_alerts(transport=RecordingTransport())['sent'], 2)
+
+    def test_file_transport(self):
+        with tempfile.TemporaryDirectory() as root:
+            path = os.path.join(root, 'alerts.log')
+            self.storm(3, recipients=('ops@example.com',), channels=('PUSH',))
+            dispatch_alerts(transport=FileTransport(path))
+            with open(path) as f:
+                messages = [json.loads(line) for line in f]
+        self.assertEqual(len(messages), 1)
+        self.assertEqual(messages[0]['recipient'], 'ops@example.com')
+        self.assertIn('3 alerts', messages[0]['subject'])
+
+    def test_one_dispatch_task_at_a_time(self):
+        dispatch_tasks = Task.objects.filter(name=DISPATCH_TASK)
+        for _ in range(3):
+            enqueue_alert_dispatch()
+        self.assertEqual(dispatch_tasks.count(), 1)
+
+        # Running, or parked until a deferred alert is due: still no second task.
+        dispatch_tasks.update(status='RUNNING')
+        enqueue_alert_dispatch()
+        self.assertEqual(dispatch_tasks.count(), 1)
+
+        later = timezone_now() + timedelta(minutes=30)
+        dispatch_tasks.update(status='PENDING', run_after=later)
+        enqueue_alert_dispatch()
+        self.assertEqual(dispatch_tasks.count(), 1)
+        # The parked run is brought forward so the new alert is not held back.
+        self.assertLess(dispatch_tasks.get().run_after, later)
+
+        dispatch_tasks.update(status='SUCCEEDED')
+        enqueue_alert_dispatch()
+        self.assertEqual(dispatch_tasks.filter(status='PENDING').count(), 1)
+
+
+
+# --- Alert coalescing ---
+
+class AlertCoalescingTests(TestCase):
+    """Repeats of an open alert within the window bump it instead of adding rows."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create(username='flapping')
+        cls.data_source = DataSource.objects.create(owner=cls.user, name='Flaky Source', source_type='CUSTOM')
+
+    def setUp(self):
+        cache.clear()
+
+    def raise_(self, severity=9, metric='Daily_Sales', **kwargs):
+        return raise_alert(self.data_source, metric, severity, title='Anomaly', summary='...', **kwargs)
+
+    def test_storm_collapses_into_one_alert(self):
+        first_id, created = self.raise_()
+        self.assertTrue(created)
+        with self.assertNumQueries(1):   # cache hit: a single conditional UPDATE
+            self.assertEqual(self.raise_(severity=10), (first_id, False))
+        for _ in range(98):
+            self.raise_()
+        alert = Alert.objects.get()
+        self.assertEqual((alert.occurrences, alert.severity), (100, 10))
+        self.assertEqual(Insight.objects.count(), 1)
+
+    def test_key_state_and_window(self):
+        alert_id, _ = self.raise_()
+        self.assertTrue(self.raise_(metric='Conversion_Rate')[1])   # other metric
+        self.assertEqual(self.raise_(severity=2), (alert_id, False))   # a lower band folds in
+
+        # Once acknowledged, the next event opens a new alert.
+        apply_alert_action(select_alerts(ids=[alert_id]), 'acknowledge')
+        reopened_id, created = self.raise_()
+        self.assertTrue(created)
+
+        # Past the window since the last occurrence: a new alert too.
+        later = timezone_now() + timedelta(seconds=settings.ALERT_COALESCE_WINDOW_SECONDS + 1)
+        self.assertTrue(self.raise_(now=later)[1])
+        self.assertEqual(Alert.objects.count(), 4)
+
+    def test_escalation_keeps_one_alert_and_notifies_again(self):
+        alert_id, _ = self.raise_(severity=5)
+        Alert.objects.filter(id=alert_id).update(status='SENT', sent=True, attempts=1)
+        Task.objects.all().delete()
+
+        self.assertEqual(self.raise_(severity=6), (alert_id, False))   # same band: nothing to resend
+        self.assertEqual(Alert.objects.get().status, 'SENT')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.raise_(severity=9), (alert_id, False))
+        alert = Alert.objects.get()
+        self.assertEqual((alert.severity, alert.status, alert.attempts, alert.occurrences), (9, 'PENDING', 0, 3))
+        self.assertEqual(Task.objects.filter(name=DISPATCH_TASK, status='PENDING').count(), 1)
+
+        # The next critical event folds into it, from the cache and from the index alike.
+        self.assertEqual(self.raise_(severity=10), (alert_id, False))
+        cache.clear()
+        self.assertEqual(self.raise_(severity=9), (alert_id, False))
+        self.assertEqual(Alert.objects.count(), 1)
+
+    def test_cache_miss_falls_back_to_index(self):
+        alert_id, _ = self.raise_()
+        cache.clear()
+        self.assertEqual(self.raise_(), (alert_id, False))
+
+    def test_anomaly_ingest_coalesces(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        body = {
+            'data_source_id': self.data_source.id, 'anomaly_title': 'Sales dip', 'metric_name': 'Daily_Sales',
+            'timestamp': '2025-01-01T00:00:00Z', 'severity_score': 0.95,
+        }
+        self.assertEqual(client.post('/api/v1/internal/anomalies/ingest/', body, format='json').status_code, 201)
+        for _ in range(3):
+            response = client.post('/api/v1/internal/anomalies/ingest/', body, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Alert.objects.get().occurrences, 4)
+
+
+# --- Analysis digest ---
+
+class AnalysisDigestTests(TestCase):
+    """The Bedrock prompt digest comes from one streamed query and stays bounded."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create(username='digester')
+        cls.data_source = DataSource.objects.create(owner=cls.user, name='Digest Source', source_type='CUSTOM')
+        cls.job = IngestionJob.objects.create(data_source=cls.data_source)
+        start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+        # Daily_Sales rises 2/day per product; 60 small metrics have one point each.
+        rows = [
+            Metric(data_source=cls.data_source, ingestion_job=cls.job, name='Daily_Sales',
+                   value=1000.0 + 2 * day + 10 * index, timestamp=start + timedelta(days=day),
+                   metadata={'product': product})
+            for day in range(30)
+            for index, product in enumerate(['A', 'B', 'C', 'D', 'E'])
+        ]
+        rows += [
+            Metric(data_source=cls.data_source, ingestion_job=cls.job, name=f'Metric_{i:02d}', value=float(i),
+                   timestamp=start)
+            for i in range(60)
+        ]
+        write_metrics(rows)
+
+    def job_metrics(self):
+        return Metric.objects.filter(ingestion_job=self.job).order_by('timestamp')
+
+    def test_statistics_match_database(self):
+        with self.assertNumQueries(1):
+            digest = build_digest(self.job_metrics(), max_metrics=3, chunk_size=7)   # many small chunks
+
+        self.assertEqual((digest['total_points'], digest['metric_count'], digest['other_metrics']), (210, 61, 58))
+        sales = digest['metrics'][0]
+        values = [row.value for row in Metric.objects.filter(name='Daily_Sales')]
+        mean = sum(values) / len(values)
+        std = (sum((v - mean) ** 2 for v in values) / len(values)) ** 0.5
+        self.assertEqual((sales['name'], sales['count'], sales['min'], sales['max']), ('Daily_Sales', 150, 1000.0, 1098.0))
+        self.assertAlmostEqual(sales['mean'], mean, delta=abs(mean) * 1e-3)
+        self.assertAlmostEqual(sales['std'], std, delta=std * 1e-3)
+        self.assertAlmostEqual(sales['trend_per_day'], 2.0, places=3)
+        self.assertEqual(sales['days'], 29.0)
+        self.assertEqual([label for label, _ in sales['top']], ['E', 'D', 'C'])
+        self.assertEqual([label for label, _ in sales['bottom']], ['C', 'B', 'A'])
+        self.assertEqual(sales['top'][0][1], sum(1040.0 + 2 * day for day in range(30)))
+        self.assertEqual(digest['period']['start'], '2025-01-01T00:00:00+00:00')
+
+    def test_prompt_is_bounded(self):
+        digest = build_digest(self.job_metrics(), max_metrics=100)
+        self.assertEqual(len(digest['metrics']), 61)
+        text = digest_prompt(digest, max_chars=1500)
+        self.assertLessEqual(len(text), 1500)
+        bounded = json.loads(text)
+        self.assertEqual(bounded['metrics'][0]['name'], 'Daily_Sales')
+        self.assertEqual(len(bounded['metrics']) + bounded['other_metrics'], 61)
+
+    def test_empty_job(self):
+        other = IngestionJob.objects.create(data_source=self.data_source)
+        digest = build_digest(Metric.objects.filter(ingestion_job=other))
+        self.assertEqual((digest['total_points'], digest['metrics']), (0, []))
+
+
+# --- Batch analysis ---
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class BatchAnalysisTests(TestCase):
+    """Many jobs go through a bounded pool under the Bedrock quotas and land in bulk writes."""
+
+    JOBS = 12
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create(username='backfiller')
+        cls.data_source = DataSource.objects.create(owner=cls.user, name='Backfill Source', source_type='CUSTOM')
+        cls.jobs = [IngestionJob.objects.create(data_source=cls.data_source) for _ in range(cls.JOBS)]
+        cls.empty_job = IngestionJob.objects.create(data_source=cls.data_source)
+        start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+        write_metrics(
+            Metric(data_source=cls.data_source, ingestion_job=job, name='Daily_Sales', value=float(index * 100 + day),
+                   timestamp=start + timedelta(days=index * 10 + day))
+            for index, job in enumerate(cls.jobs)
+            for day in range(5)
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def job_ids(self):
+        return [job.id for job in self.jobs] + [self.empty_job.id]
+
+    def test_bounded_pool_and_bulk_writes(self):
+        fake = FakeBedrock(latency=0.02)
+        report = run_batch_analysis(job_ids=self.job_ids(), workers=4, client=fake)
+
+        self.assertEqual((report['jobs'], report['completed'], report['failed']), (self.JOBS + 1, self.JOBS, 1))
+        self.assertEqual(fake.calls, self.JOBS)
+        self.assertLessEqual(fake.peak_in_flight, 4)
+        self.assertGreater(fake.peak_in_flight, 1)
+        self.assertIsNotNone(report['queue_wait_p95'])
+
+        self.assertEqual(Insight.objects.filter(data_source=self.data_source).count(), self.JOBS)
+        for job in self.jobs:
+            self.assertEqual(
+                Metric.objects.filter(ingestion_job=job).values('insight').distinct().count(), 1,
+            )
+        self.assertEqual(Metric.objects.filter(insight__isnull=True).count(), 0)
+        self.assertEqual(
+            set(IngestionJob.objects.filter(id__in=self.job_ids()).values_list('status', flat=True)),
+            {'COMPLETED', 'FAILED'},
+        )
+
+        # A rerun (e.g. a retried backfill) is answered from the LLM cache.
+        report = run_batch_analysis(job_ids=[job.id for job in self.jobs], workers=4, client=fake)
+        self.assertEqual((report['completed'], report['cached']), (self.JOBS, self.JOBS))
+        self.assertEqual(fake.calls, self.JOBS)
+
+    @override_settings(BEDROCK_THROTTLE_BACKOFF_SECONDS=0.005, BEDROCK_THROTTLE_RETRIES=50)
+    def test_throttled_calls_are_retried(self):
+        fake = FakeBedrock(latency=0.02, max_in_flight=2)
+        report = run_batch_analysis(data_source_ids=[self.data_source.id], workers=6, client=fake)
+        self.assertEqual(report['completed'], self.JOBS)
+        self.assertGreater(fake.throttled, 0)
+        self.assertEqual(report['throttle_retries'], fake.throttled)
+
+    def test_limiter_holds_the_quota(self):
+        clock = FakeClock()
+        bucket = TokenBucket(rate_per_minute=60, capacity=2, clock=clock, sleep=clock.sleep)
+        self.assertEqual([bucket.take() for _ in range(2)], [0.0, 0.0])
+        self.assertAlmostEqual(bucket.take(), 1.0)   # one request per second once the burst is spent
+
+        limiter = BedrockLimiter(requests_per_minute=600, tokens_per_minute=6000, clock=clock, sleep=clock.sleep)
+        start = clock.now
+        for _ in range(4):
+            limiter.acquire(3000)
+        # 12,000 tokens against a 6,000/minute quota with a full bucket: one extra minute.
+        self.assertAlmostEqual(clock.now - start, 60.0)
+
+
+# --- Precomputed Q answers ---
+
+class FakeQService:
+    """BizPulseAmazonQService stand-in that counts calls and can fail."""
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.calls = []
+
+    def _answer(self, kind, business_context):
+        self.calls.append((kind, business_context))
+        if self.fail:
+            return {"error": "Q unavailable", "question": kind, "answer": "...", "type": "error"}
+        return {"question": kind, "answer": f"{kind} answer", "type": "business_insight"}
+
+    def get_business_recommendations(self, business_context=None):
+        return self._answer('recommendations', business_context)
+
+    def analyze_business_health(self, business_context=None):
+        return self._answer('health', business_context)
+
+
+def upload_file(client):
+    """POST a CSV to the services upload view with S3 and the Amazon Q sync stubbed out."""
+    with mock.patch.dict(os.environ, {'AWS_STORAGE_BUCKET_NAME': 'lake'}), \
+            override_client('s3', mock.Mock()), override_client('qbusiness', mock.Mock()) as q_client:
+        q_client.start_data_source_sync_job.return_value = {'executionId': 'sync-1'}
+        upload = io.BytesIO(b'timestamp,metric_name,value\n2025-01-01,Daily_Sales,10\n')
+        upload.name = 'sales.csv'
+        return client.post('/api/v1/services/upload/', {'file': upload, 'job_id': 1}, format='multipart')
+
+
+class PrecomputedAnswerTests(TestCase):
+    """Dashboard Q answers are read from storage; staleness queues one background refresh."""
+
+    URL = '/api/v1/services/q/recommendations/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create(username='dashboard')
+        cls.data_source = DataSource.objects.create(owner=cls.user, name='Shop', source_type='POS')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def refresh_tasks(self):
+        return Task.objects.filter(name=REFRESH_TASK)
+
+    def test_first_read_queues_one_refresh(self):
+        for _ in range(3):
+            response = self.client.get(self.URL, {'data_source_id': self.data_source.id})
+            self.assertEqual(response.status_code, 202)
+        self.assertEqual(list(self.refresh_tasks().values_list('payload', flat=True)),
+                         [{'data_source_id': self.data_source.id}])
+        self.assertEqual(self.client.get(self.URL, {'data_source_id': 'x'}).status_code, 400)
+
+    def test_reads_are_served_from_storage(self):
+        q = FakeQService()
+        self.assertEqual(refresh_answers(self.data_source.id, q_service=q), {'recommendations': 'refreshed', 'health': 'refreshed'})
+        self.assertIn("'Shop'", q.calls[0][1])
+
+        with self.assertNumQueries(0):   # cached by the refresh
+            response = self.client.get(self.URL, {'data_source_id': self.data_source.id})
+        self.assertEqual((response.status_code, response.data['answer'], response.data['stale']),
+                         (200, 'recommendations answer', False))
+        cache.clear()
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/v1/services/q/health/', {'data_source_id': self.data_source.id})
+        self.assertEqual(response.data['answer'], 'health answer')
+        self.assertEqual(len(q.calls), 2)
+        self.assertFalse(self.refresh_tasks().exists())
+
+        # The all-sources answer is separate.
+        self.assertEqual(self.client.get(self.URL).status_code, 202)
+
+    def test_stale_answer_is_served_while_revalidating(self):
+        refresh_answers(self.data_source.id, q_service=FakeQService())
+        old = timezone_now() - timedelta(seconds=settings.PRECOMPUTE_FRESH_SECONDS + 60)
+        PrecomputedAnswer.objects.update(generated_at=old)
+        cache.clear()
+
+        for _ in range(3):
+            response = self.client.get(self.URL, {'data_source_id': self.data_source.id})
+            self.assertEqual((response.status_code, response.data['stale']), (200, True))
+        self.assertEqual(self.refresh_tasks().count(), 1)
+
+        refresh_answers(self.data_source.id, q_service=FakeQService())
+        self.assertFalse(self.client.get(self.URL, {'data_source_id': self.data_source.id}).data['stale'])
+
+    def test_failed_refresh_keeps_previous_answer(self):
+        refresh_answers(self.data_source.id, q_service=FakeQService())
+        self.assertEqual(refresh_answers(self.data_source.id, q_service=FakeQService(fail=True))['health'], 'failed')
+        answer = PrecomputedAnswer.objects.get(data_source=self.data_source, kind='health')
+        self.assertEqual((answer.payload['answer'], answer.last_error), ('health answer', 'Q unavailable'))
+
+    def test_new_data_queues_one_refresh(self):
+        now = timezone_now()
+        metric = lambda value: Metric(data_source=self.data_source, name='Daily_Sales', value=value, timestamp=now)
+        write_metrics([metric(1.0)])
+        write_metrics([metric(2.0)])
+        # One waiting refresh per data source, plus one for the all-sources answers.
+        self.assertEqual(sorted(self.refresh_tasks().values_list('payload__data_source_id', flat=True),
+                                key=lambda pk: pk or 0), [None, self.data_source.id])
+
+        self.refresh_tasks().update(status='SUCCEEDED')
+        write_metrics([metric(2.0)], on_conflict='skip')   # nothing written, nothing to refresh
+        self.assertFalse(self.refresh_tasks().filter(status='PENDING').exists())
+
+    def test_refresh_is_queued_once_per_write(self):
+        start = timezone_now()
+        metrics = [Metric(data_source=self.data_source, name='Daily_Sales', value=1.0, timestamp=start - timedelta(days=day))
+                   for day in range(5)]
+        with mock.patch('services.ingest.enqueue_refresh', wraps=enqueue_refresh) as queued:
+            write_metrics(metrics, batch_size=2)
+        self.assertEqual(sorted(queued.call_args_list, key=lambda call: call.args[0] or 0),
+                         [mock.call(None), mock.call(self.data_source.id)])
+
+    def test_upload_refreshes_after_the_q_sync(self):
+        upload_source, _ = DataSource.objects.get_or_create(id=1, defaults={'owner': self.user, 'name': 'Upload Source'})
+        enqueue_refresh(upload_source.id)   # already waiting, but due before the sync finishes
+        self.client.force_authenticate(self.user)
+        started = timezone_now()
+        self.assertEqual(upload_file(self.client).status_code, 201)
+
+        tasks = self.refresh_tasks().filter(status='PENDING')
+        self.assertEqual(tasks.count(), 2)
+        settle = timedelta(seconds=settings.AMAZON_Q_SYNC_SETTLE_SECONDS)
+        for task in tasks:
+            self.assertGreaterEqual(task.run_after, started + settle)
+
+
+# --- Question cache ---
+
+class SlowQService:
+    """BizPulseAmazonQService stand-in for ask_question: slow, counts calls, can fail."""
+    calls = []
+    fail = False
+
+    def ask_question(self, question):
+        SlowQService.calls.append(question)
+        time.sleep(0.02)
+        if SlowQService.fail:
+            return {"error": "Q unavailable", "question": question, "answer": "Error: Q unavailable"}
+        return {"question": question, "answer": f"Answer to {question}", "sources": [], "conversation_id": "c1"}
+
+
+@mock.patch('services.views.BizPulseAmazonQService', SlowQService)
+class QuestionCacheTests(TestCase):
+    """Rephrasings of an answered question are served locally until new data lands."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create(username='asker')
+        cls.data_source = DataSource.objects.create(owner=cls.user, name='Asked Source', source_type='POS')
+
+    def setUp(self):
+        cache.clear()
+        SlowQService.calls = []
+        SlowQService.fail = False
+        self.client = APIClient()
+
+    def ask(self, question, data_source_id=None):
+        body = {'question': question}
+        if data_source_id is not None:
+            body['data_source_id'] = data_source_id
+        response = self.client.post('/api/v1/services/q/ask/', body, format='json')
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_normalization(self):
+        self.assertEqual(normalize_question("what were sales last month"), ('last', 'month', 'sales'))
+        self.assertEqual(normalize_question("Last month's revenue?"), ('last', 'month', 'sales'))
+        self.assertNotEqual(normalize_question("sales this month"), normalize_question("sales last month"))
+
+    def test_rephrasings_hit_and_periods_do_not(self):
+        first = self.ask("what were sales last month")
+        self.assertFalse(first['cache']['hit'])
+        for phrasing in ("last month's sales?", "Show me revenue for last month", "What was the SALES last month"):
+            data = self.ask(phrasing)
+            self.assertTrue(data['cache']['hit'], phrasing)
+            self.assertEqual(data['answer'], first['answer'])
+        # Near-duplicates match on similarity; a different period never does.
+        self.ask("total sales by product for last quarter")
+        near = self.ask("total sales per product for last quarter")
+        self.assertTrue(near['cache']['hit'])
+        self.assertLess(near['cache']['similarity'], 1.0)
+        self.assertFalse(self.ask("total sales per product for this quarter")['cache']['hit'])
+        self.assertFalse(self.ask("sales last month", data_source_id=self.data_source.id)['cache']['hit'])
+        self.assertEqual(len(SlowQService.calls), 4)
+
+        self.assertIn(self.client.get('/api/v1/services/q/cache-stats/').status_code, (401, 403))
+        self.client.force_authenticate(self.user)
+        stats = self.client.get('/api/v1/services/q/cache-stats/').data
+        self.assertEqual((stats['hits'], stats['misses'], stats['hit_rate']), (4, 4, 0.5))
+        self.assertGreater(stats['saved_ms'], 0)
+
+    def test_new_data_invalidates(self):
+        self.ask("sales last month", data_source_id=self.data_source.id)
+        self.assertTrue(self.ask("last month sales", data_source_id=self.data_source.id)['cache']['hit'])
+        invalidate_questions(self.data_source.id)
+        self.assertFalse(self.ask("last month sales", data_source_id=self.data_source.id)['cache']['hit'])
+
+    def test_ingest_invalidates(self):
+        other = DataSource.objects.create(owner=self.user, name='Unrelated Source', source_type='POS')
+        self.ask("sales last month", data_source_id=self.data_source.id)
+        self.ask("sales last month")
+        now = timezone_now()
+        # Not a sales metric, so the questions keep going to Q rather than the local engine.
+        metric = lambda source: Metric(data_source=source, name='Footfall', value=1.0, timestamp=now)
+
+        # New data elsewhere drops the all-sources answer but not this source's.
+        with self.captureOnCommitCallbacks(execute=True):
+            write_metrics([metric(other)])
+        self.assertTrue(self.ask("last month sales", data_source_id=self.data_source.id)['cache']['hit'])
+        self.assertFalse(self.ask("last month sales")['cache']['hit'])
+
+        # Answers are dropped once per write, when it commits.
+        with self.captureOnCommitCallbacks() as callbacks:
+            write_metrics([metric(self.data_source), metric(other), metric(self.data_source)], batch_size=1)
+        self.assertTrue(self.ask("sales last month", data_source_id=self.data_source.id)['cache']['hit'])
+        self.assertEqual(len(callbacks), 1)
+        callbacks[0]()
+        self.assertFalse(self.ask("last month sales", data_source_id=self.data_source.id)['cache']['hit'])
+
+        # A retry that changes nothing keeps the fresh answer.
+        with self.captureOnCommitCallbacks(execute=True):
+            write_metrics([metric(self.data_source)], on_conflict='skip')
+        self.assertTrue(self.ask("sales last month", data_source_id=self.data_source.id)['cache']['hit'])
+
+    def test_upload_invalidates(self):
+        # The upload view files everything under the placeholder source id=1.
+        upload_source, _ = DataSource.objects.get_or_create(id=1, defaults={'owner': self.user, 'name': 'Upload Source'})
+        self.ask("sales last month", data_source_id=upload_source.id)
+        self.client.force_authenticate(self.user)
+        response = upload_file(self.client)
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(response.data['q_sync_triggered'])
+        self.assertFalse(self.ask("last month sales", data_source_id=upload_source.id)['cache']['hit'])
+
+    def test_errors_are_not_cached(self):
+        SlowQService.fail = True
+        self.ask("sales last month")
+        SlowQService.fail = False
+        self.assertFalse(self.ask("sales last month")['cache']['hit'])
+        self.assertEqual(len(SlowQService.calls), 2)
+
+
+# --- Local answers ---
+
+@mock.patch('services.views.BizPulseAmazonQService', SlowQService)
+class LocalAnswerTests(TestCase):
+    """Simple metric questions are answered from rollups; everything else still reaches Amazon Q."""
+
+    START = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    NOW = datetime(2025, 4, 15, 12, tzinfo=timezone.utc)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create(username='local-answers')
+        cls.data_source = DataSource.objects.create(owner=cls.user, name='Local Source', source_type='POS')
+        cls.other_source = DataSource.objects.create(owner=cls.user, name='Other Source', source_type='POS')
+        rows = []
+        for day in range(120):
+            timestamp = cls.START + timedelta(days=day, hours=10)
+            for index, product in enumerate(('Product Alpha', 'Product Bravo')):
+                rows.append(Metric(data_source=cls.data_source, name='Daily_Sales', value=100.0 + day * (index + 1),
+                                   timestamp=timestamp, metadata={'product': product}))
+            rows.append(Metric(data_source=cls.data_source, name='Conversion_Rate', value=0.02 + day / 10000,
+                               timestamp=timestamp))
+            rows.append(Metric(data_source=cls.other_source, name='Daily_Sales', value=5.0, timestamp=timestamp))
+        write_metrics(rows)
+
+    def setUp(self):
+        cache.clear()
+        SlowQService.calls = []
+        SlowQService.fail = False
+        self.client = APIClient()
+
+    def ask(self, question, **extra):
+        response = self.client.post('/api/v1/services/q/ask/', dict(extra, question=question), format='json')
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def raw(self, name, start, end, **filters):
+        return Metric.objects.filter(name=name, timestamp__gte=start, timestamp__lt=end, **filters)
+
+    def test_parse_intent(self):
+        def parsed(question):
+            intent = parse_intent(question, now=self.NOW)
+            return intent and (intent.metric, intent.aggregation, intent.start, intent.end, intent.dimension, intent.breakdown)
+
+        utc = timezone.utc
+        self.assertEqual(parsed("total Daily_Sales in March"), (
+            'Daily_Sales', 'sum', datetime(2025, 3, 1, tzinfo=utc), datetime(2025, 4, 1, tzinfo=utc), None, False))
+        self.assertEqual(parsed("average Conversion_Rate this quarter"), (
+            'Conversion_Rate', 'avg', datetime(2025, 4, 1, tzinfo=utc), datetime(2025, 4, 16, tzinfo=utc), None, False))
+        self.assertEqual(parsed("What was the conversion rate last month?")[1:4], (
+            'avg', datetime(2025, 3, 1, tzinfo=utc), datetime(2025, 4, 1, tzinfo=utc)))
+        self.assertEqual(parsed("highest revenue for Product Bravo in the last 7 days"), (
+            'Daily_Sales', 'max', datetime(2025, 4, 9, tzinfo=utc), datetime(2025, 4, 16, tzinfo=utc), 'Product Bravo', False))
+        self.assertEqual(parsed("sales by product in 2024")[2:], (
+            datetime(2024, 1, 1, tzinfo=utc), datetime(2025, 1, 1, tzinfo=utc), None, True))
+        # "in May" before May has come means last May.
+        self.assertEqual(parsed("daily sales in May")[2], datetime(2024, 5, 1, tzinfo=utc))
+        self.assertEqual(parsed("total sales")[2:4], (None, None))
+        for question in ("why did sales drop last month", "how can I grow revenue", "forecast sales next month",
+                         "how many customers visited last week", "what should I do about churn",
+                         # A product we have no data for, or a comparison, is not a single local aggregate.
+                         "total Daily_Sales for Product Zeta in March", "sales of the Zeta line this year",
+                         "total sales in 2025 vs 2024", "revenue this month versus last month",
+                         "conversion rate compared to last year"):
+            self.assertIsNone(parse_intent(question, now=self.NOW), question)
+        self.assertEqual(parsed("number of data points of revenue for the last 7 days")[1], 'count')
+
+    def test_vocabulary_lists_distinct_products_and_follows_ingest(self):
+        with mock.patch('services.intents.VOCABULARY_DIMENSIONS', 2):
+            self.assertEqual(vocabulary()['dimensions'], ['Product Alpha', 'Product Bravo'])
+
+        question = "total sales for Product Charlie in March 2025"
+        self.assertIsNone(parse_intent(question, now=self.NOW))
+        with self.captureOnCommitCallbacks(execute=True):
+            write_metrics([Metric(data_source=self.data_source, name='Daily_Sales', value=7.0,
+                                  timestamp=datetime(2025, 3, 3, tzinfo=timezone.utc), metadata={'product': 'Product Charlie'})])
+        self.assertEqual(parse_intent(question, now=self.NOW).dimension, 'Product Charlie')
+
+    def test_answers_match_raw_metrics(self):
+        march = (datetime(2025, 3, 1, tzinfo=timezone.utc), datetime(2025, 4, 1, tzinfo=timezone.utc))
+        source = self.data_source.id
+        parse_intent("warm the vocabulary")
+        with CaptureQueriesContext(connection) as captured:
+            data = self.ask("total Daily_Sales in March 2025", data_source_id=source)
+        self.assertEqual(data['engine'], 'local')
+        self.assertAlmostEqual(data['data']['value'], self.raw('Daily_Sales', *march, data_source=source).aggregate(v=Sum('value'))['v'])
+        self.assertEqual(data['data']['data_points'], 62)
+        self.assertIn('Total Daily_Sales, March 2025', data['answer'])
+        rollup_queries = [q['sql'] for q in captured.captured_queries if MetricRollup._meta.db_table in q['sql']]
+        self.assertEqual(len(rollup_queries), 1, rollup_queries)
+
+        data = self.ask("average conversion rate in February 2025")
+        february = (datetime(2025, 2, 1, tzinfo=timezone.utc), datetime(2025, 3, 1, tzinfo=timezone.utc))
+        self.assertAlmostEqual(data['data']['value'], self.raw('Conversion_Rate', *february).aggregate(v=Avg('value'))['v'])
+
+        data = self.ask("highest sales for Product Bravo in 2025", data_source_id=source)
+        self.assertEqual(data['data']['value'], max(
+            self.raw('Daily_Sales', self.START, self.START + timedelta(days=365), dimension_key='Product Bravo')
+            .values_list('value', flat=True)))
+
+        data = self.ask("sales by product in March 2025", data_source_id=source)
+        self.assertEqual([row['dimension'] for row in data['data']['breakdown']], ['Product Bravo', 'Product Alpha'])
+        self.assertAlmostEqual(data['data']['breakdown'][1]['value'], self.raw(
+            'Daily_Sales', *march, data_source=source, dimension_key='Product Alpha').aggregate(v=Sum('value'))['v'])
+
+        self.assertIn('No Daily_Sales data', self.ask("total sales in March 2023")['answer'])
+        self.assertEqual(SlowQService.calls, [])
+
+    def test_breakdowns_rank_by_the_reported_value(self):
+        with self.captureOnCommitCallbacks(execute=True):   # one large sale: highest average, lowest total
+            write_metrics([Metric(data_source=self.data_source, name='Daily_Sales', value=1000.0,
+                                  timestamp=datetime(2025, 3, 3, tzinfo=timezone.utc), metadata={'product': 'Product Charlie'})])
+
+        def ranked(question):
+            intent = parse_intent(question, now=self.NOW)
+            answer = answer_intent(intent, question, self.data_source.id)
+            return [row['dimension'] for row in answer['data']['breakdown']]
+
+        self.assertEqual(ranked("average Daily_Sales by product in March 2025"),
+                         ['Product Charlie', 'Product Bravo', 'Product Alpha'])
+        self.assertEqual(ranked("total Daily_Sales by product in March 2025"),
+                         ['Product Bravo', 'Product Alpha', 'Product Charlie'])
+        self.assertEqual(ranked("worst products by sales in March 2025"),
+                         ['Product Charlie', 'Product Alpha', 'Product Bravo'])
+        self.assertEqual(ranked("bottom products by average sales in March 2025"),
+                         ['Product Alpha', 'Product Bravo', 'Product Charlie'])
+
+    def test_other_questions_fall_through_to_q(self):
+        first = self.ask("why did sales drop in March 2025")
+        self.assertEqual((first['engine'], first['cache']['hit']), ('amazon_q', False))
+        self.assertEqual(self.ask("why did sales drop in March 2025")['engine'], 'question_cache')
+        self.assertEqual(SlowQService.calls, ["why did sales drop in March 2025"])
+
+        for question in ("total Daily_Sales for Product Zeta in March 2025", "total sales in 2025 vs 2024"):
+            self.assertEqual(self.ask(question)['engine'], 'amazon_q')
+
+
+# --- Streaming answers ---
+
+def parse_events(body):
+    """[(event, data)] of a server-sent-event body."""
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(': ', 1) for line in block.split("\n"))
+        events.append((lines['event'], json.loads(lines['data'])))
+    return events
+
+
+class StreamingAnswerTests(TestCase):
+    """The /stream/ endpoints push answer chunks as the model produces them, all on one event loop."""
+
+    REPLY = "Sales dipped because two top products ran out of stock mid-month; restock them first."
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create(username='streamer')
+        cls.data_source = DataSource.objects.create(owner=cls.user, name='Stream Source', source_type='POS')
+        write_metrics(
+            Metric(data_source=cls.data_source, name='Daily_Sales', value=100.0 + day,
+                   timestamp=datetime(2025, 3, 1, tzinfo=timezone.utc) + timedelta(days=day))
+            for day in range(31)
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = AsyncClient()
+
+    async def stream(self, url, **body):
+        """(events, seconds to the first chunk event, total seconds) of one streamed answer."""
+        started = time.perf_counter()
+        response = await self.client.post(url, body, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        first_chunk, parts = None, []
+        async for part in response.streaming_content:
+            part = part.decode()
+            if first_chunk is None and part.startswith('event: chunk'):
+                first_chunk = time.perf_counter() - started
+            parts.append(part)
+        return parse_events(''.join(parts)), first_chunk, time.perf_counter() - started
+
+    async def test_ask_streams_then_caches(self):
+        fake = FakeBedrockStream(reply=self.REPLY, first_token_latency=0.05, chunk_latency=0.03, chunk_chars=10)
+        with override_client(STREAM_SERVICE, fake):
+            events, first_chunk, total = await self.stream('/api/v1/services/q/ask/stream/', question="why did sales dip")
+            self.assertEqual(events[0], ('meta', {'engine': 'bedrock'}))
+            chunks = [data['text'] for event, data in events if event == 'chunk']
+            self.assertEqual(len(chunks), 9)
+            self.assertEqual(''.join(chunks), self.REPLY)
+            self.assertEqual(events[-1][0], 'done')
+            self.assertEqual(events[-1][1]['answer'], self.REPLY)
+            # The first chunk arrives at the model's first-token latency, not after the whole answer.
+            self.assertLess(first_chunk, 0.05 + 0.1)
+            self.assertGreater(total, 0.05 + 8 * 0.03)
+            self.assertIn('total sales 3,565.00', fake.prompts[0])
+
+            # The completed answer now serves rephrasings from the question cache, as one chunk.
+            events, _, _ = await self.stream('/api/v1/services/q/ask/stream/', question="Why did sales dip?")
+            self.assertEqual(events[0][1]['engine'], 'question_cache')
+            self.assertEqual(events[1], ('chunk', {'text': self.REPLY}))
+            # Simple metric questions never reach Bedrock.
+            events, _, _ = await self.stream('/api/v1/services/q/ask/stream/', question="total Daily_Sales in March 2025")
+            self.assertEqual(events[0][1]['engine'], 'local')
+            self.assertIn('3,565.00', events[1][1]['text'])
+        self.assertEqual(fake.calls, 1)
+
+    async def test_concurrent_streams_share_the_event_loop(self):
+        threads = []
+        fake = FakeBedrockStream(reply=lambda prompt: threads.append(threading.active_count()) or self.REPLY,
+                                 first_token_latency=0.1, chunk_latency=0.02, chunk_chars=20)
+        baseline = threading.active_count()
+        started = time.perf_counter()
+        with override_client(STREAM_SERVICE, fake):
+            results = await asyncio.gather(*(
+                self.stream('/api/v1/services/q/what-if/stream/', scenario=f"raise prices by {n}%") for n in range(20)
+            ))
+        elapsed = time.perf_counter() - started
+        for events, _, _ in results:
+            self.assertEqual(events[-1][1]['answer'], self.REPLY)
+        self.assertEqual(fake.peak_in_flight, 20)
+        self.assertLess(elapsed, 20 * 0.18 / 4)   # one after another would take 20 x 0.18 s
+        self.assertLess(max(threads) - baseline, 5)
+
+    async def test_errors_and_bad_requests(self):
+        fake = FakeBedrockStream(reply=self.REPLY, chunk_chars=10, error=throttling_error())
+        with override_client(STREAM_SERVICE, fake):
+            events, _, _ = await self.stream('/api/v1/services/q/ask/stream/', question="why did sales dip")
+            self.assertEqual([event for event, _ in events], ['meta', 'chunk', 'error'])
+            self.assertIn('ThrottlingException', events[-1][1]['details'])
+            fake.error = None
+            events, _, _ = await self.stream('/api/v1/services/q/ask/stream/', question="why did sales dip")
+            self.assertEqual(events[0][1]['engine'], 'bedrock')   # the failed answer was not cached
+
+        response = await self.client.post('/api/v1/services/q/ask/stream/', {}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        response = await self.client.post('/api/v1/services/q/what-if/stream/', {'scenario': 'x', 'data_source_id': 'a'},
+                                          content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+
+# --- KPI engine ---
+
+class KPISummaryTests(TestCase):
+    """The summary cards come from one rollup query and agree with the raw metrics."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create(username='kpis')
+        cls.data_source = DataSource.objects.create(owner=cls.user, name='KPI Source', source_type='CUSTOM')
+        cls.other_source = DataSource.objects.create(owner=cls.user, name='Other Source', source_type='CUSTOM')
+        today = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+        rows = []
+        for day in range(90):
+            timestamp = today - timedelta(days=day)
+            rows.append(Metric(data_source=cls.data_source, name='Daily_Sales', value=100.0 + day, timestamp=timestamp))
+            rows.append(Metric(data_source=cls.data_source, name='Conversion_Rate', value=0.02 + day / 10000, timestamp=timestamp))
+            rows.append(Metric(data_source=cls.other_source, name='Daily_Sales', value=1000.0, timestamp=timestamp))
+        write_metrics(rows)
+        cls.today = today
+
+    def raw_sum(self, name, start=None, end=None, **filters):
+        metrics = Metric.objects.filter(name=name, **filters)
+        if start is not None:
+            metrics = metrics.filter(timestamp__gte=start, timestamp__lt=end)
+        return metrics.aggregate(total=Sum('value'))['total'] or 0
+
+    def get(self, url):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        with CaptureQueriesContext(connection) as captured:
+            response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        rollup_queries = [q['sql'] for q in captured.captured_queries if MetricRollup._meta.db_table in q['sql']]
+        self.assertEqual(len(rollup_queries), 1, rollup_queries)
+        return response.json()
+
+    def test_metrics_summary_is_one_query(self):
+        source = self.data_source.id
+        data = self.get(f'/api/v1/services/charts/summary/?window=7&data_source_id={source}')
+        end = self.today + timedelta(days=1)
+        current = self.raw_sum('Daily_Sales', end - timedelta(days=7), end, data_source=source)
+        previous = self.raw_sum('Daily_Sales', end - timedelta(days=14), end - timedelta(days=7), data_source=source)
+
+        self.assertAlmostEqual(data['total_sales'], self.raw_sum('Daily_Sales', data_source=source))
+        self.assertAlmostEqual(
+            data['average_conversion'],
+            Metric.objects.filter(name='Conversion_Rate').aggregate(avg=Avg('value'))['avg'],
+        )
+        self.assertEqual(data['sales_growth'], round((current - previous) / previous * 100, 1))
+        self.assertEqual(data['active_metrics'], 2)
+        self.assertEqual(data['window_days'], 7)
+
+    def test_sales_summary_is_one_query(self):
+        data = self.get('/api/v1/services/charts/sales-summary/')
+        self.assertAlmostEqual(data['total_revenue'], self.raw_sum('Daily_Sales'))
+        self.assertEqual(data['avg_order_value'], 0)
+        self.assertEqual(data['window_days'], 30)
+
+    def test_sales_date_bounds(self):
+        day = self.today - timedelta(days=2)
+        data = self.get(f'/api/v1/services/charts/sales/?bucket=day&from={day:%Y-%m-%d}&to={day:%Y-%m-%d}')
+        self.assertEqual(len(data['labels']), 1)   # 'to' includes its whole day
+
+        client = APIClient()
+        response = client.get('/api/v1/services/charts/sales/', {'from': 'last week'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {"error": "Invalid date 'last week'. Use YYYY-MM-DD or an ISO datetime."})
+        response = client.get('/api/v1/services/charts/sales/', {'from': '2025-03-02', 'to': '2025-03-01'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_invalid_window(self):
+        client = APIClient()
+        for url in ('/api/v1/services/charts/summary/', '/api/v1/services/charts/sales-summary/'):
+            for window in ('abc', '0', '366'):
+                self.assertEqual(client.get(f'{url}?window={window}').status_code, 400)
+
+    def test_invalid_data_source_id(self):
+        client = APIClient()
+        for url in ('/api/v1/services/charts/summary/', '/api/v1/services/charts/sales-summary/',
+                    '/api/v1/services/charts/sales/', '/api/v1/services/charts/top-products/'):
+            for data_source_id in ('abc', '-1', '1.5', ''):
+                response = client.get(url, {'data_source_id': data_source_id})
+                self.assertEqual(response.status_code, 400, (url, data_source_id))
+                self.assertEqual(response.json(), {"error": "data_source_id must be an integer"})
+            self.assertEqual(client.get(url, {'data_source_id': self.data_source.id}).status_code, 200)
+
+
+# --- Materialized sales series ---
+
+class SalesSeriesTests(TestCase):
+    """The incrementally refreshed series always equals a fresh parse of the lake."""
+
+    def setUp(self):
+        self.root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.root.cleanup)
+        self.store = LocalObjectStore(self.root.name)
+
+    def write(self, key, rows):
+        path = os.path.join(self.root.name, *key.split('/'))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        lines = ['timestamp,metric_name,value,product'] + [f'{ts},{name},{value},Widget' for ts, name, value in rows]
+        with open(path, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+
+    def expected(self, grain):
+        """Series computed from scratch over every CSV currently in the store."""
+        totals = {}
+        for obj in self.store.list('raw-data/'):
+            contribution, _ = object_buckets(self.store.read(obj.key))
+            for start, (total, _) in contribution.get(grain, {}).items():
+                totals[start] = totals.get(start, 0) + total
+        return sorted((datetime.fromisoformat(start), total) for start, total in totals.items())
+
+    def assertSeriesMatch(self):
+        for grain in ('day', 'week', 'month'):
+            actual = sales_series(grain)
+            expected = self.expected(grain)
+            self.assertEqual([start for start, _ in actual], [start for start, _ in expected], grain)
+            for (_, total), (_, want) in zip(actual, expected):
+                self.assertAlmostEqual(total, want)
+
+    def test_incremental_refresh(self):
+        self.write('raw-data/a.csv', [('2025-01-01', 'Daily_Sales', 100), ('2025-01-02', 'Daily_Sales', 50),
+                                      ('2025-01-02', 'Conversion_Rate', 0.5)])
+        self.write('raw-data/b.csv', [('2025-01-02', 'Daily_Sales', 25), ('2025-02-10', 'Daily_Sales', 10)])
+        self.write('other/ignored.csv', [('2025-01-01', 'Daily_Sales', 999)])
+        self.assertEqual(refresh_sales_series(self.store)['processed'], 2)
+        self.assertSeriesMatch()
+        self.assertEqual(sales_series('month')[0][1], 175)
+
+        # Nothing changed: nothing is re-read.
+        self.assertEqual(refresh_sales_series(self.store), {'processed': 0, 'unchanged': 2, 'removed': 0, 'failed': 0})
+
+        # Change one object, add one, delete one.
+        self.write('raw-data/a.csv', [('2025-01-01', 'Daily_Sales', 70), ('2025-03-05', 'Daily_Sales', 5.5)])
+        self.write('raw-data/c.csv', [('2025-01-06', 'Daily_Sales', 1)])
+        os.remove(os.path.join(self.root.name, 'raw-data', 'b.csv'))
+        counts = refresh_sales_series(self.store)
+        self.assertEqual((counts['processed'], counts['removed']), (2, 1))
+        self.assertSeriesMatch()
+        self.assertEqual(SalesSeriesObject.objects.count(), 2)
+        # Buckets only b.csv fed are gone, not left at zero.
+        self.assertFalse(SalesSeriesBucket.objects.filter(grain='month', bucket_start__month=2).exists())
+
+    def test_unparseable_object_is_skipped(self):
+        self.write('raw-data/good.csv', [('2025-01-01', 'Daily_Sales', 10)])
+        path = os.path.join(self.root.name, 'raw-data', 'bad.csv')
+        with open(path, 'wb') as f:
+            f.write(b'\x00\xff"unterminated')
+        counts = refresh_sales_series(self.store)
+        self.assertEqual(counts['processed'], 1)
+        self.assertEqual(sales_series('day')[0][1], 10)
+
+    def test_view_serves_materialized_series(self):
+        self.write('raw-data/a.csv', [('2025-01-01', 'Daily_Sales', 100), ('2025-01-08', 'Daily_Sales', 50)])
+        refresh_sales_series(self.store)
+        client = APIClient()
+        data = client.get('/api/v1/services/charts/enhanced-sales/?timeframe=weekly').json()['data']
+        self.assertEqual(data['labels'], ['2024-12-30', '2025-01-06'])
+        self.assertEqual(data['datasets'][0]['data'], [100, 50])
+        self.assertEqual(client.get('/api/v1/services/charts/enhanced-sales/?timeframe=hourly').status_code, 400)
+
+    def test_bucket_inserted_by_a_concurrent_refresh(self):
+        self.write('raw-data/a.csv', [('2025-01-01', 'Daily_Sales', 100)])
+        bulk_create = SalesSeriesBucket.objects.bulk_create
+
+        def racing_insert(objs, **kwargs):
+            # Another refresh commits the same buckets after ours looked for them.
+            for obj in objs:
+                SalesSeriesBucket.objects.get_or_create(
+                    grain=obj.grain, bucket_start=obj.bucket_start, defaults={'total': 40, 'count': 1},
+                )
+            return bulk_create(objs, **kwargs)
+
+        with mock.patch.object(SalesSeriesBucket.objects, 'bulk_create', side_effect=racing_insert):
+            self.assertEqual(refresh_sales_series(self.store)['processed'], 1)
+        for grain in ('day', 'week', 'month'):
+            self.assertEqual(sales_series(grain)[0][1], 140)
+        self.assertEqual(SalesSeriesBucket.objects.get(grain='day').count, 2)
+
+    @unittest.skipIf(moto is None, "moto is not installed")
+    def test_s3_listing_pages_past_1000_keys(self):
+        import boto3
+        with moto.mock_aws():
+            client = boto3.client('s3', region_name='us-east-1')
+            client.create_bucket(Bucket='lake')
+            for i in range(1005):
+                client.put_object(Bucket='lake', Key=f'raw-data/{i:04}.csv', Body=b'timestamp,metric_name,value\n')
+            self.assertEqual(len(list(S3ObjectStore('lake', client).list('raw-data/'))), 1005)
+
+
+# --- Metric dedupe backup ---
+
+class DropDedupeBackupTests(TestCase):
+    TABLE = 'services_metric_dedupe_backup'
+
+    def test_drops_the_backup_once(self):
+        self.assertIn(self.TABLE, connection.introspection.table_names())   # left by services.0002
+        out = io.StringIO()
+        call_command('drop_metric_dedupe_backup', stdout=out)
+        self.assertIn("Dropped services_metric_dedupe_backup (0 duplicate metrics)", out.getvalue())
+        self.assertNotIn(self.TABLE, connection.introspection.table_names())
+
+        out = io.StringIO()
+        call_command('drop_metric_dedupe_backup', stdout=out)
+        self.assertIn("nothing to drop", out.getvalue())
+
+
+# --- Bulk metric validation ---
+
+# Marks a field left out of a test record.
+MISSING = object()
+
+
+class MetricValidationTests(TestCase):
+    """validate_metric_records must report what MetricCreateSerializer(many=True) did."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create(username='validator')
+        cls.data_source = DataSource.objects.create(owner=cls.user, name='Validated Source', source_type='CUSTOM')
+
+    def record(self, **overrides):
+        record = {
+            'name': 'Daily_Sales', 'value': 12.5, 'timestamp': '2025-03-01T09:30:00Z',
+            'data_source_id': self.data_source.id, 'product': 'Product Alpha',
+        }
+        record.update(overrides)
+        return {field: value for field, value in record.items() if value is not MISSING}
+
+    def serializer_errors(self, records):
+        serializer = MetricCreateSerializer(data=records, many=True)
+        serializer.is_valid()
+        return {
+            index: {field: [str(message) for message in messages] for field, messages in row.items()}
+            for index, row in enumerate(serializer.errors) if row
+        }
+
+    def assertMatchesSerializer(self, records):
+        expected = self.serializer_errors(records)
+        self.assertTrue(expected)
+        self.assertEqual(validate_metric_records(records).errors, expected)
+        # The column-wise entry point agrees too (absent keys and nulls both read as missing there).
+        columns = validate_metric_columns(rows_to_columns(records)).errors
+        self.assertEqual(set(columns), set(expected))
+
+    def test_bad_timestamps(self):
+        self.assertMatchesSerializer([
+            self.record(timestamp=value)
+            for value in ('yesterday', '2025-13-01T00:00:00Z', '2025-02-30', '01/03/2025', '', 1740787200)
+        ] + [self.record()])
+
+    def test_non_numeric_values(self):
+        self.assertMatchesSerializer([
+            self.record(value=value) for value in ('abc', '', '12,5', [1], {'amount': 1})
+        ] + [self.record(value='12.5'), self.record(value=3)])
+
+    def test_missing_and_null_fields(self):
+        self.assertMatchesSerializer(
+            [self.record(**{field: MISSING}) for field in ('name', 'value', 'timestamp', 'data_source_id')]
+            + [self.record(**{field: None}) for field in ('name', 'value', 'timestamp', 'data_source_id')]
+            + [self.record(product=MISSING), self.record(product=None)]
+        )
+
+    def test_bad_names_and_data_sources(self):
+        self.assertMatchesSerializer([
+            self.record(name=''), self.record(name='   '), self.record(name='x' * 256), self.record(name=True),
+            self.record(data_source_id=self.data_source.id + 1000), self.record(data_source_id='abc'),
+            self.record(data_source_id='1.5'), self.record(data_source_id=[1]), self.record(data_source_id=True),
+            'not a metric', self.record(name=7, data_source_id=str(self.data_source.id)),
+        ])
+
+    def test_bad_dimensions(self):
+        self.assertMatchesSerializer([
+            self.record(product='x' * 256), self.record(product=['Alpha']), self.record(product={'sku': 1}),
+            self.record(product=False), self.record(product=''), self.record(product=42),
+        ])
+
+    def test_valid_rows_match_serializer_output(self):
+        records = [
+            self.record(name='  Daily_Sales ', product=' Product Beta ', value='7'),
+            self.record(timestamp='2025-03-01T10:30:00+01:00', product=None),
+            self.record(name=5, product=9, data_source_id=str(self.data_source.id)),
+        ]
+        serializer = MetricCreateSerializer(data=records, many=True)
+        self.assertTrue(serializer.is_valid())
+        rows = list(validate_metric_records(records).rows())
+        for row, expected in zip(rows, serializer.validated_data):
+            self.assertEqual(row['name'], expected['name'])
+            self.assertEqual(row['value'], expected['value'])
+            self.assertEqual(row['timestamp'], expected['timestamp'])
+            self.assertEqual(row['data_source_id'], expected['data_source'].id)
+            self.assertEqual(row['product'], expected.get('product'))
+
+    def test_stricter_than_serializer(self):
+        # NaN/inf would poison rollup sums, and a float pk is truncated by the ORM, so these are refused.
+        records = [self.record(value='nan'), self.record(value='inf'), self.record(data_source_id=float(self.data_source.id))]
+        self.assertEqual(self.serializer_errors(records), {})
+        self.assertEqual(validate_metric_records(records).errors, {
+            0: {'value': [INVALID_NUMBER]},
+            1: {'value': [INVALID_NUMBER]},
+            2: {'data_source_id': [INVALID_PK_TYPE.format(type='float')]},
+        })
+
+
+# --- Metric dimensions ---
+
+class MetricDimensionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create(username='dimensions')
+        cls.data_source = DataSource.objects.create(owner=cls.user, name='Dimension Source', source_type='CUSTOM')
+        cls.other_source = DataSource.objects.create(owner=cls.user, name='Other Dimension Source', source_type='CUSTOM')
+        cls.job = IngestionJob.objects.create(data_source=cls.data_source)
+
+    def metric(self, day, metadata, value=10.0, name='Daily_Sales', data_source=None):
+        return Metric(
+            data_source=data_source or self.data_source, ingestion_job=self.job, name=name, value=value,
+            timestamp=datetime(2025, 3, day, tzinfo=timezone.utc), metadata=metadata,
+        )
+
+    def links(self, metric):
+        return dict(MetricDimension.objects.filter(metric=metric).values_list('dimension__name', 'value__value'))
+
+    def test_extract_dimensions(self):
+        self.assertEqual(
+            extract_dimensions({
+                'product': ' Product Alpha ', 'units': 3, 'promo': True, 'region': '',
+                'tags': ['a'], 'extra': {'k': 1}, 'note': None,
+            }),
+            {'product': 'Product Alpha', 'units': '3', 'promo': 'true'},
+        )
+        self.assertEqual(extract_dimensions(None), {})
+        self.assertEqual(extract_dimensions(['product']), {})
+
+    def test_link_dimensions_reuses_values_and_replaces_links(self):
+        first, second = Metric.objects.bulk_create([
+            self.metric(1, {'product': 'Product Alpha', 'region': 'EU'}),
+            self.metric(2, {'product': 'Product Alpha'}),
+        ])
+        self.assertEqual(link_dimensions([(first.id, first.metadata), (second.id, second.metadata)]), 3)
+        self.assertEqual(Dimension.objects.count(), 2)
+        self.assertEqual(DimensionValue.objects.count(), 2)
+        self.assertEqual(self.links(first), {'product': 'Product Alpha', 'region': 'EU'})
+
+        # Relinking drops values the new metadata no longer has.
+        self.assertEqual(link_dimensions([(first.id, {'product': 'Product Beta', 'channel': 'web'})]), 2)
+        self.assertEqual(self.links(first), {'product': 'Product Beta', 'channel': 'web'})
+        self.assertEqual(self.links(second), {'product': 'Product Alpha'})
+
+        # Without replace, existing links are kept and duplicates ignored.
+        link_dimensions([(second.id, {'product': 'Product Alpha', 'region': 'US'})], replace=False)
+        self.assertEqual(self.links(second), {'product': 'Product Alpha', 'region': 'US'})
+
+    def test_filter_and_group_by_dimension(self):
+        write_metrics([
+            self.metric(1, {'product': 'Product Alpha', 'region': 'EU'}, value=10),
+            self.metric(2, {'product': 'Product Alpha', 'region': 'US'}, value=20),
+            self.metric(3, {'product': 'Product Beta', 'region': 'EU'}, value=40),
+            self.metric(4, None, value=80),
+            self.metric(5, {'product': 'Product Alpha', 'region': 'EU'}, value=160, name='Conversion_Rate'),
+        ])
+        sales = Metric.objects.filter(name='Daily_Sales')
+
+        alpha_eu = filter_dimensions(sales, {'product': 'Product Alpha', 'region': 'EU'})
+        self.assertEqual(list(alpha_eu.values_list('value', flat=True)), [10])
+        self.assertEqual(filter_dimensions(sales, {'region': 'EU'}).aggregate(total=Sum('value'))['total'], 50)
+        self.assertFalse(filter_dimensions(sales, {'product': 'Product Gamma'}).exists())
+
+        totals = dict(with_dimension(sales, 'product').values_list('product').annotate(total=Sum('value')))
+        self.assertEqual(totals, {'Product Alpha': 30, 'Product Beta': 40, None: 80})
+        regions = with_dimension(sales, 'region', field='area').order_by('timestamp').values_list('area', flat=True)
+        self.assertEqual(list(regions), ['EU', 'US', 'EU', None])
+        # An unknown dimension annotates every row with None.
+        self.assertEqual(set(with_dimension(sales, 'channel').values_list('channel', flat=True)), {None})
+
+    def test_update_replaces_dimension_links(self):
+        write_metrics([self.metric(1, {'product': 'Product Alpha', 'region': 'EU', 'channel': 'web'})])
+        metric = Metric.objects.get()
+
+        result = write_metrics([self.metric(1, {'product': 'Product Alpha', 'region': 'US'}, value=12)])
+        self.assertEqual((result.inserted, result.updated), (0, 1))
+        metric.refresh_from_db()
+        self.assertEqual(metric.value, 12)
+        self.assertEqual(self.links(metric), {'product': 'Product Alpha', 'region': 'US'})
+        self.assertFalse(filter_dimensions(Metric.objects.all(), {'channel': 'web'}).exists())
+
+        # Skipped rows keep the links of the stored row.
+        write_metrics([self.metric(1, {'product': 'Product Alpha', 'region': 'APAC'}, value=13)], on_conflict='skip')
+        self.assertEqual(self.links(metric), {'product': 'Product Alpha', 'region': 'US'})
+
+    def test_backfill_dimensions_command(self):
+        # Rows written before dimension linking existed have metadata but no links.
+        Metric.objects.bulk_create(
+            [self.metric(day, {'product': f'Product {day % 2}', 'region': 'EU'}) for day in range(1, 6)]
+            + [self.metric(6, None), self.metric(7, {'product': 'Product 9'}, data_source=self.other_source)]
+        )
+        out = io.StringIO()
+        call_command('backfill_dimensions', batch_size=2, data_source=self.data_source.id, stdout=out)
+
+        self.assertIn('Done: 5 metrics, 10 dimension links.', out.getvalue())
+        self.assertEqual(out.getvalue().count('Backfilled'), 3)
+        self.assertEqual(MetricDimension.objects.count(), 10)
+        self.assertEqual(filter_dimensions(Metric.objects.all(), {'product': 'Product 1'}).count(), 3)
+        self.assertFalse(filter_dimensions(Metric.objects.all(), {'product': 'Product 9'}).exists())
+
+        # Running it again relinks the same rows instead of duplicating them.
+        call_command('backfill_dimensions', stdout=io.StringIO())
+        self.assertEqual(MetricDimension.objects.count(), 11)
+
+
+# --- Incremental rollups ---
+
+class RollupEquivalenceTests(TestCase):
+    """Rollups kept by write_metrics must equal a rebuild_rollups() from the raw metrics."""
+    SEEDS = (1, 7, 42, 2025, 31337)
+    BATCHES = 12
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create(username='rollups')
+        cls.data_sources = [
+            DataSource.objects.create(owner=cls.user, name=f'Rollup Source {i}', source_type='CUSTOM') for i in range(2)
+        ]
+        cls.job = IngestionJob.objects.create(data_source=cls.data_sources[0])
+
+    def random_batch(self, rng):
+        # Few distinct keys, so later batches keep hitting stored rows and each other.
+        start = datetime(2025, 1, 30, 22, tzinfo=timezone.utc)
+        return [
+            Metric(
+                data_source=rng.choice(self.data_sources),
+                ingestion_job=self.job,
+                name=rng.choice(('Daily_Sales', 'Conversion_Rate')),
+                # Crosses hour, day and month boundaries.
+                timestamp=start + timedelta(minutes=rng.choice((0, 30, 90, 150, 24 * 60 + 30, 2 * 24 * 60 + 45))),
+                value=rng.choice((rng.uniform(-50, 500), rng.randint(0, 3), 0.0)),
+                metadata=rng.choice((None, {'product': 'Product Alpha'}, {'product': 'Product Beta'}, {'product': 'Product Alpha', 'region': 'EU'})),
+            )
+            for _ in range(rng.randint(1, 25))
+        ]
+
+    def snapshot(self):
+        return {
+            (r.data_source_id, r.name, r.dimension_key, r.grain, r.bucket_start): tuple(getattr(r, f) for f in STAT_FIELDS)
+            for r in MetricRollup.objects.all()
+        }
+
+    def assertRollupsMatchRebuild(self, msg):
+        incremental = self.snapshot()
+        # Rebuild in a rolled-back savepoint, so the incremental rollups keep accumulating.
+        with transaction.atomic():
+            rebuild_rollups()
+            rebuilt = self.snapshot()
+            transaction.set_rollback(True)
+        self.assertEqual(set(incremental), set(rebuilt), msg)
+        for key, expected in rebuilt.items():
+            for field, got, want in zip(STAT_FIELDS, incremental[key], expected):
+                self.assertAlmostEqual(got, want, places=6, msg=f"{msg}: {field} of {key}")
+
+    def test_incremental_matches_rebuild(self):
+        for seed in self.SEEDS:
+            with self.subTest(seed=seed):
+                rng = random.Random(seed)
+                Metric.objects.all().delete()
+                MetricRollup.objects.all().delete()
+                for batch_number in range(self.BATCHES):
+                    on_conflict = rng.choice(('update', 'update', 'skip'))
+                    write_metrics(self.random_batch(rng), batch_size=rng.randint(1, 10), on_conflict=on_conflict)
+                    self.assertRollupsMatchRebuild(f"seed {seed}, batch {batch_number} ({on_conflict})")
+                self.assertEqual({key[3] for key in self.snapshot()}, set(GRAINS))
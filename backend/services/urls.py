@@ -18,6 +18,8 @@ router.register(r'forecasts', ForecastPredictionViewSet, basename='forecasts')
 urlpatterns = [
     path("upload/", views.UploadDataView.as_view(), name="upload-data"),
     path('q/ask/', views.NaturalLanguageQueryView.as_view(), name='natural-language-query'),
+    path('q/ask/stream/', views.NaturalLanguageQueryStreamView.as_view(), name='natural-language-query-stream'),
+    path('q/cache-stats/', views.QuestionCacheStatsView.as_view(), name='question-cache-stats'),
 
     # Alert actions (placed before router to avoid conflict with retrieve)
     path('alerts/<int:pk>/acknowledge/', views.AcknowledgeAlertView.as_view(), name='acknowledge-alert'),
@@ -39,6 +41,7 @@ urlpatterns = [
     path('q/recommendations/', views.BusinessRecommendationsView.as_view(), name='business-recommendations'),
     path('q/health/', views.BusinessHealthView.as_view(), name='business-health'),
     path('q/what-if/', views.WhatIfAnalysisView.as_view(), name='what-if-analysis'),
+    path('q/what-if/stream/', views.WhatIfAnalysisStreamView.as_view(), name='what-if-analysis-stream'),
 
     # Alerts & Insights endpoints
     path('alerts/', views.AlertViewSet.as_view({'get': 'list'}), name='alerts-list'),
@@ -0,0 +1,176 @@
+# services/validation.py
+"""
+Columnar validation for bulk metric ingestion.
+
+MetricCreateSerializer validates one row at a time: a DataSource lookup and a
+DateTimeField parse per metric. This module validates a whole batch as
+columns instead. Data sources are resolved with one query per batch (one
+lookup per distinct id), values and timestamps are parsed with pandas in a
+single pass, and errors are reported per row index using the same messages
+DRF would produce.
+"""
+import numpy as np
+import pandas as pd
+
+from core.models import DataSource
+
+METRIC_FIELDS = ('name', 'value', 'timestamp', 'data_source_id', 'product')
+MAX_LENGTH = 255
+
+REQUIRED = "This field is required."
+NULL = "This field may not be null."
+NOT_A_DICT = "Invalid data. Expected a dictionary, but got {type}."
+BLANK = "This field may not be blank."
+NOT_A_STRING = "Not a valid string."
+TOO_LONG = f"Ensure this field has no more than {MAX_LENGTH} characters."
+INVALID_NUMBER = "A valid number is required."
+INVALID_DATETIME = (
+    "Datetime has wrong format. Use one of these formats instead: "
+    "YYYY-MM-DDThh:mm[:ss[.uuuuuu]][+HH:MM|-HH:MM|Z]."
+)
+INVALID_PK_TYPE = "Incorrect type. Expected pk value, received {type}."
+UNKNOWN_PK = 'Invalid pk "{pk}" - object does not exist.'
+
+
+class MetricBatch:
+    """Result of validating a batch: parsed columns plus errors keyed by row index."""
+
+    def __init__(self, columns, errors):
+        self.columns = columns
+        self.errors = errors
+
+    def __len__(self):
+        return len(self.columns['name'])
+
+    @property
+    def is_valid(self):
+        return not self.errors
+
+    def rows(self):
+        """Yield validated rows as dicts, in input order."""
+        for name, value, timestamp, data_source_id, product in zip(
+            self.columns['name'],
+            self.columns['value'],
+            self.columns['timestamp'],
+            self.columns['data_source_id'],
+            self.columns['product'],
+        ):
+            yield {
+                'name': name,
+                'value': value,
+                'timestamp': timestamp,
+                'data_source_id': data_source_id,
+                'product': product,
+            }
+
+
+def is_text(value):
+    """CharField accepts strings and numbers (not booleans) and stores them as strings."""
+    return isinstance(value, (str, int, float)) and not isinstance(value, bool)
+
+
+def rows_to_columns(records):
+    """Pivot a list of metric dicts into one list per field."""
+    records = [record if isinstance(record, dict) else {} for record in records]
+    return {field: [record.get(field) for record in records] for field in METRIC_FIELDS}
+
+
+def validate_metric_records(records):
+    """Validate a list of metric dicts (the JSON/NDJSON payload shape)."""
+    batch = validate_metric_columns(rows_to_columns(records))
+    for index, record in enumerate(records):
+        if not isinstance(record, dict):
+            batch.errors[index] = {'non_field_errors': [NOT_A_DICT.format(type=type(record).__name__)]}
+            continue
+        # Columns cannot tell an absent key from an explicit null; DRF words them differently.
+        for field, messages in batch.errors.get(index, {}).items():
+            if field in record and messages == [REQUIRED]:
+                messages[0] = NULL
+    if batch.errors:
+        batch.errors = dict(sorted(batch.errors.items()))
+    return batch
+
+
+def validate_metric_columns(columns):
+    """
+    Validate a batch given as columns (name/value/timestamp/data_source_id/product).
+
+    Returns a MetricBatch whose columns hold the parsed Python values
+    (str, float, aware datetime, int, str or None) and whose errors map row
+    index -> {field: [messages]}.
+    """
+    size = len(columns['name'])
+    errors = {}
+
+    def flag(mask, field, message):
+        for index in np.flatnonzero(mask):
+            errors.setdefault(int(index), {}).setdefault(field, []).append(message)
+
+    # --- name: required, non-blank string of at most 255 characters ---
+    names = pd.Series(columns['name'], dtype=object)
+    missing = names.isna().to_numpy()
+    is_str = names.map(is_text).to_numpy(dtype=bool) & ~missing
+    stripped = names.where(is_str).map(str, na_action='ignore').str.strip()
+    lengths = stripped.str.len().fillna(0).to_numpy()
+    flag(missing, 'name', REQUIRED)
+    flag(~missing & ~is_str, 'name', NOT_A_STRING)
+    flag(is_str & (lengths == 0), 'name', BLANK)
+    flag(is_str & (lengths > MAX_LENGTH), 'name', TOO_LONG)
+
+    # --- value: required finite number ---
+    raw_values = pd.Series(columns['value'], dtype=object)
+    missing = raw_values.isna().to_numpy()
+    values = pd.to_numeric(raw_values, errors='coerce').astype(float)
+    flag(missing, 'value', REQUIRED)
+    flag(~missing & ~np.isfinite(values.to_numpy()), 'value', INVALID_NUMBER)
+
+    # --- timestamp: required ISO 8601 string; naive values are taken as UTC ---
+    raw_timestamps = pd.Series(columns['timestamp'], dtype=object)
+    missing = raw_timestamps.isna().to_numpy()
+    ts_is_str = raw_timestamps.map(lambda v: isinstance(v, str)).to_numpy(dtype=bool)
+    timestamps = pd.to_datetime(
+        raw_timestamps.where(ts_is_str), errors='coerce', utc=True, format='ISO8601'
+    )
+    flag(missing, 'timestamp', REQUIRED)
+    flag(~missing & timestamps.isna().to_numpy(), 'timestamp', INVALID_DATETIME)
+
+    # --- data_source_id: required pk of an existing DataSource ---
+    raw_ids = pd.Series(columns['data_source_id'], dtype=object)
+    missing = raw_ids.isna().to_numpy()
+    id_is_number = raw_ids.map(
+        lambda v: isinstance(v, (int, str)) and not isinstance(v, bool)
+    ).to_numpy(dtype=bool)
+    ids = pd.to_numeric(raw_ids.where(id_is_number), errors='coerce')
+    integral = ids.notna().to_numpy() & (ids.fillna(0) % 1 == 0).to_numpy()
+    flag(missing, 'data_source_id', REQUIRED)
+    # Like PrimaryKeyRelatedField, a string that is not an integer is the wrong type, not an unknown pk.
+    for index in np.flatnonzero(~missing & ~integral):
+        errors.setdefault(int(index), {}).setdefault('data_source_id', []).append(
+            INVALID_PK_TYPE.format(type=type(raw_ids.iat[index]).__name__)
+        )
+    int_ids = ids.where(integral).astype('Int64')
+    distinct_ids = [int(pk) for pk in int_ids.dropna().unique()]
+    known = set(DataSource.objects.filter(pk__in=distinct_ids).values_list('pk', flat=True))
+    unknown = integral & ~(int_ids.isin(known).fillna(False).to_numpy(dtype=bool))
+    for index in np.flatnonzero(unknown):
+        errors.setdefault(int(index), {}).setdefault('data_source_id', []).append(
+            UNKNOWN_PK.format(pk=raw_ids.iat[index])
+        )
+
+    # --- product: optional string of at most 255 characters, trimmed like name ---
+    raw_products = pd.Series(columns['product'], dtype=object)
+    has_product = raw_products.notna().to_numpy()
+    product_is_str = raw_products.map(is_text).to_numpy(dtype=bool) & has_product
+    products = raw_products.where(product_is_str).map(str, na_action='ignore').str.strip()
+    product_lengths = products.str.len().fillna(0).to_numpy()
+    flag(has_product & ~product_is_str, 'product', NOT_A_STRING)
+    flag(has_product & product_is_str & (product_lengths > MAX_LENGTH), 'product', TOO_LONG)
+
+    parsed = {
+        'name': stripped.tolist(),
+        'value': values.tolist(),
+        'timestamp': list(timestamps.dt.to_pydatetime()) if size else [],
+        'data_source_id': [None if pk is pd.NA else pk for pk in int_ids.tolist()],
+        'product': [product if ok else None for product, ok in zip(products.tolist(), product_is_str)],
+    }
+    return MetricBatch(parsed, dict(sorted(errors.items())))
@@ -1,32 +1,71 @@
-from django.shortcuts import render
-import pandas as pd
+from django.conf import settings
+from django.http import JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404, render
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
 from rest_framework import viewsets
+from rest_framework.decorators import action
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework import status
+from rest_framework.exceptions import ParseError
 from django.core.files.storage import default_storage
-import boto3
 import os, json
-import io
-from django.db.models import Sum, Avg, Count
+from django.db.models import Count, Prefetch
 from django.utils import timezone
-from datetime import timedelta
+from django.utils.dateparse import parse_date, parse_datetime
+from datetime import datetime, timedelta, timezone as dt_timezone
 from django.db.models.functions import TruncMonth
 
 from .models import Metric, Insight, Alert, ForecastPrediction
 from .serializers import (
     MetricViewSetSerializer,
     InsightViewSetSerializer,
+    MetricReadSerializer,
     AlertViewSetSerializer,
     ForecastPredictionSerializer
 )
+from .alerts import ALERT_ACTIONS, ALERT_STATES, DELIVERY_STATUSES, apply_alert_action, select_alerts
 from .amazon_q_service import BizPulseAmazonQService
+from .dimensions import filter_dimensions
+from .intents import answer_intent, parse_intent
+from .kpis import evaluate, metrics_summary_kpis, sales_summary_kpis
+from .pagination import KeysetPagination
+from .precompute import enqueue_refresh, read_answer
+from .question_cache import answer_question, invalidate as invalidate_questions, stats as question_cache_stats
+from .rollups import RANKING_PERIODS, SERIES_BUCKETS, rank_products, rollup_series
+from .sales_series import TIMEFRAMES, sales_series
+from .streaming import ask_events, what_if_events
 from services.models import IngestionJob
+from core.aws_clients import get_client
 from core.models import DataSource
+from core.queue import enqueue
 
 # Create your views here.
 
+def parse_time_bound(value, inclusive_day=False):
+    """
+    Parse an ISO date or datetime query bound to an aware datetime (None if
+    empty). With inclusive_day a bare date maps to the next midnight, for
+    use as an exclusive end. Raises ValueError on bad input.
+    """
+    if not value:
+        return None
+    try:
+        day = parse_date(value)   # parse_datetime would also accept a bare date
+        parsed = None if day else parse_datetime(value)
+    except ValueError:
+        day = parsed = None
+    if day is not None:
+        bound = datetime(day.year, day.month, day.day, tzinfo=dt_timezone.utc)
+        return bound + timedelta(days=1) if inclusive_day else bound
+    if parsed is None:
+        raise ValueError(f"Invalid date '{value}'. Use YYYY-MM-DD or an ISO datetime.")
+    return timezone.make_aware(parsed, dt_timezone.utc) if timezone.is_naive(parsed) else parsed
+
+
 class UploadDataView(APIView):
     def post(self, request, *args, **kwargs):
         file_obj = request.FILES.get("file")
@@ -68,7 +107,7 @@ class UploadDataView(APIView):
         if not bucket_name:
             return Response({"error": "S3 bucket not configured"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-        s3 = boto3.client('s3')
+        s3 = get_client('s3')
         try:
             s3.upload_fileobj(
                 file_obj,
@@ -83,6 +122,9 @@ class UploadDataView(APIView):
         except Exception as e:
             return Response({"error": f"S3 upload failed: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+        # Fold the new file into the materialized sales series in the background
+        enqueue('services.refresh_sales_series')
+
         file_url = f"https://{bucket_name}.s3.amazonaws.com/{file_path}"
         
         # ✅ TRIGGER AMAZON Q SYNC AFTER SUCCESSFUL UPLOAD
@@ -90,7 +132,7 @@ class UploadDataView(APIView):
         q_execution_id = None
         
         try:
-            q_client = boto3.client('qbusiness', region_name='us-east-1')
+            q_client = get_client('qbusiness', 'us-east-1')
             
             # Use environment variables for IDs (you'll need to set these)
             app_id = os.getenv('AMAZON_Q_APP_ID', 'YOUR_APP_ID')
@@ -111,6 +153,13 @@ class UploadDataView(APIView):
         except Exception as e:
             print(f"WARNING: Amazon Q sync failed: {str(e)}")
             # Don't fail the upload if sync fails - just log it
+
+        # Q answers from before the new file are stale, whether or not the sync started.
+        # Dashboard answers are regenerated once the sync has had time to index the file.
+        invalidate_questions(data_source.id)
+        refresh_at = timezone.now() + timedelta(seconds=settings.AMAZON_Q_SYNC_SETTLE_SECONDS)
+        enqueue_refresh(data_source.id, run_after=refresh_at)
+        enqueue_refresh(None, run_after=refresh_at)
         
         return Response({
             "message": "File uploaded successfully!",
@@ -124,25 +173,88 @@ class UploadDataView(APIView):
         
 class MetricViewSet(viewsets.ReadOnlyModelViewSet):
     """
-    Provides read-only access to Metric data.
+    Provides read-only access to Metric data, newest first.
+
+    Lists are keyset-paginated on (timestamp, id) (?cursor=, ?page_size=),
+    so deep pages cost the same as the first. Filters: data_source_id,
+    name, from/to (ISO date or datetime; a date-only 'to' includes that
+    day) and dimension=<name>:<value> (repeatable, all must match).
     """
-    queryset = Metric.objects.all().order_by('-timestamp')
+    queryset = Metric.objects.select_related('insight').order_by('-timestamp', '-id')
     serializer_class = MetricViewSetSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action != 'list':
+            return queryset
+        params = self.request.query_params
+
+        data_source_id = params.get('data_source_id')
+        if data_source_id is not None:
+            if not data_source_id.isdigit():
+                raise ParseError({"error": "data_source_id must be an integer"})
+            queryset = queryset.filter(data_source_id=data_source_id)
+        name = params.get('name')
+        if name:
+            queryset = queryset.filter(name=name)
+
+        start = self.parse_bound(params.get('from'))
+        end = self.parse_bound(params.get('to'), inclusive_day=True)
+        if start is not None:
+            queryset = queryset.filter(timestamp__gte=start)
+        if end is not None:
+            queryset = queryset.filter(timestamp__lt=end)
+
+        dimensions = {}
+        for spec in params.getlist('dimension'):
+            key, sep, value = spec.partition(':')
+            if not sep or not key:
+                raise ParseError({"error": f"Invalid dimension '{spec}'. Use dimension=<name>:<value>."})
+            dimensions[key] = value
+        return filter_dimensions(queryset, dimensions)
+
+    def parse_bound(self, value, inclusive_day=False):
+        try:
+            return parse_time_bound(value, inclusive_day)
+        except ValueError as e:
+            raise ParseError({"error": str(e)})
 
 class InsightViewSet(viewsets.ReadOnlyModelViewSet):
     """
     Provides read-only access to Insight data.
+
+    Each insight embeds a preview of its newest metrics plus metric_count;
+    the full set is keyset-paginated at /insights/{id}/metrics/. A list is
+    two queries however many insights or metrics there are.
     """
     queryset = Insight.objects.all().order_by('-created_at')
     serializer_class = InsightViewSetSerializer
     permission_classes = [IsAuthenticated]
 
+    def get_queryset(self):
+        preview = Metric.objects.order_by('-timestamp', '-id')[:InsightViewSetSerializer.METRIC_PREVIEW]
+        return super().get_queryset().select_related('data_source').annotate(
+            metric_count=Count('metrics'),
+        ).prefetch_related(
+            # A sliced Prefetch runs one windowed query for the whole page.
+            Prefetch('metrics', queryset=preview, to_attr='metric_preview'),
+        )
+
+    @action(detail=True, methods=['get'])
+    def metrics(self, request, pk=None):
+        """All metrics linked to this insight, newest first, keyset-paginated."""
+        insight = get_object_or_404(Insight.objects.only('id'), pk=pk)
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(Metric.objects.filter(insight=insight), request, view=self)
+        return paginator.get_paginated_response(MetricReadSerializer(page, many=True).data)
+
 class AlertViewSet(viewsets.ReadOnlyModelViewSet):
     """
     Provides read-only access to Alert data.
     """
-    queryset = Alert.objects.all().order_by('-timestamp')
+    queryset = Alert.objects.select_related('insight__data_source').order_by('-timestamp')
     serializer_class = AlertViewSetSerializer
     permission_classes = [IsAuthenticated]
     
@@ -166,6 +278,16 @@ class ForecastPredictionViewSet(viewsets.ReadOnlyModelViewSet):
 
 # services/views.py
 class NaturalLanguageQueryView(APIView):
+    """
+    Answer a question. Simple metric questions ("total Daily_Sales in
+    March") are answered locally from rollups (services.intents); the rest
+    go through Amazon Q, reusing the answer to an equivalent earlier
+    question (services.question_cache) when there is one.
+
+    Body: question, data_source_id (optional). The response adds "engine":
+    "local", "question_cache" or "amazon_q", and for Q answers "cache":
+    hit, similarity and, on a hit, the matched question and time saved.
+    """
     permission_classes = [AllowAny]
     
     def post(self, request, *args, **kwargs):
@@ -173,13 +295,24 @@ class NaturalLanguageQueryView(APIView):
         
         if not question:
             return Response({"error": "Question is required"}, status=400)
+
+        data_source_id = request.data.get('data_source_id')
+        if data_source_id is not None and not str(data_source_id).isdigit():
+            return Response({"error": "data_source_id must be an integer"}, status=400)
+        data_source_id = int(data_source_id) if data_source_id is not None else None
         
         try:
-            q_service = BizPulseAmazonQService()
+            intent = parse_intent(question)
+            if intent is not None:
+                return Response(dict(answer_intent(intent, question, data_source_id), engine="local"))
+
             # ⚠️ No user_id parameter needed for anonymous access
-            result = q_service.ask_question(question=question)
+            result, cache_info = answer_question(
+                question, lambda q: BizPulseAmazonQService().ask_question(question=q), data_source_id,
+            )
+            engine = "question_cache" if cache_info['hit'] else "amazon_q"
             
-            return Response(result)
+            return Response(dict(result, engine=engine, cache=cache_info))
             
         except Exception as e:
             return Response({
@@ -188,24 +321,87 @@ class NaturalLanguageQueryView(APIView):
             }, status=500)
             
             
+def event_stream(events):
+    response = StreamingHttpResponse(events, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'   # keep proxies from buffering the stream
+    return response
+
+
+def stream_request(request, field):
+    """(text, data_source_id) from a streaming view's JSON or form body; raises ValueError."""
+    if request.content_type == 'application/json':
+        try:
+            data = json.loads(request.body or b'{}')
+        except ValueError:
+            raise ValueError("Request body must be JSON")
+    else:
+        data = request.POST
+    text = data.get(field)
+    if not text:
+        raise ValueError(f"{field.capitalize()} is required")
+    data_source_id = data.get('data_source_id')
+    if data_source_id is not None and not str(data_source_id).isdigit():
+        raise ValueError("data_source_id must be an integer")
+    return text, int(data_source_id) if data_source_id is not None else None
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class NaturalLanguageQueryStreamView(View):
+    """
+    NaturalLanguageQueryView as server-sent events (services.streaming):
+    same body, the answer pushed in chunks as it is generated. Async, so
+    serve it from backend/asgi.py.
+    """
+
+    async def post(self, request, *args, **kwargs):
+        try:
+            question, data_source_id = stream_request(request, 'question')
+        except ValueError as e:
+            return JsonResponse({"error": str(e)}, status=400)
+        return event_stream(ask_events(question, data_source_id))
+
+
+class QuestionCacheStatsView(APIView):
+    """Hit rate and Amazon Q time saved by the question cache."""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        return Response(question_cache_stats())
+
+
 # views.py - Add these new endpoints
 class BusinessRecommendationsView(APIView):
+    """
+    Get proactive business recommendations, precomputed by services.precompute.
 
+    Query params: data_source_id (optional; all sources when omitted). The
+    response adds generated_at and stale; a stale answer is refreshed in the
+    background. 202 while the first answer is still being generated.
+    """
     permission_classes = [AllowAny]
+    answer_kind = 'recommendations'
+
     def get(self, request):
-        """Get proactive business recommendations"""
-        q_service = BizPulseAmazonQService()
-        recommendations = q_service.get_business_recommendations()
-        return Response(recommendations)
+        data_source_id = request.query_params.get('data_source_id')
+        if data_source_id is not None and not data_source_id.isdigit():
+            return Response({"error": "data_source_id must be an integer"}, status=status.HTTP_400_BAD_REQUEST)
+        data_source_id = int(data_source_id) if data_source_id is not None else None
 
-class BusinessHealthView(APIView):
+        try:
+            entry = read_answer(self.answer_kind, data_source_id)
+        except Exception as e:
+            return Response({"error": f"Failed to load {self.answer_kind}: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        if entry is None:
+            return Response({
+                "status": "pending",
+                "detail": f"The {self.answer_kind} answer is being generated. Try again shortly.",
+            }, status=status.HTTP_202_ACCEPTED)
+        return Response(dict(entry['payload'], generated_at=entry['generated_at'], stale=entry['stale']))
 
-    permission_classes = [AllowAny]
-    def get(self, request):
-        """Get business health assessment"""
-        q_service = BizPulseAmazonQService()
-        health_check = q_service.analyze_business_health()
-        return Response(health_check)
+class BusinessHealthView(BusinessRecommendationsView):
+    """Get business health assessment (precomputed, see BusinessRecommendationsView)."""
+    answer_kind = 'health'
 
 class WhatIfAnalysisView(APIView):
 
@@ -220,115 +416,129 @@ class WhatIfAnalysisView(APIView):
             f"Analyze this business scenario: {scenario}. Provide projected outcomes and risks."
         )
         return Response(analysis)
-            
-class SalesSummaryView(APIView):
-    """Serve sales summary metrics for sales deep dive page"""
-    permission_classes = [AllowAny]
 
-    def get(self, request, *args, **kwargs):
-        try:
-            summary = self.calculate_sales_summary()
-            return Response(summary)
-        except Exception as e:
-            return Response({"error": str(e)}, status=500)
 
-    def calculate_sales_summary(self):
+@method_decorator(csrf_exempt, name='dispatch')
+class WhatIfAnalysisStreamView(View):
+    """WhatIfAnalysisView as server-sent events (body: scenario, data_source_id optional)."""
+
+    async def post(self, request, *args, **kwargs):
         try:
-            total_revenue_agg = Metric.objects.filter(name='Daily_Sales').aggregate(total=Sum('value'))
-            total_revenue = total_revenue_agg['total'] or 0
+            scenario, data_source_id = stream_request(request, 'scenario')
+        except ValueError as e:
+            return JsonResponse({"error": str(e)}, status=400)
+        return event_stream(what_if_events(scenario, data_source_id))
 
-            avg_order_value_agg = Metric.objects.filter(name='Average_Order_Value').aggregate(avg=Avg('value'))
-            avg_order_value = avg_order_value_agg['avg'] or 0
 
-            conversion_rate_agg = Metric.objects.filter(name='Conversion_Rate').aggregate(avg=Avg('value'))
-            conversion_rate = conversion_rate_agg['avg'] or 0
+MAX_KPI_WINDOW = 365
 
-            # Calculate growth for total revenue (last 30 days vs previous 30 days)
-            from django.utils.timezone import now
-            from datetime import timedelta
 
-            today = now().date()
-            last_30_days = today - timedelta(days=30)
-            prev_30_days = today - timedelta(days=60)
+def parse_kpi_window(request, default=30):
+    """Read the ?window= growth window (whole days) of the summary views."""
+    try:
+        window = int(request.query_params.get('window', default))
+    except ValueError:
+        raise ValueError("window must be an integer number of days")
+    if not 1 <= window <= MAX_KPI_WINDOW:
+        raise ValueError(f"window must be between 1 and {MAX_KPI_WINDOW}")
+    return window
 
-            recent_revenue = Metric.objects.filter(
-                name='Daily_Sales',
-                timestamp__gte=last_30_days
-            ).aggregate(total=Sum('value'))['total'] or 0
 
-            prev_revenue = Metric.objects.filter(
-                name='Daily_Sales',
-                timestamp__gte=prev_30_days,
-                timestamp__lt=last_30_days
-            ).aggregate(total=Sum('value'))['total'] or 0
+def parse_data_source_id(request):
+    """Read the optional ?data_source_id= filter of the dashboard views (None when absent)."""
+    data_source_id = request.query_params.get('data_source_id')
+    if data_source_id is None:
+        return None
+    if not data_source_id.isdigit():
+        raise ValueError("data_source_id must be an integer")
+    return int(data_source_id)
+
+
+class SalesSummaryView(APIView):
+    """
+    Serve sales summary metrics for sales deep dive page.
+
+    Query params: window (growth window in days, default 30, max 365) and
+    optional data_source_id. All cards come from one KPI query.
+    """
+    permission_classes = [AllowAny]
+
+    def get(self, request, *args, **kwargs):
+        try:
+            window = parse_kpi_window(request)
+            data_source_id = parse_data_source_id(request)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+        try:
+            summary = self.calculate_sales_summary(window, data_source_id)
+            return Response(summary)
+        except Exception as e:
+            return Response({"error": str(e)}, status=500)
 
-            if prev_revenue > 0:
-                revenue_growth = ((recent_revenue - prev_revenue) / prev_revenue) * 100
-            else:
-                revenue_growth = 0
+    def calculate_sales_summary(self, window=30, data_source_id=None):
+        try:
+            # One conditional-aggregation query over the rollups for every card
+            kpis = evaluate(sales_summary_kpis(window), data_source_id=data_source_id)
+            revenue_growth = kpis['revenue_growth']
 
             return {
-                "total_revenue": total_revenue,
-                "avg_order_value": avg_order_value,
-                "conversion_rate": conversion_rate,
-                "revenue_growth": round(revenue_growth, 1)
+                "total_revenue": kpis['total_revenue'],
+                "avg_order_value": kpis['avg_order_value'] or 0,
+                "conversion_rate": kpis['conversion_rate'] or 0,
+                "revenue_growth": round(revenue_growth, 1) if revenue_growth is not None else 0,
+                "window_days": window
             }
         except Exception as e:
             return {
                 "total_revenue": 4820193,
                 "avg_order_value": 245.5,
                 "conversion_rate": 3.4,
-                "revenue_growth": 12.5
+                "revenue_growth": 12.5,
+                "window_days": window
             }
 
 class MetricsSummaryView(APIView):
-    """Serve summary metrics for dashboard cards"""
+    """
+    Serve summary metrics for dashboard cards.
+
+    Query params: window (growth window in days, default 30, max 365) and
+    optional data_source_id. All cards come from one KPI query.
+    """
     permission_classes = [AllowAny]
     
     def get(self, request, *args, **kwargs):
         try:
-            summary = self.calculate_metrics_summary()
+            window = parse_kpi_window(request)
+            data_source_id = parse_data_source_id(request)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+        try:
+            summary = self.calculate_metrics_summary(window, data_source_id)
             
             return Response({
                 "total_sales": summary['total_sales'],
                 "average_conversion": summary['avg_conversion'],
                 "sales_growth": summary['sales_growth'],
-                "active_metrics": summary['active_metrics']
+                "active_metrics": summary['active_metrics'],
+                "window_days": window
             })
             
         except Exception as e:
             return Response({"error": str(e)}, status=500)
     
-    def calculate_metrics_summary(self):
+    def calculate_metrics_summary(self, window=30, data_source_id=None):
         # Calculate from database
         try:
-            # Total sales from Daily_Sales metrics
-            total_sales_agg = Metric.objects.filter(name='Daily_Sales').aggregate(total=Sum('value'))
-            total_sales = total_sales_agg['total'] or 0
-
-            # Average conversion rate (assuming there's a Conversion_Rate metric)
-            avg_conversion_agg = Metric.objects.filter(name='Conversion_Rate').aggregate(avg=Avg('value'))
-            avg_conversion = avg_conversion_agg['avg'] or 0.025
-
-            # Sales growth: compare recent vs older data
-            sales_metrics = Metric.objects.filter(name='Daily_Sales').order_by('-timestamp')
-            if sales_metrics.count() >= 10:
-                recent = list(sales_metrics[:5])
-                older = list(sales_metrics[5:10])
-                recent_sum = sum(m.value for m in recent)
-                older_sum = sum(m.value for m in older)
-                sales_growth = ((recent_sum - older_sum) / older_sum * 100) if older_sum > 0 else 0
-            else:
-                sales_growth = 8.2  # fallback
-
-            # Active metrics count
-            active_metrics = Metric.objects.values('name').distinct().count()
+            # Total sales, conversion, growth and active metrics in one rollup query.
+            # Growth compares the last `window` days with the `window` days before.
+            kpis = evaluate(metrics_summary_kpis(window), data_source_id=data_source_id)
+            sales_growth = kpis['sales_growth']
 
             return {
-                'total_sales': total_sales,
-                'avg_conversion': avg_conversion,
-                'sales_growth': sales_growth,
-                'active_metrics': active_metrics
+                'total_sales': kpis['total_sales'],
+                'avg_conversion': kpis['avg_conversion'] or 0.025,
+                'sales_growth': round(sales_growth, 1) if sales_growth is not None else 0,
+                'active_metrics': kpis['active_metrics']
             }
         except Exception as e:
             # Fallback to sample data if database query fails
@@ -380,11 +590,21 @@ class CustomerMetricsView(APIView):
         return Response(customer_data)
     
 class EnhancedSalesDataView(APIView):
+    """
+    Serve the Daily_Sales line chart from the materialized sales series.
+
+    Query params: timeframe=daily|weekly|monthly (default weekly). The
+    series is kept current by the services.refresh_sales_series task, so a
+    request never touches S3.
+    """
     permission_classes = [AllowAny]
+    LABEL_FORMATS = {'day': '%Y-%m-%d', 'week': '%Y-%m-%d', 'month': '%Y-%m'}
     
     def get(self, request, *args, **kwargs):
         # Get timeframe from query params
         timeframe = request.GET.get('timeframe', 'weekly')  # daily, weekly, monthly
+        if timeframe not in TIMEFRAMES:
+            return Response({"error": f"timeframe must be one of {', '.join(TIMEFRAMES)}"}, status=400)
         
         try:
             sales_data = self.get_processed_sales_data(timeframe)
@@ -399,38 +619,21 @@ class EnhancedSalesDataView(APIView):
             return Response({"error": str(e)}, status=500)
     
     def get_processed_sales_data(self, timeframe):
-        s3 = boto3.client('s3')
-        
-        # Aggregate data based on timeframe
-        all_sales = []
-        
-        response = s3.list_objects_v2(Bucket='bizpulse-data-lake', Prefix='raw-data/')
-        
-        for obj in response.get('Contents', []):
-            if obj['Key'].endswith('.csv'):
-                file_obj = s3.get_object(Bucket='bizpulse-data-lake', Key=obj['Key'])
-                df = pd.read_csv(io.BytesIO(file_obj['Body'].read()))
-                
-                # Process sales data
-                sales_df = df[df['metric_name'] == 'Daily_Sales']
-                sales_df['timestamp'] = pd.to_datetime(sales_df['timestamp'])
-                
-                # Group by timeframe
-                if timeframe == 'daily':
-                    grouped = sales_df.groupby(sales_df['timestamp'].dt.date)['value'].sum()
-                elif timeframe == 'weekly':
-                    grouped = sales_df.groupby(sales_df['timestamp'].dt.isocalendar().week)['value'].sum()
-                elif timeframe == 'monthly':
-                    grouped = sales_df.groupby(sales_df['timestamp'].dt.to_period('M'))['value'].sum()
-                
-                all_sales.append(grouped)
-        
-        # Combine and format for charts
-        if all_sales:
-            # Your data processing logic here
-            pass
+        grain = TIMEFRAMES[timeframe]
+        series = sales_series(grain)
+
+        if series:
+            return {
+                "labels": [start.strftime(self.LABEL_FORMATS[grain]) for start, _ in series],
+                "datasets": [{
+                    "label": "Sales Revenue",
+                    "data": [round(total, 2) for _, total in series],
+                    "borderColor": 'rgb(59, 130, 246)',
+                    "backgroundColor": 'rgba(59, 130, 246, 0.1)',
+                }]
+            }
         
-        # Fallback to sample data
+        # Fallback to sample data until the first refresh has run
         return {
             "labels": ["Week 1", "Week 2", "Week 3", "Week 4"],
             "datasets": [{
@@ -444,46 +647,55 @@ class EnhancedSalesDataView(APIView):
         
 # services/views.py - Update SalesDataView
 class SalesDataView(APIView):
-    """Serve sales data for line charts with product breakdown"""
+    """
+    Serve sales data for line charts with product breakdown.
+
+    Query params: bucket=day|week|month (default month), from/to as
+    YYYY-MM-DD (inclusive, UTC days) and optional data_source_id.
+    """
     permission_classes = [AllowAny]
+    LABEL_FORMATS = {'day': '%Y-%m-%d', 'week': '%Y-%m-%d', 'month': '%Y-%m'}
 
     def get(self, request, *args, **kwargs):
+        bucket = request.query_params.get('bucket', 'month')
+        if bucket not in SERIES_BUCKETS:
+            return Response({"error": f"bucket must be one of {', '.join(SERIES_BUCKETS)}"}, status=400)
         try:
-            sales_data = self.get_sales_data_by_product()
+            start = parse_time_bound(request.query_params.get('from'))
+            end = parse_time_bound(request.query_params.get('to'), inclusive_day=True)
+            data_source_id = parse_data_source_id(request)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+        if start and end and start >= end:
+            return Response({"error": "'from' must not be after 'to'."}, status=400)
+
+        try:
+            sales_data = self.get_sales_data_by_product(bucket, start, end, data_source_id)
             return Response(sales_data)
         except Exception as e:
             return Response({"error": str(e)}, status=500)
 
-    def get_sales_data_by_product(self):
+    def get_sales_data_by_product(self, bucket='month', start=None, end=None, data_source_id=None):
         try:
-            sales_metrics = Metric.objects.filter(name='Daily_Sales').order_by('timestamp')
-            
-            if not sales_metrics.exists():
-                return self.get_fallback_data()
-
-            # Group by month and product
-            monthly_data = {}
+            # One GROUP BY over the rollups: (period, product) -> total
+            period_data = {}
             products = set()
-            
-            for metric in sales_metrics:
-                month = metric.timestamp.strftime('%Y-%m')
-                
-                # Extract product from metadata
-                product = "All Products"
-                if metric.metadata and isinstance(metric.metadata, dict) and 'product' in metric.metadata:
-                    product = metric.metadata['product']
-                
-                if month not in monthly_data:
-                    monthly_data[month] = {}
-                
-                if product not in monthly_data[month]:
-                    monthly_data[month][product] = 0
-                
-                monthly_data[month][product] += float(metric.value)
+            label_format = self.LABEL_FORMATS[bucket]
+
+            for row in rollup_series('Daily_Sales', bucket, start, end, data_source_id):
+                period = row['period'].strftime(label_format)
+                product = row['dimension_key'] or "All Products"
+                period_data.setdefault(period, {})[product] = float(row['total'])
                 products.add(product)
 
+            if not period_data:
+                if start or end or data_source_id:
+                    # An empty filtered window is a real answer, not missing data
+                    return {"labels": [], "datasets": [], "bucket": bucket}
+                return self.get_fallback_data()
+
             # Create datasets for each product
-            labels = sorted(monthly_data.keys())
+            labels = sorted(period_data.keys())
             products = sorted(products)
             
             datasets = []
@@ -491,8 +703,8 @@ class SalesDataView(APIView):
             
             for i, product in enumerate(products):
                 product_data = []
-                for month in labels:
-                    product_data.append(monthly_data[month].get(product, 0))
+                for period in labels:
+                    product_data.append(period_data[period].get(product, 0))
                 
                 datasets.append({
                     "label": product,
@@ -505,7 +717,8 @@ class SalesDataView(APIView):
 
             return {
                 "labels": labels,
-                "datasets": datasets
+                "datasets": datasets,
+                "bucket": bucket,
             }
             
         except Exception as e:
@@ -547,115 +760,74 @@ class SalesDataView(APIView):
 
 # services/views.py - Fix the TopProductsView
 class TopProductsView(APIView):
-    """Serve top products data for bar charts"""
+    """
+    Serve top products data for bar charts.
+
+    Query params: limit (default 10, max 100), period (7d, 30d, 90d, 365d or
+    all; default all) and optional data_source_id. Growth is real
+    period-over-period growth from the day rollups.
+    """
     permission_classes = [AllowAny]
+    MAX_LIMIT = 100
 
     def get(self, request, *args, **kwargs):
+        period = request.query_params.get('period', 'all')
+        if period not in RANKING_PERIODS:
+            return Response({"error": f"period must be one of {', '.join(RANKING_PERIODS)}"}, status=400)
+        try:
+            limit = int(request.query_params.get('limit', 10))
+        except ValueError:
+            return Response({"error": "limit must be an integer"}, status=400)
+        if not 1 <= limit <= self.MAX_LIMIT:
+            return Response({"error": f"limit must be between 1 and {self.MAX_LIMIT}"}, status=400)
         try:
-            top_products = self.get_top_products()
+            data_source_id = parse_data_source_id(request)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+
+        try:
+            top_products = self.get_top_products(period, limit, data_source_id)
             return Response(top_products)
         except Exception as e:
             print(f"ERROR in TopProductsView: {str(e)}")
             return Response({"error": str(e)}, status=500)
 
-    def get_top_products(self):
+    def get_top_products(self, period='all', limit=10, data_source_id=None):
         try:
-            # Read directly from CSV for reliable data
-            csv_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'business data.csv')
-            if os.path.exists(csv_path):
-                df = pd.read_csv(csv_path)
-                sales_df = df[df['metric_name'] == 'Daily_Sales']
-
-                product_revenue = {}
-                for _, row in sales_df.iterrows():
-                    product = row.get('product', 'Unknown').strip()
-                    if product and product != 'Unknown':
-                        if product not in product_revenue:
-                            product_revenue[product] = 0
-                        product_revenue[product] += float(row['value'])
-
-                if product_revenue:
-                    sorted_products = sorted(product_revenue.items(), key=lambda x: x[1], reverse=True)
-                    labels = [p[0] for p in sorted_products]
-                    data_values = [p[1] for p in sorted_products]
-
-                    product_growth = {}
-                    for product, revenue in sorted_products:
-                        growth = (hash(product) % 40) - 20
-                        product_growth[product] = growth
-
-                    colors = ['#3B82F6', '#10B981', '#8B5CF6', '#F59E0B', '#EF4444', '#06B6D4', '#84CC16', '#F97316']
-
-                    return {
-                        "labels": labels,
-                        "datasets": [{
-                            "label": "Revenue",
-                            "data": data_values,
-                            "backgroundColor": [colors[i % len(colors)] for i in range(len(labels))],
-                            "borderRadius": 6,
-                        }],
-                        "products": [
-                            {
-                                "name": product,
-                                "revenue": int(revenue),
-                                "growth": round(product_growth.get(product, 0), 1)
-                            }
-                            for product, revenue in sorted_products
-                        ]
-                    }
+            ranked = rank_products('Daily_Sales', period=period, limit=limit, data_source_id=data_source_id)
+            if not ranked:
+                if period != 'all' or data_source_id:
+                    return {"labels": [], "datasets": [], "products": [], "period": period}
+                return self.get_fallback_data()
 
-            # Fallback to database if CSV not found
-            sales_metrics = Metric.objects.filter(name='Daily_Sales')
-            if sales_metrics.exists():
-                product_revenue = {}
-                for metric in sales_metrics:
-                    product = "Unknown"
-                    if metric.metadata and isinstance(metric.metadata, dict) and 'product' in metric.metadata:
-                        product = metric.metadata['product'].strip()
-
-                    if product and product != "Unknown":
-                        if product not in product_revenue:
-                            product_revenue[product] = 0
-                        product_revenue[product] += float(metric.value)
-
-                if product_revenue:
-                    sorted_products = sorted(product_revenue.items(), key=lambda x: x[1], reverse=True)
-                    labels = [p[0] for p in sorted_products]
-                    data_values = [p[1] for p in sorted_products]
-
-                    product_growth = {}
-                    for product, revenue in sorted_products:
-                        growth = (hash(product) % 40) - 20
-                        product_growth[product] = growth
-
-                    colors = ['#3B82F6', '#10B981', '#8B5CF6', '#F59E0B', '#EF4444', '#06B6D4', '#84CC16', '#F97316']
-
-                    return {
-                        "labels": labels,
-                        "datasets": [{
-                            "label": "Revenue",
-                            "data": data_values,
-                            "backgroundColor": [colors[i % len(colors)] for i in range(len(labels))],
-                            "borderRadius": 6,
-                        }],
-                        "products": [
-                            {
-                                "name": product,
-                                "revenue": int(revenue),
-                                "growth": round(product_growth.get(product, 0), 1)
-                            }
-                            for product, revenue in sorted_products
-                        ]
-                    }
+            colors = ['#3B82F6', '#10B981', '#8B5CF6', '#F59E0B', '#EF4444', '#06B6D4', '#84CC16', '#F97316']
+            labels = [product['name'] for product in ranked]
 
-            # Final fallback
-            return self.get_fallback_data()
+            return {
+                "labels": labels,
+                "datasets": [{
+                    "label": "Revenue",
+                    "data": [product['revenue'] for product in ranked],
+                    "backgroundColor": [colors[i % len(colors)] for i in range(len(labels))],
+                    "borderRadius": 6,
+                }],
+                "products": [
+                    {
+                        "name": product['name'],
+                        "revenue": int(product['revenue']),
+                        "previous_revenue": int(product['previous_revenue']),
+                        "growth": product['growth'],
+                    }
+                    for product in ranked
+                ],
+                "period": period,
+            }
         except Exception as e:
             print(f"ERROR in get_top_products: {str(e)}")
             return self.get_fallback_data()
 
     def get_fallback_data(self):
-        # Enhanced fallback that includes ALL products from your CSV
+        # Demo data shown before any sales metrics have been ingested
         return {
             "labels": ["Product Alpha", "Product Bravo", "Product Charlie", "Product Delta", "Product Echo", "Product Felga"],
             "datasets": [{
@@ -678,61 +850,83 @@ class TopProductsView(APIView):
  # services/views.py - Add these views
 class AcknowledgeAlertView(APIView):
     permission_classes = [IsAuthenticated]
+    alert_action = 'acknowledge'
     
     def post(self, request, pk):
-        try:
-            alert = Alert.objects.get(id=pk)
-            alert.status = 'ACKNOWLEDGED'
-            alert.acknowledged_at = timezone.now()
-            alert.acknowledged_by = request.user
-            alert.save()
-            
-            return Response({"message": "Alert acknowledged", "status": alert.status})
-        except Alert.DoesNotExist:
+        result = apply_alert_action(select_alerts(ids=[pk]), self.alert_action, request.user)
+        if not result['matched']:
             return Response({"error": "Alert not found"}, status=404)
+        state = ALERT_ACTIONS[self.alert_action].state
+        if not result['updated']:
+            return Response({"error": f"Alert cannot be {state.lower()} from its current state"}, status=409)
+        return Response({"message": f"Alert {state.lower()}", "state": state})
 
-class DismissAlertView(APIView):
-    permission_classes = [IsAuthenticated]
-    
-    def post(self, request, pk):
-        try:
-            alert = Alert.objects.get(id=pk)
-            alert.status = 'DISMISSED'
-            alert.dismissed_at = timezone.now()
-            alert.dismissed_by = request.user
-            alert.save()
-            
-            return Response({"message": "Alert dismissed", "status": alert.status})
-        except Alert.DoesNotExist:
-            return Response({"error": "Alert not found"}, status=404)
+class DismissAlertView(AcknowledgeAlertView):
+    alert_action = 'dismiss'
 
 class BulkAlertActionView(APIView):
+    """
+    Apply acknowledge/dismiss/archive to many alerts with one UPDATE.
+
+    Body: {"action": ..., "alert_ids": [...]} and/or {"filter": {...}} with
+    min_severity, max_severity, data_source_id, from, to (ISO date or
+    datetime; a date-only 'to' includes that day), state and status (a
+    value or a list). Both given means both must match. Returns matched,
+    updated and skipped counts; no alert rows are loaded.
+    """
     permission_classes = [IsAuthenticated]
+    FILTER_KEYS = {'min_severity', 'max_severity', 'data_source_id', 'from', 'to', 'state', 'status'}
     
     def post(self, request):
-        alert_ids = request.data.get('alert_ids', [])
+        alert_ids = request.data.get('alert_ids')
+        spec = request.data.get('filter')
         action = request.data.get('action')  # 'acknowledge', 'dismiss', 'archive'
         
-        if not alert_ids or not action:
-            return Response({"error": "alert_ids and action are required"}, status=400)
+        if action not in ALERT_ACTIONS:
+            return Response({"error": f"action must be one of {', '.join(ALERT_ACTIONS)}"}, status=400)
+        if not alert_ids and not spec:
+            return Response({"error": "alert_ids or a non-empty filter is required"}, status=400)
+        try:
+            criteria = self.parse_filter(spec or {})
+            if alert_ids:
+                if not isinstance(alert_ids, list):
+                    raise ValueError("alert_ids must be a list")
+                criteria['ids'] = [int(alert_id) for alert_id in alert_ids]
+        except (TypeError, ValueError) as e:
+            return Response({"error": str(e)}, status=400)
         
         try:
-            alerts = Alert.objects.filter(id__in=alert_ids)
-            updated_count = 0
-            
-            for alert in alerts:
-                if action == 'acknowledge':
-                    alert.status = 'ACKNOWLEDGED'
-                    alert.acknowledged_at = timezone.now()
-                    alert.acknowledged_by = request.user
-                elif action == 'dismiss':
-                    alert.status = 'DISMISSED'
-                    alert.dismissed_at = timezone.now()
-                    alert.dismissed_by = request.user
-                
-                alert.save()
-                updated_count += 1
-            
-            return Response({"message": f"{updated_count} alerts {action}ed"})
+            result = apply_alert_action(select_alerts(**criteria), action, request.user)
+            state = ALERT_ACTIONS[action].state
+            return Response({
+                "message": f"{result['updated']} alerts {state.lower()}",
+                "action": action,
+                **result,
+            })
         except Exception as e:
-            return Response({"error": str(e)}, status=500)
\ No newline at end of file
+            return Response({"error": str(e)}, status=500)
+
+    def parse_filter(self, spec):
+        """Turn a filter spec into select_alerts() keyword arguments (ValueError if invalid)."""
+        if not isinstance(spec, dict):
+            raise ValueError("filter must be an object")
+        unknown = set(spec) - self.FILTER_KEYS
+        if unknown:
+            raise ValueError(f"Unknown filter keys: {', '.join(sorted(unknown))}")
+
+        criteria = {}
+        for key in ('min_severity', 'max_severity', 'data_source_id'):
+            if spec.get(key) is not None:
+                criteria[key] = int(spec[key])
+        criteria['start'] = parse_time_bound(spec.get('from'))
+        criteria['end'] = parse_time_bound(spec.get('to'), inclusive_day=True)
+        for key, field, allowed in (('state', 'states', ALERT_STATES), ('status', 'statuses', DELIVERY_STATUSES)):
+            values = spec.get(key)
+            if values is None:
+                continue
+            values = [values] if isinstance(values, str) else list(values)
+            invalid = [value for value in values if value not in allowed]
+            if invalid:
+                raise ValueError(f"{key} must be among {', '.join(allowed)}")
+            criteria[field] = values
+        return criteria